@@ -6,7 +6,9 @@ import json
 import time
 import random
 import logging
+import uuid
 from datetime import datetime
+import click
 from flask import Flask, render_template, request, jsonify, redirect, url_for, session
 from dotenv import load_dotenv
 
@@ -27,6 +29,11 @@ from modules.seasonal_optimization_module import SeasonalOptimizationModule
 from modules.itinerary_output_module import ItineraryOutputModule
 from modules.visualization_module import VisualizationModule
 from modules.unicode_decoder import ensure_chinese_display, safe_json_dumps
+from modules.http_client import ConnectionStats, connection_stats, request_connection_stats
+from modules.concurrency import get_executor, run_stages, get_single_flight_stats
+from modules.cache_warmer import CacheWarmer
+from modules.plan_state import get_plan_state_store
+from modules.travel_time_cache import get_travel_time_cache
 
 # 配置日志
 logging.basicConfig(
@@ -48,6 +55,14 @@ seasonal_optimization_module = SeasonalOptimizationModule()
 itinerary_output_module = ItineraryOutputModule()
 visualization_module = VisualizationModule()
 
+# plan_trip中相互独立阶段的有界线程池和每个阶段的截止时间（秒）
+plan_stage_executor = get_executor('plan_stages', int(os.getenv('PLAN_STAGE_WORKERS', 12)))
+PLAN_STAGE_DEADLINES = {
+    'spots': float(os.getenv('PLAN_STAGE_DEADLINE_SPOTS', 25)),
+    'weather': float(os.getenv('PLAN_STAGE_DEADLINE_WEATHER', 12)),
+    'city_info': float(os.getenv('PLAN_STAGE_DEADLINE_CITY_INFO', 12))
+}
+
 @app.route('/')
 def index():
     """首页路由"""
@@ -201,6 +216,9 @@ def generate_mock_itinerary(city, days, preferences):
 @app.route('/plan_trip', methods=['POST'])  # 添加别名路由，保持兼容性
 def plan_trip():
     """行程规划API - 增强版"""
+    # 本次请求单独的连接统计，用于计算复用连接节省的握手时间，不受并发请求影响
+    request_http_stats = ConnectionStats()
+    request_http_stats_token = request_connection_stats.set(request_http_stats)
     try:
         # 1. 获取请求数据 - 增强的JSON处理
         data = None
@@ -285,6 +303,19 @@ def plan_trip():
         
         logger.info(f"处理后的用户输入数据: {user_input_data}")
         
+        # 可选的规划随机种子，指定后相同请求得到相同的行程
+        plan_seed = data.get('seed')
+        if plan_seed in (None, ''):
+            plan_seed = None
+        else:
+            try:
+                plan_seed = int(plan_seed)
+            except (TypeError, ValueError):
+                return jsonify({
+                    'success': False,
+                    'message': "seed必须是整数"
+                }), 400
+        
         # 3. 处理用户输入，标准化城市名称
         parsed_input = user_input_module.process_input(
             user_input_data['province'],
@@ -299,52 +330,20 @@ def plan_trip():
         if not city_name:
             raise ValueError("无法识别目标城市")
         
-        logger.info(f"开始为城市 {city_name} 获取景点数据")
-        
-        # 获取景点数据 - 多级尝试策略
-        spot_data = []
-        
-        # 策略1: 使用scenic_spot_module获取景点
-        try:
-            spot_data = scenic_spot_module.get_spots_by_city(city_name)
-            logger.info(f"策略1: 从scenic_spot_module获取到{len(spot_data)}个景点")
-        except Exception as e:
-            logger.error(f"策略1失败: {e}")
-        
-        # 策略2: 如果景点不足，使用api_integration直接获取
-        if len(spot_data) < 5:
-            try:
-                spot_data = api_integration.get_scenic_spots(city_name)
-                logger.info(f"策略2: 从api_integration获取到{len(spot_data)}个景点")
-            except Exception as e:
-                logger.error(f"策略2失败: {e}")
-        
-        # 策略3: 如果仍不足，使用LLM获取景点信息
-        if len(spot_data) < 5:
-            try:
-                logger.info(f"策略3: 使用LLM生成{city_name}的景点信息")
-                # 直接调用LLM获取景点信息
-                prompt = f"请列出{city_name}的主要旅游景点，至少15个。" \
-                         f"每个景点需要包含：名称(name)、类型(type)、地址(address)、" \
-                         f"经纬度(location格式为'经度,纬度')、评分(rating)、" \
-                         f"推荐游玩时长(visit_duration)、简介(description)。" \
-                         f"请以JSON数组格式返回，确保数据真实准确。"
-                
-                llm_response = api_integration.call_deepseek_api(prompt, max_tokens=2000)
-                if llm_response and 'choices' in llm_response:
-                    content = llm_response['choices'][0]['message']['content']
-                    # 提取JSON部分
-                    if '[' in content and ']' in content:
-                        json_str = content[content.find('['):content.rfind(']')+1]
-                        spot_data = json.loads(json_str)
-                        logger.info(f"策略3成功: 获取到{len(spot_data)}个景点")
-            except Exception as e:
-                logger.error(f"策略3失败: {e}")
+        # 景点获取、天气和城市信息互不依赖，在有界线程池中并发执行
+        stage_results, stage_timings = run_stages(plan_stage_executor, {
+            'spots': (lambda: acquire_spot_data(city_name), PLAN_STAGE_DEADLINES['spots'], []),
+            'weather': (lambda: api_integration.get_weather(city_name), PLAN_STAGE_DEADLINES['weather'], None),
+            'city_info': (lambda: api_integration.get_city_info(city_name), PLAN_STAGE_DEADLINES['city_info'], None)
+        })
+        for stage_name, timing in stage_timings.items():
+            if timing['status'] != 'ok':
+                logger.warning(f"阶段{stage_name}未成功完成: {timing}")
         
-        # 策略4: 使用默认模拟数据
+        spot_data = stage_results['spots']
         if len(spot_data) < 5:
             spot_data = get_default_spot_data(city_name)
-            logger.info(f"策略4: 使用默认模拟数据，获取到{len(spot_data)}个景点")
+            logger.info(f"景点获取阶段未返回足够数据，使用默认模拟数据，获取到{len(spot_data)}个景点")
         
         # 验证景点数据质量
         if not spot_data:
@@ -426,7 +425,7 @@ def plan_trip():
         
         # 根据是否有足够景点选择不同的规划策略
         if hasattr(route_planner, 'plan_route'):
-            daily_plans = route_planner.plan_route(optimized_spots, days, preferences)
+            daily_plans = route_planner.plan_route(optimized_spots, days, preferences, seed=plan_seed, city=city_name)
         else:
             daily_plans = route_planning_module.generate_route(
                 optimized_spots,
@@ -435,14 +434,17 @@ def plan_trip():
             )
         
         logger.info(f"生成的每日行程数量: {len(daily_plans) if isinstance(daily_plans, list) else 0}")
+        # 按时间预算规划时的迭代次数和改进幅度
+        planning_report = getattr(route_planner, 'last_planning_report', None)
         
-        # 9. 获取天气信息
-        weather_info = None
-        try:
-            weather_info = api_integration.get_weather(city_name)
-            logger.info("成功获取天气信息")
-        except Exception as e:
-            logger.warning(f"获取天气信息失败: {e}")
+        # 保存规划状态，供后续编辑时增量重新规划
+        itinerary_id = None
+        if hasattr(route_planner, 'create_plan_state') and daily_plans:
+            itinerary_id = uuid.uuid4().hex
+            get_plan_state_store().put(itinerary_id, route_planner.create_plan_state(daily_plans))
+        
+        # 9. 天气信息已在并发阶段获取
+        weather_info = stage_results['weather']
         
         # 10. 生成详细行程信息
         daily_itineraries = []
@@ -476,19 +478,17 @@ def plan_trip():
             }
         }
         
-        # 13. 获取额外城市信息
-        try:
-            city_info = api_integration.get_city_info(city_name)
-            itinerary_data['city_info'] = city_info
-            logger.info("成功获取城市信息")
-        except Exception as e:
-            logger.warning(f"获取城市信息失败: {e}")
+        # 13. 额外城市信息已在并发阶段获取
+        if stage_results['city_info'] is not None:
+            itinerary_data['city_info'] = stage_results['city_info']
         
         # 14. 计算路线统计信息
+        route_optimization = None
         try:
             if hasattr(route_planner, 'calculate_route_statistics'):
                 stats = route_planner.calculate_route_statistics(daily_plans)
                 itinerary_data['route_statistics'] = stats
+                route_optimization = stats.get('route_optimization')
                 logger.info("成功计算路线统计信息")
         except Exception as e:
             logger.warning(f"计算路线统计信息失败: {e}")
@@ -511,8 +511,18 @@ def plan_trip():
         result = {
             'success': True,
             'message': f"成功为{city_name}生成{days}天行程规划",
+            'itinerary_id': itinerary_id,
             'itinerary_data': ensure_chinese_display(itinerary_data),
-            'input_data': ensure_chinese_display(user_input_data)
+            'input_data': ensure_chinese_display(user_input_data),
+            'metadata': {
+                'stage_timings': stage_timings,
+                'single_flight': get_single_flight_stats(),
+                'spot_refresh': scenic_spot_module.get_refresh_stats(),
+                'route_optimization': route_optimization,
+                'planning': planning_report,
+                'http_pool': ConnectionStats.summarize(request_http_stats.snapshot(),
+                                                       reference=connection_stats.snapshot())
+            }
         }
         
         logger.info("行程规划完成，准备返回结果")
@@ -529,6 +539,40 @@ def plan_trip():
             'success': False,
             'message': f"行程规划失败: {str(e)}"
         }), 500
+    finally:
+        request_connection_stats.reset(request_http_stats_token)
+
+@app.route('/api/itinerary/<itinerary_id>/replan', methods=['POST'])
+def replan_itinerary(itinerary_id):
+    """按编辑列表增量重新规划已生成的行程API，只返回有变化的天"""
+    state = get_plan_state_store().get(itinerary_id)
+    if state is None:
+        return jsonify({'success': False, 'message': "行程不存在或已过期，请重新规划"}), 404
+    
+    data = request.get_json(silent=True) or {}
+    edits = data.get('edits')
+    if not isinstance(edits, list) or not edits:
+        return jsonify({'success': False, 'message': "请提供编辑列表edits"}), 400
+    
+    try:
+        daily_plans, changed_days = route_planning_module.replan(state, edits)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"增量重新规划失败: {str(e)}")
+        return jsonify({'success': False, 'message': "重新规划失败"}), 500
+    
+    result = {
+        'success': True,
+        'itinerary_id': itinerary_id,
+        'changed_days': changed_days,
+        'daily_plans': daily_plans
+    }
+    return app.response_class(
+        response=safe_json_dumps(ensure_chinese_display(result)),
+        status=200,
+        mimetype='application/json'
+    )
 
 @app.route('/result')
 def show_result():
@@ -588,6 +632,23 @@ def city_suggestions():
         logger.error(f"城市建议API错误: {str(e)}")
         return jsonify({'suggestions': []})
 
+@app.route('/api/nearby-spots')
+def nearby_spots():
+    """获取指定坐标附近景点API，优先使用本地空间索引"""
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    if lat is None or lng is None:
+        return jsonify({'error': '缺少lat或lng参数', 'spots': []}), 400
+    
+    radius = request.args.get('radius', 5000, type=int)
+    limit = request.args.get('limit', 10, type=int)
+    try:
+        spots = scenic_spot_module.get_nearby_spots(lat, lng, radius, limit)
+        return jsonify({'spots': spots})
+    except Exception as e:
+        logger.error(f"附近景点API错误: {str(e)}")
+        return jsonify({'spots': []})
+
 @app.route('/api/map-data/<city>')
 def get_map_data(city):
     """获取地图数据API"""
@@ -613,6 +674,57 @@ def help_page():
     return render_template('help.html')
 
 # 辅助函数
+def acquire_spot_data(city_name):
+    """按多级策略获取城市景点数据，作为plan_trip的独立阶段执行"""
+    logger.info(f"开始为城市 {city_name} 获取景点数据")
+    
+    # 获取景点数据 - 多级尝试策略
+    spot_data = []
+    
+    # 策略1: 使用scenic_spot_module获取景点
+    try:
+        spot_data = scenic_spot_module.get_spots_by_city(city_name)
+        logger.info(f"策略1: 从scenic_spot_module获取到{len(spot_data)}个景点")
+    except Exception as e:
+        logger.error(f"策略1失败: {e}")
+    
+    # 策略2: 如果景点不足，使用api_integration直接获取
+    if len(spot_data) < 5:
+        try:
+            spot_data = api_integration.get_scenic_spots(city_name)
+            logger.info(f"策略2: 从api_integration获取到{len(spot_data)}个景点")
+        except Exception as e:
+            logger.error(f"策略2失败: {e}")
+    
+    # 策略3: 如果仍不足，使用LLM获取景点信息
+    if len(spot_data) < 5:
+        try:
+            logger.info(f"策略3: 使用LLM生成{city_name}的景点信息")
+            # 直接调用LLM获取景点信息
+            prompt = f"请列出{city_name}的主要旅游景点，至少15个。" \
+                     f"每个景点需要包含：名称(name)、类型(type)、地址(address)、" \
+                     f"经纬度(location格式为'经度,纬度')、评分(rating)、" \
+                     f"推荐游玩时长(visit_duration)、简介(description)。" \
+                     f"请以JSON数组格式返回，确保数据真实准确。"
+            
+            llm_response = api_integration.call_deepseek_api(prompt, max_tokens=2000)
+            if llm_response and 'choices' in llm_response:
+                content = llm_response['choices'][0]['message']['content']
+                # 提取JSON部分
+                if '[' in content and ']' in content:
+                    json_str = content[content.find('['):content.rfind(']')+1]
+                    spot_data = json.loads(json_str)
+                    logger.info(f"策略3成功: 获取到{len(spot_data)}个景点")
+        except Exception as e:
+            logger.error(f"策略3失败: {e}")
+    
+    # 策略4: 使用默认模拟数据
+    if len(spot_data) < 5:
+        spot_data = get_default_spot_data(city_name)
+        logger.info(f"策略4: 使用默认模拟数据，获取到{len(spot_data)}个景点")
+    
+    return spot_data
+
 def get_default_spot_data(city_name):
     """获取默认模拟景点数据"""
     # 基于城市名称生成一些模拟景点
@@ -1922,126 +2034,128 @@ def get_default_spot_data(city_name):
     
     return mock_spots
 
+# 中国省会城市和主要旅游城市坐标数据库
+CITY_COORDINATES = {
+    # 直辖市
+    '北京市': (116.3974, 39.9093),
+    '上海市': (121.4737, 31.2304),
+    '天津市': (117.2010, 39.0842),
+    '重庆市': (106.5349, 29.5630),
+    
+    # 省会城市
+    '石家庄市': (114.5149, 38.0423),  # 河北
+    '太原市': (112.5573, 37.8706),    # 山西
+    '呼和浩特市': (111.7519, 40.8414), # 内蒙古
+    '沈阳市': (123.4332, 41.8043),    # 辽宁
+    '长春市': (125.3245, 43.8868),    # 吉林
+    '哈尔滨市': (126.6424, 45.7567),  # 黑龙江
+    '南京市': (118.7674, 32.0415),    # 江苏
+    '杭州市': (120.1551, 30.2741),    # 浙江
+    '合肥市': (117.2272, 31.8206),    # 安徽
+    '福州市': (119.3062, 26.0745),    # 福建
+    '南昌市': (115.8642, 28.6894),    # 江西
+    '济南市': (117.0009, 36.6758),    # 山东
+    '郑州市': (113.6253, 34.7466),    # 河南
+    '武汉市': (114.3055, 30.5928),    # 湖北
+    '长沙市': (112.9822, 28.1941),    # 湖南
+    '广州市': (113.2644, 23.1291),    # 广东
+    '南宁市': (108.3200, 22.8170),    # 广西
+    '海口市': (110.3312, 20.0319),    # 海南
+    '成都市': (104.0665, 30.5728),    # 四川
+    '贵阳市': (106.7097, 26.5994),    # 贵州
+    '昆明市': (102.7122, 25.0453),    # 云南
+    '拉萨市': (91.1142, 29.6500),     # 西藏
+    '西安市': (108.9480, 34.3416),    # 陕西
+    '兰州市': (103.8236, 36.0581),    # 甘肃
+    '西宁市': (101.7779, 36.6233),    # 青海
+    '银川市': (106.2586, 38.4680),    # 宁夏
+    '乌鲁木齐市': (87.6177, 43.7928), # 新疆
+    
+    # 特别行政区
+    '香港特别行政区': (114.1095, 22.3964),
+    '澳门特别行政区': (113.5430, 22.1868),
+    '台北市': (121.5244, 25.0481),    # 台湾
+    
+    # 主要旅游城市
+    '苏州市': (120.5853, 31.2989),
+    '无锡市': (120.3019, 31.5733),
+    '深圳市': (114.0579, 22.5431),
+    '珠海市': (113.5769, 22.2707),
+    '厦门市': (118.1104, 24.4905),
+    '大连市': (121.6147, 38.9140),
+    '青岛市': (120.3826, 36.0670),
+    '烟台市': (121.4479, 37.4638),
+    '威海市': (122.1201, 37.5127),
+    '三亚市': (109.5119, 18.2529),
+    '桂林市': (110.2993, 25.2342),
+    '北海市': (109.1195, 21.4735),
+    '丽江市': (100.2326, 26.8637),
+    '大理市': (100.2519, 25.6023),
+    '西双版纳': (100.7969, 22.0015),
+    '九寨沟县': (103.9188, 33.1917),
+    '张家界市': (110.4790, 29.1239),
+    '凤凰县': (109.5904, 27.9506),
+    '厦门市': (118.1104, 24.4905),
+    '武夷山市': (117.9916, 27.7519),
+    '三亚市': (109.5119, 18.2529),
+    '五指山市': (109.5168, 18.7750),
+    '琼海市': (110.4666, 19.2469),
+    '阿坝州': (102.2210, 31.9001),
+    '甘孜州': (101.9634, 30.0499),
+    '凉山州': (102.2583, 27.8861),
+    '呼伦贝尔市': (119.7655, 49.2117),
+    '阿尔山市': (119.9434, 47.1776),
+    '满洲里市': (117.3786, 49.5976),
+    '二连浩特市': (111.9844, 43.6520),
+    '腾冲市': (98.4546, 25.3107),
+    '香格里拉市': (99.7083, 27.8284),
+    '瑞丽市': (97.8550, 24.0154),
+    '景洪市': (100.7969, 22.0015),
+    '个旧市': (103.1526, 23.3617),
+    '芒市': (98.5903, 24.4107),
+    '文山市': (104.2442, 23.3695),
+    '普者黑': (104.0889, 24.1085),
+    '弥勒市': (103.2628, 24.4127),
+    '建水县': (102.8277, 23.6106),
+    '元阳县': (102.8354, 23.1600),
+    '哈尼梯田': (102.8477, 23.1379),
+    '梅里雪山': (98.8774, 28.4476),
+    '泸沽湖': (100.7733, 27.6914),
+    '西昌市': (102.2596, 27.8924),
+    '稻城县': (100.2964, 29.0376),
+    '康定市': (101.9615, 30.0503),
+    '理塘县': (100.2681, 29.9963),
+    '亚丁村': (100.3604, 28.9571),
+    '丹巴县': (101.8933, 30.8795),
+    '四姑娘山': (102.8347, 31.8949),
+    '毕节市': (105.2850, 27.3017),
+    '安顺市': (105.9472, 26.2452),
+    '荔波县': (107.8752, 25.2944),
+    '镇远县': (108.4249, 27.0506),
+    '肇兴侗寨': (109.1636, 25.8402),
+    '西江千户苗寨': (108.0834, 26.5786),
+    '荔浦市': (110.3988, 24.4733),
+    '阳朔县': (110.4747, 24.7769),
+    '龙脊梯田': (109.9925, 25.7786),
+    '涠洲岛': (109.1205, 21.0486),
+    '德天瀑布': (106.7581, 22.8671),
+    '通灵大峡谷': (106.6204, 22.9363),
+    '北海市': (109.1195, 21.4735),
+    '防城港市': (108.3533, 21.6178),
+    '钦州市': (108.6244, 21.9613),
+    '玉林市': (110.1828, 22.6432),
+    '百色市': (106.6168, 23.9007),
+    '崇左市': (107.3539, 22.4154),
+    '贺州市': (111.5661, 24.7017),
+    '河池市': (108.0622, 24.6929),
+    '来宾市': (109.1746, 23.7340),
+    '贵港市': (109.5989, 23.1073),
+    '梧州市': (111.3059, 23.4786)
+}
+
 def get_default_city_coordinates(city_name):
     """获取默认城市坐标"""
-    # 中国省会城市和主要旅游城市坐标数据库
-    city_coordinates = {
-        # 直辖市
-        '北京市': (116.3974, 39.9093),
-        '上海市': (121.4737, 31.2304),
-        '天津市': (117.2010, 39.0842),
-        '重庆市': (106.5349, 29.5630),
-        
-        # 省会城市
-        '石家庄市': (114.5149, 38.0423),  # 河北
-        '太原市': (112.5573, 37.8706),    # 山西
-        '呼和浩特市': (111.7519, 40.8414), # 内蒙古
-        '沈阳市': (123.4332, 41.8043),    # 辽宁
-        '长春市': (125.3245, 43.8868),    # 吉林
-        '哈尔滨市': (126.6424, 45.7567),  # 黑龙江
-        '南京市': (118.7674, 32.0415),    # 江苏
-        '杭州市': (120.1551, 30.2741),    # 浙江
-        '合肥市': (117.2272, 31.8206),    # 安徽
-        '福州市': (119.3062, 26.0745),    # 福建
-        '南昌市': (115.8642, 28.6894),    # 江西
-        '济南市': (117.0009, 36.6758),    # 山东
-        '郑州市': (113.6253, 34.7466),    # 河南
-        '武汉市': (114.3055, 30.5928),    # 湖北
-        '长沙市': (112.9822, 28.1941),    # 湖南
-        '广州市': (113.2644, 23.1291),    # 广东
-        '南宁市': (108.3200, 22.8170),    # 广西
-        '海口市': (110.3312, 20.0319),    # 海南
-        '成都市': (104.0665, 30.5728),    # 四川
-        '贵阳市': (106.7097, 26.5994),    # 贵州
-        '昆明市': (102.7122, 25.0453),    # 云南
-        '拉萨市': (91.1142, 29.6500),     # 西藏
-        '西安市': (108.9480, 34.3416),    # 陕西
-        '兰州市': (103.8236, 36.0581),    # 甘肃
-        '西宁市': (101.7779, 36.6233),    # 青海
-        '银川市': (106.2586, 38.4680),    # 宁夏
-        '乌鲁木齐市': (87.6177, 43.7928), # 新疆
-        
-        # 特别行政区
-        '香港特别行政区': (114.1095, 22.3964),
-        '澳门特别行政区': (113.5430, 22.1868),
-        '台北市': (121.5244, 25.0481),    # 台湾
-        
-        # 主要旅游城市
-        '苏州市': (120.5853, 31.2989),
-        '无锡市': (120.3019, 31.5733),
-        '深圳市': (114.0579, 22.5431),
-        '珠海市': (113.5769, 22.2707),
-        '厦门市': (118.1104, 24.4905),
-        '大连市': (121.6147, 38.9140),
-        '青岛市': (120.3826, 36.0670),
-        '烟台市': (121.4479, 37.4638),
-        '威海市': (122.1201, 37.5127),
-        '三亚市': (109.5119, 18.2529),
-        '桂林市': (110.2993, 25.2342),
-        '北海市': (109.1195, 21.4735),
-        '丽江市': (100.2326, 26.8637),
-        '大理市': (100.2519, 25.6023),
-        '西双版纳': (100.7969, 22.0015),
-        '九寨沟县': (103.9188, 33.1917),
-        '张家界市': (110.4790, 29.1239),
-        '凤凰县': (109.5904, 27.9506),
-        '厦门市': (118.1104, 24.4905),
-        '武夷山市': (117.9916, 27.7519),
-        '三亚市': (109.5119, 18.2529),
-        '五指山市': (109.5168, 18.7750),
-        '琼海市': (110.4666, 19.2469),
-        '阿坝州': (102.2210, 31.9001),
-        '甘孜州': (101.9634, 30.0499),
-        '凉山州': (102.2583, 27.8861),
-        '呼伦贝尔市': (119.7655, 49.2117),
-        '阿尔山市': (119.9434, 47.1776),
-        '满洲里市': (117.3786, 49.5976),
-        '二连浩特市': (111.9844, 43.6520),
-        '腾冲市': (98.4546, 25.3107),
-        '香格里拉市': (99.7083, 27.8284),
-        '瑞丽市': (97.8550, 24.0154),
-        '景洪市': (100.7969, 22.0015),
-        '个旧市': (103.1526, 23.3617),
-        '芒市': (98.5903, 24.4107),
-        '文山市': (104.2442, 23.3695),
-        '普者黑': (104.0889, 24.1085),
-        '弥勒市': (103.2628, 24.4127),
-        '建水县': (102.8277, 23.6106),
-        '元阳县': (102.8354, 23.1600),
-        '哈尼梯田': (102.8477, 23.1379),
-        '梅里雪山': (98.8774, 28.4476),
-        '泸沽湖': (100.7733, 27.6914),
-        '西昌市': (102.2596, 27.8924),
-        '稻城县': (100.2964, 29.0376),
-        '康定市': (101.9615, 30.0503),
-        '理塘县': (100.2681, 29.9963),
-        '亚丁村': (100.3604, 28.9571),
-        '丹巴县': (101.8933, 30.8795),
-        '四姑娘山': (102.8347, 31.8949),
-        '毕节市': (105.2850, 27.3017),
-        '安顺市': (105.9472, 26.2452),
-        '荔波县': (107.8752, 25.2944),
-        '镇远县': (108.4249, 27.0506),
-        '肇兴侗寨': (109.1636, 25.8402),
-        '西江千户苗寨': (108.0834, 26.5786),
-        '荔浦市': (110.3988, 24.4733),
-        '阳朔县': (110.4747, 24.7769),
-        '龙脊梯田': (109.9925, 25.7786),
-        '涠洲岛': (109.1205, 21.0486),
-        '德天瀑布': (106.7581, 22.8671),
-        '通灵大峡谷': (106.6204, 22.9363),
-        '北海市': (109.1195, 21.4735),
-        '防城港市': (108.3533, 21.6178),
-        '钦州市': (108.6244, 21.9613),
-        '玉林市': (110.1828, 22.6432),
-        '百色市': (106.6168, 23.9007),
-        '崇左市': (107.3539, 22.4154),
-        '贺州市': (111.5661, 24.7017),
-        '河池市': (108.0622, 24.6929),
-        '来宾市': (109.1746, 23.7340),
-        '贵港市': (109.5989, 23.1073),
-        '梧州市': (111.3059, 23.4786)
-    }
+    city_coordinates = CITY_COORDINATES
     
     # 城市名称别名映射
     city_aliases = {
@@ -2348,6 +2462,27 @@ def register_error_handlers(app):
             'message': '发生未处理的异常'
         }), 500
 
+# 缓存预热命令：flask --app app warm-cache [城市...]
+@app.cli.command('warm-cache')
+@click.argument('cities', nargs=-1)
+@click.option('--workers', type=int, default=None, help='并发预热的城市数')
+@click.option('--rate', type=float, default=None, help='每秒允许的上游请求数')
+@click.option('--force', is_flag=True, help='忽略进度文件，重新预热所有城市')
+def warm_cache_command(cities, workers, rate, force):
+    """预热景点、城市信息和地理编码缓存，未指定城市时预热全部内置城市"""
+    warmer = CacheWarmer(scenic_spot_module, api_integration, max_workers=workers, rate=rate,
+                         travel_times=get_travel_time_cache(api_integration))
+    report = warmer.run(list(cities) or list(CITY_COORDINATES), force=force)
+    
+    for city, entry in report['cities'].items():
+        timings = ', '.join(f"{task}={ms}ms" for task, ms in entry['timings_ms'].items())
+        click.echo(f"{city}: {entry['status']} ({timings})")
+        for task, error in entry['errors'].items():
+            click.echo(f"    {task}失败: {error}")
+    
+    click.echo(f"共{report['total']}个城市，跳过{report['skipped']}个，成功{report['completed']}个，"
+               f"失败{report['failed']}个，耗时{report['elapsed_ms'] / 1000:.1f}秒")
+
 # 应用启动入口
 if __name__ == '__main__':
     load_dotenv()  # 加载.env文件中的环境变量
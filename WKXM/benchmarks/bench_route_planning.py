@@ -0,0 +1,123 @@
+# 路线规划性能基准：逐对geodesic计算的旧实现 vs 距离矩阵+下标的新实现
+# 用法：python benchmarks/bench_route_planning.py [--sizes 20 200 2000] [--full]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.route_planning_module import RoutePlanningModule
+
+
+def make_spots(count, seed=42):
+    """
+    在大理附近随机生成景点
+    """
+    rng = random.Random(seed)
+    spots = []
+    for i in range(count):
+        lng = 100.0 + rng.random() * 0.6
+        lat = 25.4 + rng.random() * 0.6
+        spots.append({
+            'name': f'景点{i}',
+            'location': f'{lng:.6f},{lat:.6f}',
+            'rating': f'{rng.uniform(3.0, 5.0):.1f}',
+            'visit_duration': rng.choice(['约1小时', '约2小时', '约3小时']),
+            'type': rng.choice(['湖泊', '山岳', '古城', '寺庙', '博物馆'])
+        })
+    return spots
+
+
+class LegacyPlanner(RoutePlanningModule):
+    """
+    旧实现的核心循环：每次比较都重新解析坐标并调用geodesic，按字典相等过滤列表
+    """
+    def legacy_plan(self, spots, days):
+        remaining = list(spots)
+        max_per_day = min(self.spots_per_day_range[1], len(spots) // days + 1)
+        start = self._get_spot_location(max(remaining, key=lambda x: float(x.get('rating', '0'))))
+        orders = []
+        for _ in range(days):
+            if not remaining:
+                break
+            count = min(random.randint(self.spots_per_day_range[0], max_per_day), len(remaining))
+            day = self._legacy_select(remaining, count, start)
+            remaining = [spot for spot in remaining if spot not in day]
+            order = self._legacy_sort(day, start)
+            orders.append(order)
+            start = self._get_spot_location(order[-1])
+        return orders
+
+    def _legacy_select(self, spots, count, start):
+        if len(spots) <= count:
+            return spots[:count]
+        remaining = spots.copy()
+        closest = min(remaining, key=lambda x: self._calculate_distance(start, self._get_spot_location(x)))
+        selected = [closest]
+        remaining.remove(closest)
+        count -= 1
+        while count > 0 and remaining:
+            scored = []
+            for spot in remaining:
+                distance = self._calculate_distance(self._get_spot_location(selected[-1]),
+                                                    self._get_spot_location(spot))
+                score = max(0, 10 - (distance / 5) * 10) * self.geography_weight
+                score += float(spot.get('rating', '0')) * 2
+                scored.append((spot, score))
+            scored.sort(key=lambda x: x[1], reverse=True)
+            selected.append(scored[0][0])
+            remaining.remove(scored[0][0])
+            count -= 1
+        return selected
+
+    def _legacy_sort(self, spots, start):
+        remaining = spots.copy()
+        current = min(remaining, key=lambda x: self._calculate_distance(start, self._get_spot_location(x)))
+        order = [current]
+        remaining.remove(current)
+        while remaining:
+            current = min(remaining, key=lambda x: self._calculate_distance(
+                self._get_spot_location(order[-1]), self._get_spot_location(x)))
+            order.append(current)
+            remaining.remove(current)
+        return order
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='路线规划性能基准')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20, 200, 2000])
+    parser.add_argument('--full', action='store_true', help='大规模时也运行旧实现（可能需要数分钟）')
+    args = parser.parse_args()
+
+    planner = LegacyPlanner()
+    print(f"{'景点数':>8} {'天数':>6} {'旧实现(秒)':>12} {'新实现(秒)':>12} {'加速比':>8}")
+    for size in args.sizes:
+        spots = make_spots(size)
+        days = max(1, size // 3)
+
+        random.seed(0)
+        new_time = timed(lambda: planner.plan_route(spots, days))
+
+        if size <= 200 or args.full:
+            random.seed(0)
+            legacy_time = timed(lambda: planner.legacy_plan(spots, days))
+            legacy_str = f'{legacy_time:12.3f}'
+            speedup = f'{legacy_time / new_time:7.1f}x'
+        else:
+            legacy_str = f"{'跳过':>10}"
+            speedup = f"{'-':>8}"
+
+        print(f'{size:>8} {days:>6} {legacy_str} {new_time:12.3f} {speedup}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+
+from .distance_matrix import haversine_matrix
+
+
+class AccommodationSelector:
+    """
+    从酒店候选中选择住宿地点，使每天往返住宿地点的通勤距离之和最小
+
+    每天的通勤距离按住宿地点到当天景点中心往返估算；行程天数达到split_min_days时
+    允许在中途更换一次住宿，更换的额外代价按switch_penalty_km公里计
+    """
+    def __init__(self, split_min_days=None, switch_penalty_km=None):
+        self.split_min_days = split_min_days or int(os.getenv('HOTEL_SPLIT_MIN_DAYS', 5))
+        if switch_penalty_km is None:
+            switch_penalty_km = float(os.getenv('HOTEL_SWITCH_PENALTY_KM', 20))
+        self.switch_penalty_km = switch_penalty_km
+
+    def select(self, hotel_lats, hotel_lngs, centroid_lats, centroid_lngs, active_days):
+        """
+        centroid_lats、centroid_lngs为每天景点的中心坐标，active_days标记当天是否有景点
+
+        返回 (每天住宿地点在候选中的下标列表, 全程通勤距离估算（公里）)
+        """
+        active_days = np.asarray(active_days, dtype=bool)
+        days = len(active_days)
+        # commute[h, d]：住宿地点h到第d天景点中心的往返距离，没有景点的天为0
+        commute = 2 * haversine_matrix(hotel_lats, hotel_lngs, centroid_lats, centroid_lngs)
+        commute[:, ~active_days] = 0.0
+
+        totals = commute.sum(axis=1)
+        best = int(np.argmin(totals))
+        choice = ([best] * days, float(totals[best]))
+        if days < self.split_min_days:
+            return choice
+
+        # 第split天起更换住宿：前后两段分别取通勤距离最小的住宿地点
+        prefix = np.cumsum(commute, axis=1)
+        for split in range(1, days):
+            before = prefix[:, split - 1]
+            after = totals - before
+            first, second = int(np.argmin(before)), int(np.argmin(after))
+            cost = float(before[first] + after[second])
+            if first != second:
+                cost += self.switch_penalty_km
+            if cost < choice[1]:
+                choice = ([first] * split + [second] * (days - split), cost)
+        return choice
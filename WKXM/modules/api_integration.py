@@ -1,57 +1,163 @@
-import requests
+import copy
 import os
 import json
 from datetime import datetime
+from .http_client import get_http_client
+from .concurrency import get_single_flight
+from .response_cache import ResponseCache, get_response_cache
+from .user_input_module import normalize_city_name
+from .city_adcode_table import lookup_adcode
 
 class APIIntegration:
     def __init__(self):
         # 从环境变量加载API密钥
         self.deepseek_api_key = os.getenv('DEEPSEEK_API_KEY')
         self.deepseek_api_url = os.getenv('DEEPSEEK_API_URL', 'https://api.deepseek.com/v1')
+        self.deepseek_model = os.getenv('DEEPSEEK_MODEL', 'deepseek-chat')
         self.amap_api_key = os.getenv('AMAP_API_KEY')
         self.amap_api_url = os.getenv('AMAP_API_URL', 'https://restapi.amap.com/v3')
         self.aliyun_api_key = os.getenv('ALIYUN_API_KEY')
         self.aliyun_appcode = os.getenv('ALIYUN_APPCODE')
         self.baidu_map_api_key = os.getenv('BAIDU_MAP_API_KEY')
+        self.aliyun_weather_url = os.getenv('ALIYUN_WEATHER_URL', 'https://api.aliyun.com/api/weather')
         
         # 设置请求超时
         self.timeout = 10
+        
+        # 进程级共享的LLM响应缓存，各调用点使用各自的有效期（秒）
+        self.llm_cache = get_response_cache('llm')
+        self.llm_cache_ttls = {
+            'city_info': 7 * 86400,
+            'travel_tips': 3 * 86400,
+            'local_food': 30 * 86400,
+            'spots': 7 * 86400,
+            'spot_details': 7 * 86400
+        }
+        
+        # 地理编码持久化缓存，地址坐标很少变化，使用较长的有效期
+        self.geocode_cache = get_response_cache('geocode')
+        self.geocode_cache_ttl = 90 * 86400
+        
+        # 酒店搜索结果缓存，供路线规划选择住宿地点时反复使用
+        self.hotel_cache = get_response_cache('hotels')
+        self.hotel_cache_ttl = 86400
+        
+        # 进程级共享的并发调用合并分组
+        self.llm_flight = get_single_flight('deepseek')
+        self.poi_flight = get_single_flight('amap_poi')
+        self.geocode_flight = get_single_flight('amap_geocode')
+        
+        # 进程级共享的HTTP客户端，为每个上游主机注册长连接池
+        self.http = get_http_client()
+        self.http.register_host(self.amap_api_url, self._pool_size('HTTP_POOL_MAXSIZE_AMAP'))
+        self.http.register_host(self.deepseek_api_url, self._pool_size('HTTP_POOL_MAXSIZE_DEEPSEEK'))
+        self.http.register_host(self.aliyun_weather_url, self._pool_size('HTTP_POOL_MAXSIZE_ALIYUN'))
     
-    def call_deepseek_api(self, prompt, max_tokens=1000, temperature=0.7):
+    def _pool_size(self, env_name):
+        """
+        读取单个上游主机的连接池大小配置，未配置时使用全局默认值
+        """
+        value = os.getenv(env_name)
+        return int(value) if value else None
+    
+    def call_deepseek_api(self, prompt, max_tokens=1000, temperature=0.7, cache_ttl=None, parse=None):
         """
         调用DeepSeek API进行智能问答
+        cache_ttl: 响应缓存有效期（秒），为None时不使用缓存
+        parse: 调用方解析响应内容的函数，传入时只缓存能被它成功解析的响应
         """
         if not self.deepseek_api_key:
             raise ValueError("DeepSeek API密钥未配置")
         
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.deepseek_api_key}'
-        }
+        cache_key = self._llm_cache_key(prompt, max_tokens, temperature)
+        if cache_ttl:
+            cached = self.llm_cache.get(cache_key)
+            if cached is not None:
+                return cached
         
-        payload = {
-            'model': 'deepseek-chat',
-            'messages': [
-                {'role': 'system', 'content': '你是一个智能旅游助手，专注于提供准确的旅游信息。'},                {'role': 'user', 'content': prompt}
-            ],
-            'max_tokens': max_tokens,
-            'temperature': temperature
-        }
+        # 相同请求同时进行时只发起一次上游调用，其余调用共享结果
+        return self.llm_flight.do(cache_key, lambda: self._request_deepseek(
+            prompt, max_tokens, temperature, cache_key if cache_ttl else None, cache_ttl, parse
+        ))
+    
+    def _request_deepseek(self, prompt, max_tokens, temperature, cache_key, cache_ttl, parse=None):
+        """
+        实际请求DeepSeek API，成功的响应按cache_ttl写入缓存
+        """
+        headers, payload = self._build_deepseek_request(prompt, max_tokens, temperature)
         
         try:
-            response = requests.post(
+            response = self.http.post(
                 f'{self.deepseek_api_url}/chat/completions',
                 headers=headers,
                 data=json.dumps(payload),
                 timeout=self.timeout
             )
             response.raise_for_status()
-            return response.json()
+            result = response.json()
+            # 只缓存成功且调用方能解析的响应
+            if cache_key and self._is_cacheable_llm_response(result, parse):
+                self.llm_cache.set(cache_key, result, cache_ttl)
+            return result
         except Exception as e:
             print(f"DeepSeek API调用失败: {e}")
             # 返回默认响应或错误信息
             return {"error": str(e)}
     
+    @staticmethod
+    def _is_cacheable_llm_response(result, parse):
+        if 'choices' not in result:
+            return False
+        if parse is None:
+            return True
+        try:
+            parse(result)
+            return True
+        except Exception:
+            return False
+    
+    @staticmethod
+    def parse_llm_json(result, array=False):
+        """
+        解析LLM响应中的JSON内容，array为True时只取第一个'['到最后一个']'之间的部分；
+        响应无效或内容无法解析时抛出ValueError
+        """
+        if not result.get('choices'):
+            raise ValueError(result.get('error', 'LLM响应为空'))
+        content = result['choices'][0]['message']['content']
+        if array:
+            if '[' not in content or ']' not in content:
+                raise ValueError('LLM响应中没有JSON数组')
+            content = content[content.find('['):content.rfind(']')+1]
+        return json.loads(content)
+    
+    def _llm_cache_key(self, prompt, max_tokens, temperature):
+        """
+        LLM响应缓存键：规范化后的提示词、模型、max_tokens和temperature
+        """
+        normalized_prompt = ' '.join(prompt.split())
+        return ResponseCache.make_key(normalized_prompt, self.deepseek_model, max_tokens, temperature)
+    
+    def _build_deepseek_request(self, prompt, max_tokens, temperature):
+        """
+        构造DeepSeek请求头和请求体，同步和异步版本共用
+        """
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.deepseek_api_key}'
+        }
+        
+        payload = {
+            'model': self.deepseek_model,
+            'messages': [
+                {'role': 'system', 'content': '你是一个智能旅游助手，专注于提供准确的旅游信息。'},
+                {'role': 'user', 'content': prompt}
+            ],
+            'max_tokens': max_tokens,
+            'temperature': temperature
+        }
+        return headers, payload
+    
     def get_amap_geocode(self, address):
         """
         使用高德地图API进行地理编码
@@ -65,12 +171,38 @@ class APIIntegration:
             'address': address
         }
         
+        cache_key = self._geocode_cache_key(address)
+        cached = self.geocode_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        return self.geocode_flight.do(cache_key, lambda: self._fetch_geocode(url, params, cache_key))
+    
+    def _geocode_cache_key(self, address):
+        """
+        地理编码缓存键：去除多余空白后的地址
+        """
+        return ResponseCache.make_key('geocode', ''.join(address.split()))
+    
+    def _fetch_geocode(self, url, params, cache_key):
+        """
+        请求地理编码接口，只缓存成功且有结果的响应
+        """
+        result = self._get_json(url, params, "高德地图地理编码失败")
+        if result.get('status') == '1' and result.get('geocodes'):
+            self.geocode_cache.set(cache_key, result, self.geocode_cache_ttl)
+        return result
+    
+    def _get_json(self, url, params, error_message, headers=None):
+        """
+        发送GET请求并解析JSON，失败时打印错误并返回包含error的字典
+        """
         try:
-            response = requests.get(url, params=params, timeout=self.timeout)
+            response = self.http.get(url, headers=headers, params=params, timeout=self.timeout)
             response.raise_for_status()
             return response.json()
         except Exception as e:
-            print(f"高德地图地理编码失败: {e}")
+            print(f"{error_message}: {e}")
             return {"error": str(e)}
     
     def get_amap_poi(self, keywords, city, types='110100', offset=20):
@@ -93,7 +225,7 @@ class APIIntegration:
         }
         
         try:
-            response = requests.get(url, params=params, timeout=self.timeout)
+            response = self.http.get(url, params=params, timeout=self.timeout)
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -108,10 +240,7 @@ class APIIntegration:
         if not self.amap_api_key:
             raise ValueError("高德地图API密钥未配置")
         
-        url = f'{self.amap_api_url}/direction/driving' if mode == 'driving' else \
-              f'{self.amap_api_url}/direction/walking' if mode == 'walking' else \
-              f'{self.amap_api_url}/direction/transit/integrated' if mode == 'transit' else \
-              f'{self.amap_api_url}/direction/riding'
+        url = self._get_amap_route_url(mode)
         
         params = {
             'key': self.amap_api_key,
@@ -124,13 +253,22 @@ class APIIntegration:
             params['city'] = origin.split(',')[0]  # 简单处理，实际应该从城市名称获取
         
         try:
-            response = requests.get(url, params=params, timeout=self.timeout)
+            response = self.http.get(url, params=params, timeout=self.timeout)
             response.raise_for_status()
             return response.json()
         except Exception as e:
             print(f"高德地图路线规划失败: {e}")
             return {"error": str(e)}
     
+    def _get_amap_route_url(self, mode):
+        """
+        根据出行方式获取高德路线规划接口地址
+        """
+        return f'{self.amap_api_url}/direction/driving' if mode == 'driving' else \
+               f'{self.amap_api_url}/direction/walking' if mode == 'walking' else \
+               f'{self.amap_api_url}/direction/transit/integrated' if mode == 'transit' else \
+               f'{self.amap_api_url}/direction/riding'
+    
     def get_weather(self, city):
         """
         使用阿里云天气API获取城市天气
@@ -138,7 +276,7 @@ class APIIntegration:
         if not self.aliyun_appcode:
             raise ValueError("阿里云AppCode未配置")
         
-        url = 'https://api.aliyun.com/api/weather'
+        url = self.aliyun_weather_url
         headers = {
             'Authorization': f'APPCODE {self.aliyun_appcode}'
         }
@@ -148,7 +286,7 @@ class APIIntegration:
         }
         
         try:
-            response = requests.get(url, headers=headers, params=params, timeout=self.timeout)
+            response = self.http.get(url, headers=headers, params=params, timeout=self.timeout)
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -171,7 +309,7 @@ class APIIntegration:
         }
         
         try:
-            response = requests.get(url, params=params, timeout=self.timeout)
+            response = self.http.get(url, params=params, timeout=self.timeout)
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -182,7 +320,12 @@ class APIIntegration:
         """
         获取城市的行政区划代码
         """
-        # 这里使用地理编码API间接获取城市代码
+        # 已知城市直接查内置代码表，无需网络请求
+        adcode = lookup_adcode(city_name)
+        if adcode:
+            return adcode
+        
+        # 未收录的城市使用地理编码API间接获取城市代码
         geocode_result = self.get_amap_geocode(city_name)
         if 'geocodes' in geocode_result and geocode_result['geocodes']:
             return geocode_result['geocodes'][0].get('adcode', '')
@@ -190,44 +333,62 @@ class APIIntegration:
     
     def get_scenic_spots(self, city_name):
         """
-        获取指定城市的景点列表
+        获取指定城市的景点列表，同一城市的并发调用只请求一次上游，每个调用方得到各自的深拷贝
+        """
+        return copy.deepcopy(self.poi_flight.do(city_name, lambda: self._fetch_scenic_spots(city_name)))
+    
+    def _fetch_scenic_spots(self, city_name):
+        """
+        从高德POI获取景点，失败时使用LLM
         """
         # 先尝试使用高德地图POI API
         poi_result = self.get_amap_poi('景点', city_name, '110100', 50)
         
         if 'pois' in poi_result:
-            spots = []
-            for poi in poi_result['pois']:
-                spot = {
-                    'name': poi.get('name'),
-                    'type': poi.get('type'),
-                    'address': poi.get('address'),
-                    'location': poi.get('location'),  # lng,lat
-                    'city': poi.get('cityname'),
-                    'adname': poi.get('adname'),  # 行政区域名称
-                    'distance': poi.get('distance'),
-                    'biz_ext': poi.get('biz_ext', {})  # 包含评分等信息
-                }
-                spots.append(spot)
-            return spots
+            return [self._poi_to_spot(poi) for poi in poi_result['pois']]
         
         # 如果高德API调用失败，尝试使用DeepSeek API获取信息
         return self._get_spots_from_llm(city_name)
     
+    def _poi_to_spot(self, poi):
+        """
+        将高德POI转换为景点字典
+        """
+        return {
+            'name': poi.get('name'),
+            'type': poi.get('type'),
+            'address': poi.get('address'),
+            'location': poi.get('location'),  # lng,lat
+            'city': poi.get('cityname'),
+            'adname': poi.get('adname'),  # 行政区域名称
+            'distance': poi.get('distance'),
+            'biz_ext': poi.get('biz_ext', {})  # 包含评分等信息
+        }
+    
+    def _build_spots_prompt(self, city_name):
+        """
+        构造获取城市景点列表的提示词
+        """
+        return f"请列出{city_name}的主要旅游景点，每个景点需要包含：名称、类型、地址、简要介绍。" \
+               f"请以JSON格式返回，字段名：name, type, address, description。最多返回10个景点。"
+    
+    def _build_city_info_prompt(self, city_name):
+        """
+        构造获取城市综合信息的提示词
+        """
+        return f"请提供{city_name}的综合信息，包括：地理位置、气候特点、旅游季节建议、文化特色、主要景点分布区域、交通概况。" \
+               f"请以JSON格式返回，字段名：location, climate, best_season, cultural_features, scenic_areas, transportation。"
+    
     def _get_spots_from_llm(self, city_name):
         """
         使用LLM获取城市景点信息作为备选方案
         """
-        prompt = f"请列出{city_name}的主要旅游景点，每个景点需要包含：名称、类型、地址、简要介绍。" \
-                f"请以JSON格式返回，字段名：name, type, address, description。最多返回10个景点。"
+        prompt = self._build_spots_prompt(normalize_city_name(city_name))
         
         try:
-            llm_result = self.call_deepseek_api(prompt)
-            if 'choices' in llm_result and llm_result['choices']:
-                content = llm_result['choices'][0]['message']['content']
-                # 尝试解析JSON
-                spots_data = json.loads(content)
-                return spots_data
+            llm_result = self.call_deepseek_api(prompt, cache_ttl=self.llm_cache_ttls['spots'],
+                                                parse=self.parse_llm_json)
+            return self.parse_llm_json(llm_result)
         except Exception as e:
             print(f"LLM获取景点信息失败: {e}")
         
@@ -237,14 +398,12 @@ class APIIntegration:
         """
         获取城市特色美食信息
         """
-        prompt = f"请列出{city_name}的特色美食，每个美食需要包含：名称、简介、推荐餐厅。" \
-                f"请以JSON格式返回，字段名：name, description, recommended_restaurants。最多返回10种美食。"
+        prompt = self._build_local_food_prompt(normalize_city_name(city_name))
         
         try:
-            result = self.call_deepseek_api(prompt, max_tokens=1500)
-            if 'choices' in result and result['choices']:
-                content = result['choices'][0]['message']['content']
-                return json.loads(content)
+            result = self.call_deepseek_api(prompt, max_tokens=1500, cache_ttl=self.llm_cache_ttls['local_food'],
+                                            parse=self.parse_llm_json)
+            return self.parse_llm_json(result)
         except Exception as e:
             print(f"获取特色美食失败: {e}")
         
@@ -254,22 +413,31 @@ class APIIntegration:
         """
         获取旅行贴士，如穿衣指南等
         """
-        if not season:
-            season = self._get_current_season()
-        
-        prompt = f"请提供{city_name}在{season}的旅行贴士，包括：穿衣指南、天气特点、旅行建议、注意事项。" \
-                f"请以JSON格式返回，字段名：clothing_guide, weather_features, travel_suggestions, notes。"
+        prompt = self._build_travel_tips_prompt(normalize_city_name(city_name), season or self._get_current_season())
         
         try:
-            result = self.call_deepseek_api(prompt)
-            if 'choices' in result and result['choices']:
-                content = result['choices'][0]['message']['content']
-                return json.loads(content)
+            result = self.call_deepseek_api(prompt, cache_ttl=self.llm_cache_ttls['travel_tips'],
+                                            parse=self.parse_llm_json)
+            return self.parse_llm_json(result)
         except Exception as e:
             print(f"获取旅行贴士失败: {e}")
         
         return {}
     
+    def _build_local_food_prompt(self, city_name):
+        """
+        构造获取城市特色美食的提示词
+        """
+        return f"请列出{city_name}的特色美食，每个美食需要包含：名称、简介、推荐餐厅。" \
+               f"请以JSON格式返回，字段名：name, description, recommended_restaurants。最多返回10种美食。"
+    
+    def _build_travel_tips_prompt(self, city_name, season):
+        """
+        构造获取旅行贴士的提示词
+        """
+        return f"请提供{city_name}在{season}的旅行贴士，包括：穿衣指南、天气特点、旅行建议、注意事项。" \
+               f"请以JSON格式返回，字段名：clothing_guide, weather_features, travel_suggestions, notes。"
+    
     def _get_current_season(self):
         """
         获取当前季节
@@ -288,41 +456,50 @@ class APIIntegration:
         """
         搜索酒店信息
         """
-        # 使用高德地图POI搜索酒店
-        keywords = f'{city_name}酒店'
-        if area:
-            keywords = f'{area}酒店'
+        cache_key = ResponseCache.make_key('hotels', city_name, area or '')
+        cached = self.hotel_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
-        poi_result = self.get_amap_poi(keywords, city_name, '100100', 30)
+        # 使用高德地图POI搜索酒店
+        poi_result = self.get_amap_poi(f'{area or city_name}酒店', city_name, '100100', 30)
         
         if 'pois' in poi_result:
-            hotels = []
-            for poi in poi_result['pois']:
-                hotel = {
-                    'name': poi.get('name'),
-                    'address': poi.get('address'),
-                    'price': poi.get('biz_ext', {}).get('price', '价格待定'),
-                    'rating': poi.get('biz_ext', {}).get('rating', '暂无评分'),
-                    'type': poi.get('type'),
-                    'location': poi.get('location')
-                }
-                hotels.append(hotel)
+            hotels = [self._poi_to_hotel(poi) for poi in poi_result['pois']]
+            # 只缓存有结果的高德搜索
+            if hotels:
+                self.hotel_cache.set(cache_key, hotels, self.hotel_cache_ttl)
             return hotels
         
         # 备选方案：使用LLM获取酒店推荐
-        prompt = f"请推荐{city_name}{area+'内' if area else ''}的酒店，包括：名称、位置、价格区间、特色。" \
-                f"请以JSON格式返回，字段名：name, location, price_range, features。最多返回5家酒店。"
-        
         try:
-            result = self.call_deepseek_api(prompt)
-            if 'choices' in result and result['choices']:
-                content = result['choices'][0]['message']['content']
-                return json.loads(content)
+            result = self.call_deepseek_api(self._build_hotels_prompt(city_name, area))
+            return self.parse_llm_json(result)
         except Exception as e:
             print(f"获取酒店推荐失败: {e}")
         
         return []
     
+    def _poi_to_hotel(self, poi):
+        """
+        将高德POI转换为酒店字典
+        """
+        return {
+            'name': poi.get('name'),
+            'address': poi.get('address'),
+            'price': poi.get('biz_ext', {}).get('price', '价格待定'),
+            'rating': poi.get('biz_ext', {}).get('rating', '暂无评分'),
+            'type': poi.get('type'),
+            'location': poi.get('location')
+        }
+    
+    def _build_hotels_prompt(self, city_name, area=None):
+        """
+        构造推荐酒店的提示词
+        """
+        return f"请推荐{city_name}{area+'内' if area else ''}的酒店，包括：名称、位置、价格区间、特色。" \
+               f"请以JSON格式返回，字段名：name, location, price_range, features。最多返回5家酒店。"
+    
     def get_traffic_info(self, city_name, origin, destination):
         """
         获取交通信息建议
@@ -340,21 +517,25 @@ class APIIntegration:
                 # 尝试不同交通方式
                 walking_result = self.get_amap_route(origin_coords, dest_coords, 'walking')
                 riding_result = self.get_amap_route(origin_coords, dest_coords, 'riding')
-                
-                # 整合交通建议
-                return {
-                    'origin': origin,
-                    'destination': destination,
-                    'walking': self._parse_walking_result(walking_result),
-                    'riding': self._parse_riding_result(riding_result),
-                    'suggestion': self._generate_traffic_suggestion(walking_result, riding_result)
-                }
+                return self._build_traffic_info(origin, destination, walking_result, riding_result)
         except Exception as e:
             print(f"获取交通信息失败: {e}")
         
         # 备选方案：使用LLM生成交通建议
         return self._get_traffic_suggestion_from_llm(city_name, origin, destination)
     
+    def _build_traffic_info(self, origin, destination, walking_result, riding_result):
+        """
+        整合步行和骑行路线结果为交通建议
+        """
+        return {
+            'origin': origin,
+            'destination': destination,
+            'walking': self._parse_walking_result(walking_result),
+            'riding': self._parse_riding_result(riding_result),
+            'suggestion': self._generate_traffic_suggestion(walking_result, riding_result)
+        }
+    
     def _parse_walking_result(self, result):
         """
         解析步行路线结果
@@ -399,35 +580,43 @@ class APIIntegration:
         """
         使用LLM生成交通建议
         """
-        prompt = f"从{city_name}的{origin}到{destination}，有哪些交通方式？请推荐最合适的市内交通方式（地铁、公交、共享单车或步行），并说明理由。"
-        
         try:
-            result = self.call_deepseek_api(prompt)
-            if 'choices' in result and result['choices']:
-                content = result['choices'][0]['message']['content']
-                return {
-                    'suggestion': content,
-                    'origin': origin,
-                    'destination': destination
-                }
+            result = self.call_deepseek_api(self._build_traffic_prompt(city_name, origin, destination))
+            return self._llm_traffic_suggestion(result, origin, destination)
         except Exception as e:
             print(f"LLM生成交通建议失败: {e}")
         
         return {}
     
+    def _build_traffic_prompt(self, city_name, origin, destination):
+        """
+        构造市内交通建议的提示词
+        """
+        return f"从{city_name}的{origin}到{destination}，有哪些交通方式？请推荐最合适的市内交通方式（地铁、公交、共享单车或步行），并说明理由。"
+    
+    def _llm_traffic_suggestion(self, result, origin, destination):
+        """
+        从LLM响应中取出交通建议，响应无效时返回空字典
+        """
+        if 'choices' in result and result['choices']:
+            return {
+                'suggestion': result['choices'][0]['message']['content'],
+                'origin': origin,
+                'destination': destination
+            }
+        return {}
+    
     def get_city_info(self, city_name):
         """
         获取城市的综合信息
         """
         # 使用DeepSeek API获取城市综合信息
-        prompt = f"请提供{city_name}的综合信息，包括：地理位置、气候特点、旅游季节建议、文化特色、主要景点分布区域、交通概况。" \
-                f"请以JSON格式返回，字段名：location, climate, best_season, cultural_features, scenic_areas, transportation。"
+        prompt = self._build_city_info_prompt(normalize_city_name(city_name))
         
         try:
-            result = self.call_deepseek_api(prompt)
-            if 'choices' in result and result['choices']:
-                content = result['choices'][0]['message']['content']
-                return json.loads(content)
+            result = self.call_deepseek_api(prompt, cache_ttl=self.llm_cache_ttls['city_info'],
+                                            parse=self.parse_llm_json)
+            return self.parse_llm_json(result)
         except Exception as e:
             print(f"获取城市信息失败: {e}")
         
@@ -0,0 +1,363 @@
+import asyncio
+import json
+import os
+import threading
+from datetime import datetime
+
+import aiohttp
+
+from .api_integration import APIIntegration
+from .response_cache import ResponseCache
+from .user_input_module import normalize_city_name
+from .city_adcode_table import lookup_adcode
+
+# 未通过async with持有会话时，每个事件循环共享一个ClientSession，连接数限制对该循环上的所有调用生效；
+# 事件循环关闭后其会话在下次获取时移除，不会随事件循环数量增长
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _new_session():
+    connector = aiohttp.TCPConnector(
+        limit=int(os.getenv('ASYNC_HTTP_LIMIT', 100)),
+        limit_per_host=int(os.getenv('ASYNC_HTTP_LIMIT_PER_HOST', 20))
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+def _get_session():
+    loop = asyncio.get_running_loop()
+    with _sessions_lock:
+        for closed_loop in [other for other in _sessions if other.is_closed()]:
+            # 事件循环已关闭，无法再异步关闭会话，只释放引用
+            _sessions.pop(closed_loop).detach()
+        session = _sessions.get(loop)
+        if session is None or session.closed:
+            session = _new_session()
+            _sessions[loop] = session
+        return session
+
+
+async def close_sessions():
+    """
+    关闭当前事件循环上的共享会话，通常在事件循环退出前调用
+    """
+    with _sessions_lock:
+        session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+class AsyncAPIIntegration(APIIntegration):
+    """
+    APIIntegration的asyncio版本，公开方法与同步版本一一对应，均为协程
+
+    通过async with使用时实例持有自己的会话并在退出时关闭；否则同一事件循环上的调用共享连接池。
+    响应缓存的磁盘读写放到线程中执行，不阻塞事件循环。
+    任务被取消时CancelledError会直接向上传播，不会被备选逻辑吞掉
+    """
+    def __init__(self):
+        super().__init__()
+        self.client_timeout = aiohttp.ClientTimeout(total=self.timeout)
+        # async with期间实例自己持有的会话
+        self._session = None
+
+    async def __aenter__(self):
+        self._session = _new_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        session, self._session = self._session, None
+        if session is not None:
+            await session.close()
+
+    async def _request_json(self, method, url, **kwargs):
+        session = self._session or _get_session()
+        async with session.request(method, url, timeout=self.client_timeout, **kwargs) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def call_deepseek_api(self, prompt, max_tokens=1000, temperature=0.7, cache_ttl=None, parse=None):
+        """
+        调用DeepSeek API进行智能问答，与同步版本共用LLM响应缓存，parse含义与同步版本相同
+        """
+        if not self.deepseek_api_key:
+            raise ValueError("DeepSeek API密钥未配置")
+
+        cache_key = self._llm_cache_key(prompt, max_tokens, temperature) if cache_ttl else None
+        if cache_key:
+            cached = await asyncio.to_thread(self.llm_cache.get, cache_key)
+            if cached is not None:
+                return cached
+
+        headers, payload = self._build_deepseek_request(prompt, max_tokens, temperature)
+
+        try:
+            result = await self._request_json('POST', f'{self.deepseek_api_url}/chat/completions',
+                                              headers=headers, data=json.dumps(payload))
+            if cache_key and self._is_cacheable_llm_response(result, parse):
+                await asyncio.to_thread(self.llm_cache.set, cache_key, result, cache_ttl)
+            return result
+        except Exception as e:
+            print(f"DeepSeek API调用失败: {e}")
+            return {"error": str(e)}
+
+    async def get_amap_geocode(self, address):
+        """
+        使用高德地图API进行地理编码
+        """
+        if not self.amap_api_key:
+            raise ValueError("高德地图API密钥未配置")
+
+        cache_key = self._geocode_cache_key(address)
+        cached = await asyncio.to_thread(self.geocode_cache.get, cache_key)
+        if cached is not None:
+            return cached
+
+        params = {
+            'key': self.amap_api_key,
+            'address': address
+        }
+
+        try:
+            result = await self._request_json('GET', f'{self.amap_api_url}/geocode/geo', params=params)
+        except Exception as e:
+            print(f"高德地图地理编码失败: {e}")
+            return {"error": str(e)}
+
+        if result.get('status') == '1' and result.get('geocodes'):
+            await asyncio.to_thread(self.geocode_cache.set, cache_key, result, self.geocode_cache_ttl)
+        return result
+
+    async def get_amap_poi(self, keywords, city, types='110100', offset=20):
+        """
+        使用高德地图API获取POI（兴趣点）数据
+        """
+        if not self.amap_api_key:
+            raise ValueError("高德地图API密钥未配置")
+
+        params = {
+            'key': self.amap_api_key,
+            'keywords': keywords,
+            'city': city,
+            'types': types,
+            'offset': offset,
+            'page': 1,
+            'extensions': 'all'
+        }
+
+        try:
+            return await self._request_json('GET', f'{self.amap_api_url}/place/text', params=params)
+        except Exception as e:
+            print(f"高德地图POI查询失败: {e}")
+            return {"error": str(e)}
+
+    async def get_amap_route(self, origin, destination, mode='driving'):
+        """
+        使用高德地图API获取路线规划
+        mode: driving(驾车), walking(步行), transit(公交), riding(骑行)
+        """
+        if not self.amap_api_key:
+            raise ValueError("高德地图API密钥未配置")
+
+        url = self._get_amap_route_url(mode)
+
+        params = {
+            'key': self.amap_api_key,
+            'origin': origin,
+            'destination': destination
+        }
+
+        if mode == 'transit':
+            params['city'] = origin.split(',')[0]
+
+        try:
+            return await self._request_json('GET', url, params=params)
+        except Exception as e:
+            print(f"高德地图路线规划失败: {e}")
+            return {"error": str(e)}
+
+    async def get_weather(self, city):
+        """
+        使用阿里云天气API获取城市天气，失败时回退到高德天气
+        """
+        if not self.aliyun_appcode:
+            raise ValueError("阿里云AppCode未配置")
+
+        headers = {
+            'Authorization': f'APPCODE {self.aliyun_appcode}'
+        }
+        params = {
+            'city': city,
+            'date': datetime.now().strftime('%Y-%m-%d')
+        }
+
+        try:
+            return await self._request_json('GET', self.aliyun_weather_url, headers=headers, params=params)
+        except Exception as e:
+            print(f"阿里云天气API调用失败: {e}")
+            return await self._get_amap_weather(city)
+
+    async def _get_amap_weather(self, city):
+        """
+        使用高德地图天气API作为备选
+        """
+        if not self.amap_api_key:
+            return {"error": "无可用的天气API"}
+
+        params = {
+            'key': self.amap_api_key,
+            'city': await self._get_city_code(city),
+            'extensions': 'all'
+        }
+
+        try:
+            return await self._request_json('GET', f'{self.amap_api_url}/weather/weatherInfo', params=params)
+        except Exception as e:
+            print(f"高德地图天气查询失败: {e}")
+            return {"error": str(e)}
+
+    async def _get_city_code(self, city_name):
+        """
+        获取城市的行政区划代码，已知城市直接查内置代码表
+        """
+        adcode = lookup_adcode(city_name)
+        if adcode:
+            return adcode
+
+        geocode_result = await self.get_amap_geocode(city_name)
+        if 'geocodes' in geocode_result and geocode_result['geocodes']:
+            return geocode_result['geocodes'][0].get('adcode', '')
+        return ''
+
+    async def get_scenic_spots(self, city_name):
+        """
+        获取指定城市的景点列表，高德失败时回退到LLM
+        """
+        poi_result = await self.get_amap_poi('景点', city_name, '110100', 50)
+
+        if 'pois' in poi_result:
+            return [self._poi_to_spot(poi) for poi in poi_result['pois']]
+
+        return await self._get_spots_from_llm(city_name)
+
+    async def _get_spots_from_llm(self, city_name):
+        """
+        使用LLM获取城市景点信息作为备选方案
+        """
+        prompt = self._build_spots_prompt(normalize_city_name(city_name))
+
+        try:
+            llm_result = await self.call_deepseek_api(prompt, cache_ttl=self.llm_cache_ttls['spots'],
+                                                      parse=self.parse_llm_json)
+            return self.parse_llm_json(llm_result)
+        except Exception as e:
+            print(f"LLM获取景点信息失败: {e}")
+
+        return []
+
+    async def get_city_info(self, city_name):
+        """
+        获取城市的综合信息
+        """
+        prompt = self._build_city_info_prompt(normalize_city_name(city_name))
+
+        try:
+            result = await self.call_deepseek_api(prompt, cache_ttl=self.llm_cache_ttls['city_info'],
+                                                  parse=self.parse_llm_json)
+            return self.parse_llm_json(result)
+        except Exception as e:
+            print(f"获取城市信息失败: {e}")
+
+        return {}
+
+    async def get_local_food(self, city_name):
+        """
+        获取城市特色美食信息
+        """
+        prompt = self._build_local_food_prompt(normalize_city_name(city_name))
+
+        try:
+            result = await self.call_deepseek_api(prompt, max_tokens=1500, cache_ttl=self.llm_cache_ttls['local_food'],
+                                                  parse=self.parse_llm_json)
+            return self.parse_llm_json(result)
+        except Exception as e:
+            print(f"获取特色美食失败: {e}")
+
+        return []
+
+    async def get_travel_tips(self, city_name, season=None):
+        """
+        获取旅行贴士，如穿衣指南等
+        """
+        prompt = self._build_travel_tips_prompt(normalize_city_name(city_name), season or self._get_current_season())
+
+        try:
+            result = await self.call_deepseek_api(prompt, cache_ttl=self.llm_cache_ttls['travel_tips'],
+                                                  parse=self.parse_llm_json)
+            return self.parse_llm_json(result)
+        except Exception as e:
+            print(f"获取旅行贴士失败: {e}")
+
+        return {}
+
+    async def search_hotels(self, city_name, area=None):
+        """
+        搜索酒店信息，与同步版本共用酒店缓存
+        """
+        cache_key = ResponseCache.make_key('hotels', city_name, area or '')
+        cached = await asyncio.to_thread(self.hotel_cache.get, cache_key)
+        if cached is not None:
+            return cached
+
+        poi_result = await self.get_amap_poi(f'{area or city_name}酒店', city_name, '100100', 30)
+
+        if 'pois' in poi_result:
+            hotels = [self._poi_to_hotel(poi) for poi in poi_result['pois']]
+            if hotels:
+                await asyncio.to_thread(self.hotel_cache.set, cache_key, hotels, self.hotel_cache_ttl)
+            return hotels
+
+        try:
+            result = await self.call_deepseek_api(self._build_hotels_prompt(city_name, area))
+            return self.parse_llm_json(result)
+        except Exception as e:
+            print(f"获取酒店推荐失败: {e}")
+
+        return []
+
+    async def get_traffic_info(self, city_name, origin, destination):
+        """
+        获取交通信息建议，高德失败时回退到LLM
+        """
+        try:
+            origin_loc, dest_loc = await asyncio.gather(
+                self.get_amap_geocode(f'{city_name}{origin}'),
+                self.get_amap_geocode(f'{city_name}{destination}')
+            )
+
+            if origin_loc and 'geocodes' in origin_loc and dest_loc and 'geocodes' in dest_loc:
+                origin_coords = origin_loc['geocodes'][0]['location']
+                dest_coords = dest_loc['geocodes'][0]['location']
+
+                walking_result, riding_result = await asyncio.gather(
+                    self.get_amap_route(origin_coords, dest_coords, 'walking'),
+                    self.get_amap_route(origin_coords, dest_coords, 'riding')
+                )
+                return self._build_traffic_info(origin, destination, walking_result, riding_result)
+        except Exception as e:
+            print(f"获取交通信息失败: {e}")
+
+        return await self._get_traffic_suggestion_from_llm(city_name, origin, destination)
+
+    async def _get_traffic_suggestion_from_llm(self, city_name, origin, destination):
+        """
+        使用LLM生成交通建议
+        """
+        try:
+            result = await self.call_deepseek_api(self._build_traffic_prompt(city_name, origin, destination))
+            return self._llm_traffic_suggestion(result, origin, destination)
+        except Exception as e:
+            print(f"LLM生成交通建议失败: {e}")
+
+        return {}
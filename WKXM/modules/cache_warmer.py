@@ -0,0 +1,170 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from .concurrency import TokenBucket
+from .distance_matrix import haversine_matrix
+from .http_client import get_http_client
+from .spot_table import parse_location
+from .travel_time_cache import point_key
+
+
+class CacheWarmer:
+    """
+    离线预热城市缓存：景点数据、LLM城市信息和城市地理编码，提供travel_times时
+    还批量补全城市主要景点与其近邻之间的实际交通时间
+
+    多个城市并发预热，所有上游调用共用一个令牌桶限速；每完成一个城市就写入进度文件，
+    中断后再次运行会跳过已成功且未超过缓存有效期的城市，全部城市成功后删除进度文件
+    """
+    def __init__(self, scenic_spot_module, api=None, progress_file=None, max_workers=None, rate=None,
+                 travel_times=None, progress_ttl=None):
+        self.scenic_spot_module = scenic_spot_module
+        self.api = api or scenic_spot_module.api
+        self.progress_file = progress_file or os.getenv('CACHE_WARM_PROGRESS_FILE',
+                                                        os.path.join('cache', 'warm_progress.json'))
+        self.max_workers = max_workers or int(os.getenv('CACHE_WARM_WORKERS', 4))
+        # 每秒允许的上游请求数
+        self.rate = rate or float(os.getenv('CACHE_WARM_RATE', 5))
+        # 进度记录的有效期（秒），默认与景点缓存有效期相同，超过后对应城市的缓存可能已过期，需要重新预热
+        self.progress_ttl = progress_ttl or int(os.getenv('CACHE_WARM_PROGRESS_TTL',
+                                                          os.getenv('SPOT_CACHE_TTL', 86400)))
+        self._lock = threading.Lock()
+        self.travel_times = travel_times
+        # 交通时间预热的景点数量和每个景点的近邻数量
+        self.travel_time_spots = int(os.getenv('TRAVEL_TIME_WARM_SPOTS', 30))
+        self.travel_time_neighbors = int(os.getenv('TRAVEL_TIME_WARM_NEIGHBORS', 6))
+
+    def _load_progress(self):
+        try:
+            with open(self.progress_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _is_warm(self, entry):
+        """
+        进度记录是否表示该城市已成功预热且仍在有效期内
+        """
+        return (entry.get('status') == 'done'
+                and time.time() - entry.get('finished_at', 0) < self.progress_ttl)
+
+    def _clear_progress(self):
+        try:
+            os.remove(self.progress_file)
+        except FileNotFoundError:
+            pass
+
+    def _save_progress(self, progress):
+        progress_dir = os.path.dirname(self.progress_file)
+        if progress_dir:
+            os.makedirs(progress_dir, exist_ok=True)
+        tmp_file = f'{self.progress_file}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(progress, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.progress_file)
+
+    def _warm_tasks(self, city_name):
+        """
+        单个城市的预热任务，每个任务返回结果是否有效
+        """
+        tasks = [
+            ('spots', lambda: bool(self.scenic_spot_module.get_city_spots(city_name))),
+            ('city_info', lambda: bool(self.api.get_city_info(city_name))),
+            ('geocode', lambda: bool(self.api.get_amap_geocode(city_name).get('geocodes')))
+        ]
+        if self.travel_times is not None:
+            tasks.append(('travel_times', lambda: self._warm_travel_times(city_name)))
+        return tasks
+
+    def _warm_travel_times(self, city_name):
+        """
+        补全城市前若干个有坐标景点与各自最近的几个景点之间的驾车时间（双向）
+        """
+        spots = self.scenic_spot_module.get_city_spots(city_name)
+        locations = [parse_location(spot) for spot in spots]
+        locations = [location for location in locations if all(location)][:self.travel_time_spots]
+        if len(locations) < 2:
+            return False
+        lats, lngs = zip(*locations)
+        distances = haversine_matrix(lats, lngs)
+        np.fill_diagonal(distances, np.inf)
+        count = min(self.travel_time_neighbors, len(locations) - 1)
+        keys = [point_key(lat, lng) for lat, lng in locations]
+        pairs = set()
+        for i, neighbors in enumerate(np.argsort(distances, axis=1)[:, :count]):
+            for j in neighbors:
+                pairs.add((keys[i], keys[j]))
+                pairs.add((keys[j], keys[i]))
+        return self.travel_times.fill(sorted(pairs), 'driving') > 0
+
+    def warm_city(self, city_name):
+        """
+        预热单个城市，返回各任务耗时（毫秒）和失败原因
+        """
+        timings = {}
+        errors = {}
+        for task_name, task in self._warm_tasks(city_name):
+            start = time.perf_counter()
+            try:
+                if not task():
+                    errors[task_name] = '返回结果为空'
+            except Exception as e:
+                errors[task_name] = str(e)
+            timings[task_name] = round((time.perf_counter() - start) * 1000, 2)
+
+        return {
+            'status': 'failed' if errors else 'done',
+            'timings_ms': timings,
+            'errors': errors,
+            'finished_at': time.time()
+        }
+
+    def run(self, cities, force=False):
+        """
+        预热城市列表并返回报告；force为True时忽略进度文件，全部重新预热
+        """
+        start = time.perf_counter()
+        cities = list(dict.fromkeys(cities))
+        progress = {} if force else self._load_progress()
+        # 过期的进度记录不再跳过，也不带入本次运行的进度文件
+        progress = {city: entry for city, entry in progress.items() if self._is_warm(entry)}
+        pending = [city for city in cities if city not in progress]
+        results = {}
+
+        bucket = TokenBucket(self.rate)
+        http = get_http_client()
+        previous_limiter = http.rate_limiter
+        http.set_rate_limiter(bucket)
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='cache_warm')
+        try:
+            futures = {executor.submit(self.warm_city, city): city for city in pending}
+            for future in as_completed(futures):
+                city = futures[future]
+                results[city] = future.result()
+                with self._lock:
+                    progress[city] = results[city]
+                    self._save_progress(progress)
+        finally:
+            # 中断时取消尚未开始的城市，已完成的城市已写入进度文件
+            executor.shutdown(wait=True, cancel_futures=True)
+            http.set_rate_limiter(previous_limiter)
+
+        # 本次运行没有失败的城市时进度文件已无用，删除后下次运行从头开始
+        if all(entry['status'] == 'done' for entry in results.values()):
+            self._clear_progress()
+
+        return {
+            'total': len(cities),
+            'skipped': len(cities) - len(pending),
+            'completed': sum(1 for entry in results.values() if entry['status'] == 'done'),
+            'failed': sum(1 for entry in results.values() if entry['status'] == 'failed'),
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+            'rate_limiter': bucket.get_stats(),
+            'cities': results
+        }
@@ -0,0 +1,216 @@
+import contextvars
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name, max_workers=None):
+    """
+    获取按名称共享的有界线程池，不同用途使用不同线程池，避免嵌套提交造成死锁
+    """
+    with _executors_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            max_workers = max_workers or int(os.getenv('EXECUTOR_MAX_WORKERS', 8))
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+            _executors[name] = executor
+        return executor
+
+
+def get_process_pool(name, max_workers=None):
+    """
+    获取按名称共享的进程池，用于CPU密集的规划计算；子进程使用spawn方式启动，
+    避免在已有多个线程的服务进程中fork
+    """
+    with _executors_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            max_workers = max_workers or int(os.getenv('PLAN_PROCESS_WORKERS', 0)) or os.cpu_count() or 1
+            context = multiprocessing.get_context(os.getenv('PROCESS_POOL_START_METHOD', 'spawn'))
+            executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+            _executors[name] = executor
+        return executor
+
+
+def discard_executor(name, executor):
+    """
+    移除已损坏的共享执行器（例如进程池中的工作进程异常退出），下次获取时重新创建
+    """
+    with _executors_lock:
+        if _executors.get(name) is executor:
+            del _executors[name]
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_stages(executor, stages, default_deadline=10.0):
+    """
+    在线程池中并发执行相互独立的阶段
+
+    stages: {阶段名: (函数, 截止时间秒数或None, 超时/失败时的默认值)}
+    每个阶段在调用方上下文的副本中执行，按请求设置的上下文变量（如连接统计）在阶段内仍然有效
+    返回 (结果字典, 阶段耗时字典)；耗时字典包含每个阶段的墙钟时间和状态
+    """
+    start = time.perf_counter()
+    futures = {}
+
+    def timed(func):
+        stage_start = time.perf_counter()
+        try:
+            return func(), None, time.perf_counter() - stage_start
+        except Exception as e:
+            return None, e, time.perf_counter() - stage_start
+
+    for name, (func, _, _) in stages.items():
+        futures[name] = executor.submit(contextvars.copy_context().run, timed, func)
+
+    results = {}
+    timings = {}
+    for name, (_, deadline, default) in stages.items():
+        deadline = deadline if deadline is not None else default_deadline
+        # 所有阶段同时开始，剩余等待时间按阶段自身的截止时间计算
+        remaining = max(0.0, deadline - (time.perf_counter() - start))
+        try:
+            value, error, elapsed = futures[name].result(timeout=remaining)
+        except FutureTimeoutError:
+            futures[name].cancel()
+            results[name] = default
+            timings[name] = {'status': 'timeout', 'wall_time_ms': round(deadline * 1000, 2)}
+            continue
+
+        if error is not None:
+            results[name] = default
+            timings[name] = {'status': 'error', 'error': str(error),
+                             'wall_time_ms': round(elapsed * 1000, 2)}
+        else:
+            results[name] = value
+            timings[name] = {'status': 'ok', 'wall_time_ms': round(elapsed * 1000, 2)}
+
+    return results, timings
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    合并相同键的并发调用：同一时刻只有一个调用真正执行，其余调用等待并共享其结果或异常；
+    等待超过timeout秒时抛出TimeoutError，正在执行的调用不受影响
+    """
+    def __init__(self, name, timeout=None):
+        self.name = name
+        self.timeout = timeout if timeout is not None else float(os.getenv('SINGLE_FLIGHT_TIMEOUT', 120))
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {'calls': 0, 'executions': 0, 'coalesced': 0, 'timeouts': 0}
+
+    def do(self, key, func, timeout=None):
+        with self._lock:
+            self.stats['calls'] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                self.stats['coalesced'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.stats['executions'] += 1
+                leader = True
+
+        if not leader:
+            if not call.event.wait(timeout if timeout is not None else self.timeout):
+                with self._lock:
+                    self.stats['timeouts'] += 1
+                raise TimeoutError(f"等待合并调用超时: {self.name}/{key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, 'in_flight': len(self._calls)}
+
+
+_single_flights = {}
+
+
+def get_single_flight(name):
+    """
+    获取按名称共享的进程级SingleFlight实例，便于多个模块实例之间合并调用
+    """
+    with _executors_lock:
+        group = _single_flights.get(name)
+        if group is None:
+            group = SingleFlight(name)
+            _single_flights[name] = group
+        return group
+
+
+def get_single_flight_stats():
+    """
+    汇总所有SingleFlight分组的合并计数
+    """
+    with _executors_lock:
+        groups = list(_single_flights.values())
+    return {group.name: group.get_stats() for group in groups}
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶限速器：每秒补充rate个令牌，最多积累capacity个
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.stats = {'acquired': 0, 'waited': 0, 'wait_time': 0.0}
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        获取令牌，令牌不足时阻塞等待；超过timeout秒仍未获得时返回False
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        waited = False
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    self.stats['acquired'] += 1
+                    if waited:
+                        self.stats['waited'] += 1
+                        self.stats['wait_time'] += now - start
+                    return True
+                delay = (tokens - self._tokens) / self.rate
+            if deadline is not None and now + delay > deadline:
+                return False
+            waited = True
+            time.sleep(delay)
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, 'wait_time': round(self.stats['wait_time'], 3)}
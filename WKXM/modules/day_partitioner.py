@@ -0,0 +1,131 @@
+import os
+import random
+import time
+
+import numpy as np
+
+from .distance_matrix import haversine_matrix
+
+# 分配时每个点只依次尝试最近的若干个簇，都已满时放入负载最小的簇
+ASSIGN_CANDIDATE_CLUSTERS = 8
+
+
+class BalancedKMedoids:
+    """
+    带容量约束的k-medoids聚类，用于把大量候选景点划分为地理上紧凑、工作量均衡的若干天
+
+    每个簇的容量为所有点权重（例如游玩时长）之和的1/k再留出少量余量；分配时优先处理
+    "最近簇与次近簇距离差"最大的点，使其尽量进入最近的簇，簇满时改入下一个最近的簇。
+    更新中心时只在离当前中心最近的若干成员中寻找总距离最小的点，聚类成本与点数成线性关系，
+    不需要构建全部景点两两之间的距离矩阵
+    """
+    def __init__(self, max_iterations=None, balance_slack=None, sample_size=None):
+        self.max_iterations = max_iterations or int(os.getenv('DAY_PARTITION_MAX_ITERATIONS', 10))
+        if balance_slack is None:
+            balance_slack = float(os.getenv('DAY_PARTITION_BALANCE_SLACK', 0.1))
+        self.balance_slack = balance_slack
+        self.sample_size = sample_size or int(os.getenv('DAY_PARTITION_MEDOID_SAMPLE', 100))
+
+    def fit(self, lats, lngs, k, weights=None, rng=random, deadline=None):
+        """
+        对坐标进行聚类，返回 (中心点下标数组, 每个点所属簇的数组)
+
+        缺少坐标（纬度或经度为0）的点不参与聚类，所属簇为-1；
+        deadline为time.perf_counter()表示的截止时刻，超过后不再更新中心，按当前中心分配
+        """
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        weights = np.ones(len(lats)) if weights is None else np.asarray(weights, dtype=float)
+        labels = np.full(len(lats), -1, dtype=int)
+
+        points = np.flatnonzero((lats != 0) & (lngs != 0))
+        k = min(k, len(points))
+        if k <= 0:
+            return np.array([], dtype=int), labels
+
+        medoids = self._init_medoids(lats, lngs, points, k, rng)
+        previous = [None] * k
+        for _ in range(self.max_iterations):
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            assignment = self._assign(lats, lngs, points, medoids, weights[points])
+            # 按簇分组成员，避免对每个簇扫描全部点
+            grouped = points[np.argsort(assignment, kind='stable')]
+            members = np.split(grouped, np.cumsum(np.bincount(assignment, minlength=k))[:-1])
+            # 成员没有变化的簇中心也不会变化
+            updated = np.array([medoids[c] if previous[c] is not None and np.array_equal(previous[c], members[c])
+                                else self._update_medoid(lats, lngs, members[c], medoids[c]) for c in range(k)])
+            if np.array_equal(updated, medoids):
+                break
+            medoids = updated
+            previous = members
+        labels[points] = self._assign(lats, lngs, points, medoids, weights[points])
+        return medoids, labels
+
+    def _init_medoids(self, lats, lngs, points, k, rng):
+        """
+        k-means++初始化：后续中心按与已有中心最近距离的平方为概率抽样
+        """
+        medoids = [int(points[rng.randrange(len(points))])]
+        nearest = haversine_matrix(lats[points], lngs[points], lats[medoids], lngs[medoids])[:, 0]
+        while len(medoids) < k:
+            squared = nearest ** 2
+            total = squared.sum()
+            if total <= 0:
+                # 剩余点与已有中心重合，按顺序补足中心
+                chosen = next(int(p) for p in points if int(p) not in medoids)
+            else:
+                position = int(np.searchsorted(np.cumsum(squared), rng.random() * total, side='right'))
+                chosen = int(points[min(position, len(points) - 1)])
+            medoids.append(chosen)
+            distances = haversine_matrix(lats[points], lngs[points], [lats[chosen]], [lngs[chosen]])[:, 0]
+            nearest = np.minimum(nearest, distances)
+        return np.array(medoids, dtype=int)
+
+    def _assign(self, lats, lngs, points, medoids, weights):
+        """
+        按容量约束把点分配到簇，返回每个点所属簇的数组（与points对齐）
+        """
+        k = len(medoids)
+        distances = haversine_matrix(lats[points], lngs[points], lats[medoids], lngs[medoids])
+        if k > ASSIGN_CANDIDATE_CLUSTERS:
+            nearest = np.argpartition(distances, ASSIGN_CANDIDATE_CLUSTERS - 1, axis=1)[:, :ASSIGN_CANDIDATE_CLUSTERS]
+            nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+            ranked = np.take_along_axis(nearest, np.argsort(nearest_distances, axis=1, kind='stable'), axis=1)
+        else:
+            ranked = np.argsort(distances, axis=1, kind='stable')
+        if k > 1:
+            rows = np.arange(len(points))
+            regret = distances[rows, ranked[:, 1]] - distances[rows, ranked[:, 0]]
+            order = np.argsort(-regret, kind='stable')
+        else:
+            order = np.arange(len(points))
+
+        capacity = weights.sum() / k * (1 + self.balance_slack)
+        load = [0.0] * k
+        assignment = np.empty(len(points), dtype=int)
+        # 中心点始终属于自己的簇
+        medoid_clusters = {int(medoid): c for c, medoid in enumerate(medoids)}
+        point_list, ranked_list, weight_list = points.tolist(), ranked.tolist(), weights.tolist()
+        for position in order.tolist():
+            weight = weight_list[position]
+            cluster = medoid_clusters.get(point_list[position])
+            if cluster is None:
+                cluster = next((c for c in ranked_list[position] if load[c] + weight <= capacity), None)
+            if cluster is None:
+                # 所有簇都已满时放入当前负载最小的簇
+                cluster = load.index(min(load))
+            assignment[position] = cluster
+            load[cluster] += weight
+        return assignment
+
+    def _update_medoid(self, lats, lngs, members, medoid):
+        """
+        在离当前中心最近的sample_size个成员中选出到全部成员距离之和最小的点作为新中心
+        """
+        if len(members) == 0:
+            return medoid
+        to_medoid = haversine_matrix(lats[members], lngs[members], [lats[medoid]], [lngs[medoid]])[:, 0]
+        candidates = members[np.argsort(to_medoid, kind='stable')[:self.sample_size]]
+        costs = haversine_matrix(lats[candidates], lngs[candidates], lats[members], lngs[members]).sum(axis=1)
+        return int(candidates[int(np.argmin(costs))])
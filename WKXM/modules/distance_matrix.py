@@ -0,0 +1,118 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_matrix(lats1, lngs1, lats2=None, lngs2=None):
+    """
+    向量化计算两组坐标之间的Haversine距离矩阵（公里）
+    只传入一组坐标时计算该组内两两之间的距离
+    """
+    lat1 = np.radians(np.asarray(lats1, dtype=float))[:, None]
+    lng1 = np.radians(np.asarray(lngs1, dtype=float))[:, None]
+    if lats2 is None:
+        lat2, lng2 = lat1.T, lng1.T
+    else:
+        lat2 = np.radians(np.asarray(lats2, dtype=float))[None, :]
+        lng2 = np.radians(np.asarray(lngs2, dtype=float))[None, :]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class DistanceMatrix:
+    """
+    一次规划内所有景点两两之间的距离矩阵（公里），启发式算法通过整数下标查询
+
+    与RoutePlanningModule._calculate_distance保持一致：缺少坐标（纬度或经度为0）的景点
+    与任何位置的距离均为无穷大
+    """
+    def __init__(self, lats, lngs):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lngs = np.asarray(lngs, dtype=float)
+        self.valid = (self.lats != 0) & (self.lngs != 0)
+        self.matrix = haversine_matrix(self.lats, self.lngs)
+        self.matrix[~self.valid, :] = np.inf
+        self.matrix[:, ~self.valid] = np.inf
+        self._shared = None
+
+    @classmethod
+    def from_locations(cls, locations):
+        """
+        由 (纬度, 经度) 列表构建距离矩阵
+        """
+        if not locations:
+            return cls([], [])
+        lats, lngs = zip(*locations)
+        return cls(lats, lngs)
+
+    def share(self):
+        """
+        把距离矩阵复制到共享内存，返回其他进程可以挂载的 (共享内存名称, 矩阵形状)；
+        使用完毕后由创建方调用release释放
+        """
+        if self._shared is None:
+            self._shared = shared_memory.SharedMemory(create=True, size=max(self.matrix.nbytes, 1))
+            shared = np.ndarray(self.matrix.shape, dtype=self.matrix.dtype, buffer=self._shared.buf)
+            shared[:] = self.matrix
+        return self._shared.name, self.matrix.shape
+
+    @classmethod
+    def attach(cls, lats, lngs, handle):
+        """
+        挂载其他进程通过share发布的距离矩阵，直接读取共享内存而不重新计算或复制
+        """
+        name, shape = handle
+        matrix = cls.__new__(cls)
+        matrix.lats = np.asarray(lats, dtype=float)
+        matrix.lngs = np.asarray(lngs, dtype=float)
+        matrix.valid = (matrix.lats != 0) & (matrix.lngs != 0)
+        matrix._shared = shared_memory.SharedMemory(name=name)
+        matrix.matrix = np.ndarray(shape, dtype=float, buffer=matrix._shared.buf)
+        return matrix
+
+    def release(self, unlink=False):
+        """
+        关闭共享内存，unlink为True时（创建方）同时删除共享内存
+        """
+        if self._shared is None:
+            return
+        # 先复制出矩阵，释放后仍可继续读取
+        self.matrix = np.array(self.matrix)
+        self._shared.close()
+        if unlink:
+            self._shared.unlink()
+        self._shared = None
+
+    def __len__(self):
+        return len(self.lats)
+
+    def distance(self, i, j):
+        return float(self.matrix[i, j])
+
+    def from_point(self, lat, lng):
+        """
+        计算任意位置到所有景点的距离向量
+        """
+        if not lat or not lng:
+            return np.full(len(self), np.inf)
+        distances = haversine_matrix([lat], [lng], self.lats, self.lngs)[0]
+        distances[~self.valid] = np.inf
+        return distances
+
+    def nearest(self, from_index, candidates):
+        """
+        返回候选下标中离from_index最近的一个，距离相同时取靠前的候选
+        """
+        return candidates[int(np.argmin(self.matrix[from_index, candidates]))]
+
+    def path_length(self, order):
+        """
+        按顺序依次经过各景点的总距离
+        """
+        if len(order) < 2:
+            return 0.0
+        order = np.asarray(order)
+        return float(self.matrix[order[:-1], order[1:]].sum())
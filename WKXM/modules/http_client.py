@@ -0,0 +1,233 @@
+import contextvars
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class ConnectionStats:
+    """
+    按上游主机统计请求数、新建连接数和握手耗时
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host_entry(self, host):
+        if host not in self._hosts:
+            self._hosts[host] = {
+                'requests': 0,
+                'failed_requests': 0,
+                'new_connections': 0,
+                'connect_time': 0.0,
+                'request_time': 0.0
+            }
+        return self._hosts[host]
+
+    def record_connect(self, host, elapsed):
+        with self._lock:
+            entry = self._host_entry(host)
+            entry['new_connections'] += 1
+            entry['connect_time'] += elapsed
+
+    def record_request(self, host, elapsed, failed=False):
+        with self._lock:
+            entry = self._host_entry(host)
+            entry['requests'] += 1
+            entry['request_time'] += elapsed
+            if failed:
+                entry['failed_requests'] += 1
+
+    def snapshot(self):
+        """
+        返回当前计数的副本，可与后续快照相减得到单个请求期间的增量
+        """
+        with self._lock:
+            return {host: dict(entry) for host, entry in self._hosts.items()}
+
+    @staticmethod
+    def summarize(snapshot, baseline=None, reference=None):
+        """
+        汇总快照（可选减去基线），并估算连接复用节省的握手时间；
+        reference为估算平均握手耗时所用的快照（例如进程级统计），默认使用snapshot本身
+        """
+        baseline = baseline or {}
+        reference = reference or snapshot
+        hosts = {}
+        totals = {'requests': 0, 'failed_requests': 0, 'new_connections': 0, 'reused_connections': 0,
+                  'connect_time_ms': 0.0, 'handshake_saved_ms': 0.0}
+
+        for host, entry in snapshot.items():
+            base = baseline.get(host, {})
+            requests_count = entry['requests'] - base.get('requests', 0)
+            failed = entry['failed_requests'] - base.get('failed_requests', 0)
+            new_connections = entry['new_connections'] - base.get('new_connections', 0)
+            connect_time = entry['connect_time'] - base.get('connect_time', 0.0)
+            if requests_count <= 0 and new_connections <= 0:
+                continue
+
+            # 平均握手耗时取该主机的历史值，避免单个请求内没有新建连接时无法估算
+            history = reference.get(host, entry)
+            avg_connect = history['connect_time'] / history['new_connections'] if history['new_connections'] else 0.0
+            # 失败的请求没有完成握手，不计入复用
+            reused = max(0, requests_count - failed - new_connections)
+            saved = reused * avg_connect
+
+            hosts[host] = {
+                'requests': requests_count,
+                'failed_requests': failed,
+                'new_connections': new_connections,
+                'reused_connections': reused,
+                'connect_time_ms': round(connect_time * 1000, 2),
+                'avg_handshake_ms': round(avg_connect * 1000, 2),
+                'handshake_saved_ms': round(saved * 1000, 2)
+            }
+            totals['requests'] += requests_count
+            totals['failed_requests'] += failed
+            totals['new_connections'] += new_connections
+            totals['reused_connections'] += reused
+            totals['connect_time_ms'] += connect_time * 1000
+            totals['handshake_saved_ms'] += saved * 1000
+
+        totals['connect_time_ms'] = round(totals['connect_time_ms'], 2)
+        totals['handshake_saved_ms'] = round(totals['handshake_saved_ms'], 2)
+        return {'hosts': hosts, 'totals': totals}
+
+
+# 进程级连接统计，由计时连接类写入
+connection_stats = ConnectionStats()
+
+# 当前请求的连接统计：设置后，同一上下文（包括复制了该上下文的线程池任务）中的上游调用
+# 同时计入这份统计，并发请求之间互不影响
+request_connection_stats = contextvars.ContextVar('request_connection_stats', default=None)
+
+
+class _TimedConnectionMixin:
+    """
+    记录TCP+TLS握手耗时的连接类
+    """
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        elapsed = time.perf_counter() - start
+        connection_stats.record_connect(self.host, elapsed)
+        scoped = request_connection_stats.get()
+        if scoped is not None:
+            scoped.record_connect(self.host, elapsed)
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    使用计时连接池的HTTPAdapter，保持长连接
+    """
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool
+        }
+
+
+class HTTPClient:
+    """
+    进程级共享的HTTP客户端，每个上游主机使用独立的长连接池
+    """
+    def __init__(self, pool_connections=None, pool_maxsize=None):
+        self.pool_connections = pool_connections or int(os.getenv('HTTP_POOL_CONNECTIONS', 4))
+        self.pool_maxsize = pool_maxsize or int(os.getenv('HTTP_POOL_MAXSIZE', 10))
+        self.session = requests.Session()
+        self.stats = connection_stats
+        self._lock = threading.Lock()
+        self._mounted_hosts = set()
+        # 可选的上游调用限速器（需提供acquire()方法），例如离线预热时的令牌桶
+        self.rate_limiter = None
+
+        # 默认适配器，用于未单独注册的主机
+        default_adapter = PooledHTTPAdapter(pool_connections=self.pool_connections,
+                                            pool_maxsize=self.pool_maxsize)
+        self.session.mount('https://', default_adapter)
+        self.session.mount('http://', default_adapter)
+
+    def register_host(self, url, pool_maxsize=None):
+        """
+        为上游主机注册独立的连接池，pool_maxsize可单独配置
+        """
+        parts = urlsplit(url)
+        if not parts.scheme or not parts.netloc:
+            return
+        prefix = f'{parts.scheme}://{parts.netloc}/'
+        with self._lock:
+            if prefix in self._mounted_hosts:
+                return
+            adapter = PooledHTTPAdapter(pool_connections=1,
+                                        pool_maxsize=pool_maxsize or self.pool_maxsize)
+            self.session.mount(prefix, adapter)
+            self._mounted_hosts.add(prefix)
+
+    def set_rate_limiter(self, rate_limiter):
+        """
+        设置或移除（传入None）所有请求共用的限速器
+        """
+        self.rate_limiter = rate_limiter
+
+    def request(self, method, url, **kwargs):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        host = urlsplit(url).hostname or ''
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except Exception:
+            self._record_request(host, time.perf_counter() - start, failed=True)
+            raise
+        self._record_request(host, time.perf_counter() - start)
+        return response
+
+    def _record_request(self, host, elapsed, failed=False):
+        self.stats.record_request(host, elapsed, failed)
+        scoped = request_connection_stats.get()
+        if scoped is not None:
+            scoped.record_request(host, elapsed, failed)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """
+    获取进程级共享的HTTP客户端（首次调用时创建）
+    """
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = HTTPClient()
+    return _http_client
@@ -0,0 +1,178 @@
+import os
+import time
+
+import numpy as np
+
+# 移动带来的距离变化小于该值时视为没有改进，避免浮点误差导致来回交换
+IMPROVEMENT_EPSILON = 1e-9
+# Or-opt一次移动的最大连续景点数
+OR_OPT_MAX_SEGMENT = 3
+
+
+class LocalSearch:
+    """
+    基于距离矩阵的路线局部搜索改进器
+
+    对起点和终点固定的开放路径（例如从住宿出发、回到住宿）交替执行2-opt（反转一段路线）
+    和Or-opt（把1-3个连续景点移动到其他位置），只考虑每个景点的若干近邻作为候选，
+    并在时间预算用尽时返回当前最优路线
+    """
+    def __init__(self, neighbor_count=None, time_budget_ms=None):
+        self.neighbor_count = neighbor_count or int(os.getenv('LOCAL_SEARCH_NEIGHBORS', 8))
+        if time_budget_ms is None:
+            time_budget_ms = float(os.getenv('LOCAL_SEARCH_TIME_BUDGET_MS', 50))
+        self.time_budget_ms = time_budget_ms
+
+    def improve(self, matrix, order, start=None, end=None, deadline=None):
+        """
+        改进按order顺序游览景点的路线，start和end为固定的起点和终点下标（None表示不固定），
+        deadline为time.perf_counter()表示的截止时刻，早于自身时间预算时提前结束
+
+        返回 (改进后的顺序, 距离报告)，报告中包含贪心路线和改进后路线的距离（公里）
+        """
+        order = [int(i) for i in order]
+        nodes = order + [i for i in (start, end) if i is not None]
+        # 存在缺少坐标的景点时距离为无穷大，无法比较改进效果，保持原顺序
+        if nodes and not np.isfinite(matrix.matrix[np.ix_(nodes, nodes)]).all():
+            return order, self._report(None, None, 0, 0.0)
+
+        started = time.perf_counter()
+        distances = self._local_matrix(matrix, order, start, end)
+        # 路径上的位置：0为起点，len(order)+1为终点，其余为景点在order中的位置加1
+        path = list(range(len(order) + 2))
+        greedy_distance = self._path_length(distances, path)
+
+        moves = 0
+        if len(order) >= 2:
+            neighbors = self._neighbor_lists(distances)
+            budget_deadline = started + self.time_budget_ms / 1000.0
+            deadline = budget_deadline if deadline is None else min(deadline, budget_deadline)
+            while time.perf_counter() < deadline:
+                if self._two_opt_pass(distances, path, neighbors) or \
+                        self._or_opt_pass(distances, path, neighbors):
+                    moves += 1
+                    continue
+                break
+
+        improved_order = [order[node - 1] for node in path[1:-1]]
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        return improved_order, self._report(greedy_distance, self._path_length(distances, path), moves, elapsed_ms)
+
+    def rescore(self, report, matrix, order, start=None, end=None):
+        """
+        路线顺序在改进之后又被调整（例如按开放时间重新排程）时，按最终顺序重新计算报告中
+        改进后路线的距离，贪心路线距离、移动次数和耗时保持不变
+        """
+        order = [int(i) for i in order]
+        nodes = order + [i for i in (start, end) if i is not None]
+        if report['greedy_distance_km'] is None or not np.isfinite(matrix.matrix[np.ix_(nodes, nodes)]).all():
+            return self._report(None, None, report['moves'], report['time_ms'])
+        distances = self._local_matrix(matrix, order, start, end)
+        optimized_distance = self._path_length(distances, list(range(len(order) + 2)))
+        return self._report(report['greedy_distance_km'], optimized_distance, report['moves'], report['time_ms'])
+
+    def _local_matrix(self, matrix, order, start, end):
+        """
+        取出本条路线涉及的子矩阵，未固定的起点或终点用与所有景点距离为0的虚拟节点表示
+        """
+        size = len(order) + 2
+        distances = np.zeros((size, size))
+        nodes = [start] + order + [end]
+        fixed = [position for position, node in enumerate(nodes) if node is not None]
+        indices = [nodes[position] for position in fixed]
+        distances[np.ix_(fixed, fixed)] = matrix.matrix[np.ix_(indices, indices)]
+        return distances
+
+    def _neighbor_lists(self, distances):
+        """
+        每个节点按距离从近到远的近邻列表（不含自身）
+        """
+        count = min(self.neighbor_count, len(distances) - 1)
+        ranked = np.argsort(distances, axis=1, kind='stable')
+        return [[int(j) for j in ranked[i] if j != i][:count] for i in range(len(distances))]
+
+    @staticmethod
+    def _path_length(distances, path):
+        return float(distances[path[:-1], path[1:]].sum())
+
+    def _two_opt_pass(self, distances, path, neighbors):
+        """
+        找到第一个能缩短路线的2-opt移动并执行，返回是否有改进
+        """
+        last = len(path) - 2
+        position = {node: index for index, node in enumerate(path)}
+        for i in range(1, len(path)):
+            a, b = path[i - 1], path[i]
+            removed = distances[a, b]
+            # 新边 (a, c)：反转 path[i..j]，其中c = path[j]
+            for c in neighbors[a]:
+                if distances[a, c] >= removed:
+                    break
+                j = position[c]
+                if i < j <= last:
+                    delta = distances[a, c] + distances[b, path[j + 1]] - removed - distances[c, path[j + 1]]
+                    if delta < -IMPROVEMENT_EPSILON:
+                        path[i:j + 1] = path[i:j + 1][::-1]
+                        return True
+            # 新边 (c, b)：反转 path[m..i-1]，其中c = path[m]
+            for c in neighbors[b]:
+                if distances[b, c] >= removed:
+                    break
+                m = position[c]
+                if 1 <= m < i - 1:
+                    delta = distances[c, b] + distances[path[m - 1], a] - removed - distances[path[m - 1], c]
+                    if delta < -IMPROVEMENT_EPSILON:
+                        path[m:i] = path[m:i][::-1]
+                        return True
+        return False
+
+    def _or_opt_pass(self, distances, path, neighbors):
+        """
+        找到第一个能缩短路线的Or-opt移动（可反向插入）并执行，返回是否有改进
+        """
+        last = len(path) - 2
+        position = {node: index for index, node in enumerate(path)}
+        for length in range(1, OR_OPT_MAX_SEGMENT + 1):
+            for i in range(1, last - length + 2):
+                e = i + length - 1
+                first, tail = path[i], path[e]
+                before, after = path[i - 1], path[e + 1]
+                gain = distances[before, first] + distances[tail, after] - distances[before, after]
+                if gain <= IMPROVEMENT_EPSILON:
+                    continue
+
+                # 候选插入位置：与段首或段尾的近邻相邻的边 (path[q], path[q+1])
+                edges = set()
+                for c in neighbors[first] + neighbors[tail]:
+                    q = position[c]
+                    edges.update((q - 1, q))
+                for q in sorted(edges):
+                    if q < 0 or q > last or i - 1 <= q <= e:
+                        continue
+                    x, y = path[q], path[q + 1]
+                    forward = distances[x, first] + distances[tail, y] - distances[x, y]
+                    backward = distances[x, tail] + distances[first, y] - distances[x, y]
+                    if min(forward, backward) - gain < -IMPROVEMENT_EPSILON:
+                        segment = path[i:e + 1]
+                        if backward < forward:
+                            segment.reverse()
+                        rest = path[:i] + path[e + 1:]
+                        insert_at = q + 1 if q < i else q - length + 1
+                        path[:] = rest[:insert_at] + segment + rest[insert_at:]
+                        return True
+        return False
+
+    @staticmethod
+    def _report(greedy_distance, optimized_distance, moves, elapsed_ms):
+        if greedy_distance is None:
+            reduction = 0.0
+        else:
+            reduction = greedy_distance - optimized_distance
+        return {
+            'greedy_distance_km': None if greedy_distance is None else round(greedy_distance, 3),
+            'optimized_distance_km': None if optimized_distance is None else round(optimized_distance, 3),
+            'reduction_km': round(reduction, 3),
+            'reduction_ratio': round(reduction / greedy_distance, 4) if greedy_distance else 0.0,
+            'moves': moves,
+            'time_ms': round(elapsed_ms, 2)
+        }
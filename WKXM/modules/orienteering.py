@@ -0,0 +1,156 @@
+import os
+import time
+
+import numpy as np
+
+
+class OrienteeringSelector:
+    """
+    多日定向越野（Team Orienteering）式的景点选择
+
+    候选景点多于行程能容纳的数量时，在每天的时间预算（游玩时长加景点间移动时间）内
+    选出奖励之和尽量大的景点子集。先逐天按"奖励/新增耗时"最高的可行插入构造路线，
+    再在时间限制内反复尝试把未选景点插入有空余时间的路线、或替换路线中奖励更低的景点；
+    最终未被选中的景点按奖励从高到低作为备选返回
+    """
+    def __init__(self, time_limit_ms=None):
+        if time_limit_ms is None:
+            time_limit_ms = float(os.getenv('ORIENTEERING_TIME_LIMIT_MS', 30))
+        self.time_limit_ms = time_limit_ms
+
+    def select(self, prizes, durations, travel, days, budget_minutes, max_visits=None, deadline=None):
+        """
+        prizes、durations为每个候选景点的奖励和游玩时长（分钟），travel为候选景点之间的移动时间矩阵（分钟），
+        deadline为time.perf_counter()表示的截止时刻，早于自身时间限制时提前结束改进
+
+        返回 (每天的景点顺序列表, 按奖励从高到低排列的未选景点)，景点均以在候选数组中的下标表示
+        """
+        started = time.perf_counter()
+        prizes = np.asarray(prizes, dtype=float)
+        durations = np.asarray(durations, dtype=float)
+        travel = np.asarray(travel, dtype=float)
+        max_visits = max_visits or len(prizes)
+        unvisited = np.ones(len(prizes), dtype=bool)
+
+        routes = []
+        for _ in range(days):
+            route = []
+            self._insert_until_full(route, prizes, durations, travel, unvisited, budget_minutes, max_visits)
+            routes.append(route)
+
+        limit = started + self.time_limit_ms / 1000.0
+        deadline = limit if deadline is None else min(deadline, limit)
+        while unvisited.any() and time.perf_counter() < deadline:
+            improved = False
+            for route in routes:
+                if self._replace_best(route, prizes, durations, travel, unvisited, budget_minutes):
+                    improved = True
+                if self._insert_until_full(route, prizes, durations, travel, unvisited, budget_minutes, max_visits):
+                    improved = True
+                if time.perf_counter() >= deadline:
+                    break
+            if not improved:
+                break
+
+        alternates = np.flatnonzero(unvisited)
+        alternates = alternates[np.argsort(-prizes[alternates], kind='stable')].tolist()
+        return routes, alternates
+
+    @staticmethod
+    def route_minutes(route, durations, travel):
+        """
+        路线的总耗时：游玩时长加相邻景点之间的移动时间
+        """
+        if not route:
+            return 0.0
+        route = np.asarray(route)
+        return float(durations[route].sum() + travel[route[:-1], route[1:]].sum())
+
+    @staticmethod
+    def _insertion_costs(route, candidates, durations, travel):
+        """
+        候选景点插入路线每个位置新增的耗时，返回形状为 (候选数, 路线长度+1) 的矩阵
+        """
+        if not route:
+            return durations[candidates][:, None].copy()
+        nodes = np.asarray(route)
+        length = len(nodes)
+        # from_route[c, p]：路线第p个景点到候选c；to_route[c, p]：候选c到路线第p个景点
+        from_route = travel[np.ix_(nodes, candidates)].T
+        to_route = travel[np.ix_(candidates, nodes)]
+        costs = np.empty((len(candidates), length + 1))
+        costs[:, 0] = to_route[:, 0]
+        costs[:, length] = from_route[:, length - 1]
+        if length > 1:
+            costs[:, 1:length] = from_route[:, :-1] + to_route[:, 1:] - travel[nodes[:-1], nodes[1:]]
+        costs += durations[candidates][:, None]
+        return costs
+
+    def _insert_until_full(self, route, prizes, durations, travel, unvisited, budget_minutes, max_visits):
+        """
+        反复把"奖励/新增耗时"最高的可行候选插入到路线中耗时增加最少的位置，返回是否插入了景点
+        """
+        inserted = False
+        used = self.route_minutes(route, durations, travel)
+        while len(route) < max_visits:
+            candidates = np.flatnonzero(unvisited)
+            if not len(candidates):
+                break
+            costs = self._insertion_costs(route, candidates, durations, travel)
+            positions = np.argmin(costs, axis=1)
+            added = costs[np.arange(len(candidates)), positions]
+            feasible = used + added <= budget_minutes
+            if not feasible.any():
+                break
+            ratios = np.where(feasible, prizes[candidates] / (added + 1), -np.inf)
+            best = int(np.argmax(ratios))
+            route.insert(int(positions[best]), int(candidates[best]))
+            unvisited[candidates[best]] = False
+            used += added[best]
+            inserted = True
+        return inserted
+
+    def _replace_best(self, route, prizes, durations, travel, unvisited, budget_minutes):
+        """
+        在预算允许的前提下，用奖励更高的未选景点替换路线中某个景点，选择奖励增加最多的一次替换执行
+        """
+        candidates = np.flatnonzero(unvisited)
+        if not route or not len(candidates):
+            return False
+        used = self.route_minutes(route, durations, travel)
+        best = None
+        for position, spot in enumerate(route):
+            better = candidates[prizes[candidates] > prizes[spot]]
+            if not len(better):
+                continue
+            before = route[position - 1] if position > 0 else None
+            after = route[position + 1] if position + 1 < len(route) else None
+
+            # 去掉该景点节省的时间，以及候选景点放到同一位置新增的时间
+            removed = durations[spot]
+            added = durations[better].copy()
+            if before is not None:
+                removed += travel[before, spot]
+                added += travel[before, better]
+            if after is not None:
+                removed += travel[spot, after]
+                added += travel[better, after]
+            if before is not None and after is not None:
+                removed -= travel[before, after]
+                added -= travel[before, after]
+
+            feasible = used - removed + added <= budget_minutes
+            if not feasible.any():
+                continue
+            gains = np.where(feasible, prizes[better] - prizes[spot], -np.inf)
+            choice = int(np.argmax(gains))
+            if best is None or gains[choice] > best[0]:
+                best = (gains[choice], position, int(better[choice]))
+
+        if best is None:
+            return False
+        _, position, replacement = best
+        unvisited[route[position]] = True
+        unvisited[replacement] = False
+        route[position] = replacement
+        return True
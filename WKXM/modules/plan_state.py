@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class PlanState:
+    """
+    一份已生成行程的规划状态，供增量重新规划复用
+
+    保存行程涉及景点的规划上下文（景点列式表和按需构建的距离矩阵）、每天的景点下标顺序、
+    每天的出发/返回地点、备选景点和未能安排的景点，以及用户固定到某天的景点
+    """
+    def __init__(self, ctx, day_orders, day_bases, day_alternates, unscheduled, daily_plans):
+        self.ctx = ctx
+        self.day_orders = day_orders
+        # 每天的出发和返回地点（景点下标），None表示不固定
+        self.day_bases = day_bases
+        # 每天的备选景点下标，原行程中没有备选的天为None
+        self.day_alternates = day_alternates
+        self.unscheduled = unscheduled
+        self.daily_plans = daily_plans
+        # 景点下标 -> 用户固定的天（从0开始）
+        self.pinned = {}
+        # 同一份行程的编辑依次执行
+        self.lock = threading.Lock()
+
+    def snapshot(self):
+        """
+        复制编辑会修改的字段，编辑失败时用restore恢复到编辑前的状态
+        """
+        return ([list(order) for order in self.day_orders], list(self.day_bases),
+                [None if alternates is None else list(alternates) for alternates in self.day_alternates],
+                list(self.unscheduled), list(self.daily_plans), dict(self.pinned))
+
+    def restore(self, snapshot):
+        (self.day_orders, self.day_bases, self.day_alternates,
+         self.unscheduled, self.daily_plans, self.pinned) = snapshot
+
+
+class PlanStateStore:
+    """
+    进程内的规划状态缓存，按行程ID保存，按条目数和有效期淘汰
+    """
+    def __init__(self, max_entries=None, ttl=None):
+        self.max_entries = max_entries or int(os.getenv('PLAN_STATE_MAX_ENTRIES', 256))
+        self.ttl = ttl or float(os.getenv('PLAN_STATE_TTL', 3600))
+        self._lock = threading.Lock()
+        # 行程ID -> (过期时间, 规划状态)
+        self._entries = OrderedDict()
+
+    def get(self, itinerary_id):
+        with self._lock:
+            entry = self._entries.get(itinerary_id)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[itinerary_id]
+                return None
+            self._entries.move_to_end(itinerary_id)
+            return entry[1]
+
+    def put(self, itinerary_id, state):
+        with self._lock:
+            self._entries.pop(itinerary_id, None)
+            self._entries[itinerary_id] = (time.time() + self.ttl, state)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_plan_state_store = None
+_plan_state_store_lock = threading.Lock()
+
+
+def get_plan_state_store():
+    """
+    获取进程级共享的规划状态缓存
+    """
+    global _plan_state_store
+    with _plan_state_store_lock:
+        if _plan_state_store is None:
+            _plan_state_store = PlanStateStore()
+        return _plan_state_store
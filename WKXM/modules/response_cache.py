@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    基于文件的持久化响应缓存
+
+    每个条目保存为缓存目录下的一个紧凑JSON文件，文件名为键的哈希值；
+    条目带有独立的过期时间，总大小超过字节预算时按最近访问时间（文件mtime）淘汰
+    """
+    def __init__(self, cache_dir, max_bytes=50 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # 文件名 -> [字节数, 最近访问时间]，首次使用时从目录扫描构建
+        self._index = None
+        self._total_bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'writes': 0, 'evictions': 0}
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        将任意可JSON序列化的参数组合成稳定的缓存键
+        """
+        raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index = {}
+        self._total_bytes = 0
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, filename))
+            except OSError:
+                continue
+            self._index[filename] = [stat.st_size, stat.st_mtime]
+            self._total_bytes += stat.st_size
+
+    def get(self, key):
+        """
+        读取未过期的缓存值，不存在或已过期时返回None
+        """
+        path = self._path(key)
+        with self._lock:
+            self._load_index()
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self.stats['misses'] += 1
+                return None
+
+            if entry.get('expires_at', 0) < time.time():
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                self._remove(os.path.basename(path))
+                return None
+
+            # 更新访问时间，作为LRU淘汰依据
+            now = time.time()
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+            filename = os.path.basename(path)
+            if filename in self._index:
+                self._index[filename][1] = now
+            self.stats['hits'] += 1
+            return entry.get('value')
+
+    def set(self, key, value, ttl):
+        """
+        写入缓存值，ttl单位为秒
+        """
+        path = self._path(key)
+        filename = os.path.basename(path)
+        data = json.dumps({'expires_at': time.time() + ttl, 'value': value},
+                          ensure_ascii=False, separators=(',', ':'))
+        size = len(data.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._load_index()
+            # 先写临时文件再替换，避免并发读取到不完整的内容
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+            old = self._index.get(filename)
+            if old:
+                self._total_bytes -= old[0]
+            self._index[filename] = [size, time.time()]
+            self._total_bytes += size
+            self.stats['writes'] += 1
+            self._evict()
+
+    def _remove(self, filename):
+        entry = self._index.pop(filename, None) if self._index is not None else None
+        if entry:
+            self._total_bytes -= entry[0]
+        try:
+            os.remove(os.path.join(self.cache_dir, filename))
+        except OSError:
+            pass
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        # 按最近访问时间从旧到新淘汰，直到回到预算以内
+        for filename, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            self._remove(filename)
+            self.stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._load_index()
+            for filename in list(self._index):
+                self._remove(filename)
+
+    def get_stats(self):
+        with self._lock:
+            self._load_index()
+            total = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'entries': len(self._index),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hit_rate': round(self.stats['hits'] / total, 4) if total else 0.0
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(namespace, max_bytes=None):
+    """
+    获取按命名空间共享的进程级缓存实例，缓存目录为cache/<namespace>
+    """
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            env_name = f'{namespace.upper()}_CACHE_MAX_BYTES'
+            max_bytes = max_bytes or int(os.getenv(env_name, 50 * 1024 * 1024))
+            cache = ResponseCache(os.path.join('cache', namespace), max_bytes)
+            _caches[namespace] = cache
+        return cache
@@ -1,10 +1,105 @@
+import itertools
 import math
+import os
+import time
 import numpy as np
 from datetime import datetime, timedelta
 from geopy.distance import geodesic
 import random
 import copy
+from concurrent.futures.process import BrokenProcessPool
+from .accommodation import AccommodationSelector
 from .api_integration import APIIntegration
+from .concurrency import discard_executor, get_process_pool
+from .distance_matrix import DistanceMatrix, haversine_matrix
+from .day_partitioner import BalancedKMedoids
+from .local_search import LocalSearch
+from .orienteering import OrienteeringSelector
+from .plan_state import PlanState
+from .time_window_scheduler import TimeWindowScheduler
+from .travel_time_cache import get_travel_time_cache
+from .spot_table import SpotTable, parse_location, parse_duration_hours, parse_rating
+
+# 含有随机步骤、多起点规划能得到不同结果的规划方式
+RANDOMIZED_STRATEGIES = ('greedy', 'partition')
+# 用户固定到某天的景点在调度时附加的奖励，保证可行时优先安排
+PINNED_PRIZE = 1e6
+# 进程池中执行多起点规划的规划器，每个进程创建一次
+_restart_planner = None
+
+
+def _plan_restart(task):
+    """
+    进程池中执行的一次多起点规划，挂载父进程共享的距离矩阵
+    """
+    global _restart_planner
+    spots, hotels, days, preferences, seed, strategy, handle = task
+    if _restart_planner is None:
+        _restart_planner = RoutePlanningModule()
+    ctx = _restart_planner._build_context(spots, seed, hotels=hotels)
+    if handle is not None:
+        ctx._matrix = DistanceMatrix.attach(ctx.table.lats, ctx.table.lngs, handle)
+    try:
+        return _restart_planner._plan_with_context(ctx, days, preferences, strategy)
+    finally:
+        if handle is not None:
+            ctx.matrix.release()
+
+class _PlanContext:
+    """
+    单次规划的上下文：景点列式表、距离矩阵，以及每天的起点和住宿区域（均为景点下标）
+    """
+    def __init__(self, table, rating_scores, duration_scores, rng=random):
+        self.table = table
+        self._matrix = None
+        # 与已选景点无关的选择分数：评分分数和游玩时长适宜性分数
+        self.rating_scores = rating_scores
+        self.duration_scores = duration_scores
+        self.start = None
+        self.end = None
+        # 随机数来源：指定种子时为独立的random.Random实例，否则使用全局random模块
+        self.rng = rng
+        # 按时间预算规划时的截止时刻（time.perf_counter()），None表示不限制
+        self.deadline = None
+        # 可作为每天出发和返回地点的酒店候选（均有坐标）
+        self.hotels = []
+    
+    @property
+    def spots(self):
+        return self.table.spots
+    
+    @property
+    def matrix(self):
+        """
+        景点两两之间的距离矩阵，首次使用时构建；先聚类的规划只在缩小后的候选集上构建
+        """
+        if self._matrix is None:
+            self._matrix = DistanceMatrix(self.table.lats, self.table.lngs)
+        return self._matrix
+    
+    def best_rated(self, indices):
+        """
+        返回评分最高的景点下标，评分相同时取靠前的景点
+        """
+        return indices[int(np.argmax(self.table.ratings[indices]))]
+    
+    def nearest_position(self, from_index, candidates, available):
+        """
+        在available标记为可用的候选中返回离from_index最近的一个在candidates中的位置，
+        距离相同时取靠前的候选
+        """
+        positions = np.flatnonzero(available)
+        return int(positions[np.argmin(self.matrix.matrix[from_index, candidates[positions]])])
+    
+    def best_rated_position(self, candidates, available):
+        """
+        在available标记为可用的候选中返回评分最高的一个在candidates中的位置
+        """
+        positions = np.flatnonzero(available)
+        return int(positions[np.argmax(self.table.ratings[candidates[positions]])])
+    
+    def to_spots(self, order):
+        return self.table.to_spots(order)
 
 class RoutePlanningModule:
     def __init__(self):
@@ -20,285 +115,674 @@ class RoutePlanningModule:
         self.theme_weight = 0.3
         # 地理邻近性权重配置
         self.geography_weight = 0.7
-        # 每天的默认起始和结束地点（用于住宿位置）
-        self.daily_start_point = None
-        self.daily_end_point = None
+        # 每天路线顺序的局部搜索改进器（2-opt / Or-opt）
+        self.local_search = LocalSearch()
+        # 候选景点数量达到该值时先聚类划分每天的游览范围
+        self.partition_min_spots = int(os.getenv('DAY_PARTITION_MIN_SPOTS', 60))
+        # 聚类后每天保留的候选景点数为每天景点上限的倍数
+        self.partition_pool_factor = 3
+        self.partitioner = BalancedKMedoids()
+        # 景点多于行程能容纳的数量时使用的定向越野式选点
+        self.selector = OrienteeringSelector()
+        # 景点间实际交通时间缓存，未命中时按校准的绕行系数估算并在后台补全
+        self.travel_times = get_travel_time_cache(self.api)
+        # 考虑景点开放时间和每天可用时间的调度器
+        self.scheduler = TimeWindowScheduler(
+            day_start_minute=int(self.daily_time_range[0] * 60),
+            day_end_minute=int(self.daily_time_range[1] * 60),
+            fallback_transfer_minutes=self.avg_transfer_time * 60,
+            travel_times=self.travel_times
+        )
+        # 从酒店候选中选择每天出发和返回的住宿地点，长行程允许中途更换一次
+        self.accommodation = AccommodationSelector()
+        self.hotel_candidate_limit = int(os.getenv('HOTEL_CANDIDATE_LIMIT', 30))
+        # 未指定时每次规划的多起点次数
+        self.plan_restarts = int(os.getenv('PLAN_RESTARTS', 1))
+        # 未指定时每次规划的时间预算（毫秒），0表示不限制
+        self.plan_time_budget_ms = float(os.getenv('PLAN_TIME_BUDGET_MS', 0))
+        # 最近一次按时间预算规划的迭代报告
+        self.last_planning_report = None
+        # 多起点规划比较行程时，每公里路线距离抵扣的景点得分
+        self.restart_distance_weight = float(os.getenv('PLAN_RESTART_DISTANCE_WEIGHT', 0.2))
     
-    def plan_route(self, spots, days, preferences=None):
+    def plan_route(self, spots, days, preferences=None, seed=None, restarts=None, time_budget_ms=None,
+                   city=None, hotels=None):
         """
-        规划旅游路线
+        规划旅游路线，指定seed时相同输入总是得到相同的行程
+
+        restarts（未指定时为PLAN_RESTARTS）大于1且规划过程含有随机步骤时，用由seed派生的不同种子在进程池中并行规划多次，
+        返回景点得分与路线距离综合最优的行程
+
+        time_budget_ms（未指定时为PLAN_TIME_BUDGET_MS，0表示不限制）给定时按时间预算规划：先得到一个可行行程，
+        在预算内持续改进，迭代次数和改进幅度记录在last_planning_report中
+
+        hotels为酒店候选列表，未提供时按city搜索酒店；有坐标的酒店候选中选出通勤距离最小的住宿地点，
+        作为每天的出发和返回地点
         """
+        self.last_planning_report = None
         if not spots or days <= 0:
             return []
+        started = time.perf_counter()
         
         # 复制景点列表，避免修改原始数据
         spots_copy = copy.deepcopy(spots)
+        # 本次规划的上下文，各启发式算法通过下标访问景点和距离矩阵
+        if hotels is None and city:
+            hotels = self._search_hotel_candidates(city)
+        ctx = self._build_context(spots_copy, seed, hotels=self._usable_hotels(hotels or []))
+        strategy = self._planning_strategy(ctx, days)
         
-        # 计算每天应该安排的景点数量
-        total_spots = len(spots_copy)
-        daily_plans = []
+        time_budget_ms = self.plan_time_budget_ms if time_budget_ms is None else time_budget_ms
+        if time_budget_ms:
+            return self._plan_anytime(ctx, days, preferences, seed, strategy, time_budget_ms, started)
         
-        # 如果景点数量不足以填满天数，每天安排2-3个景点
+        restarts = self.plan_restarts if restarts is None else restarts
+        if restarts > 1 and strategy in RANDOMIZED_STRATEGIES:
+            return self._plan_with_restarts(ctx, days, preferences, seed, restarts, strategy)
+        return self._plan_with_context(ctx, days, preferences, strategy)
+    
+    def _planning_strategy(self, ctx, days):
+        """
+        根据景点数量和总游玩时间选择规划方式
+        """
+        total_spots = len(ctx.spots)
         if total_spots <= days * self.spots_per_day_range[0]:
-            daily_plan_count = min(total_spots, days * self.spots_per_day_range[0])
-            spots_per_day = max(1, daily_plan_count // days)
+            # 景点数量不足以填满天数
+            return 'simple'
+        if total_spots >= self.partition_min_spots and total_spots > days * self.spots_per_day_range[1]:
+            # 候选景点很多（例如整个省份）、远超行程能游览的数量时先聚类划分每天的游览范围
+            return 'partition'
+        if self._exceeds_trip_capacity(ctx, days):
+            # 景点多于行程能容纳的数量时，按每天的时间预算选择奖励最高的景点子集
+            return 'orienteering'
+        return 'greedy'
+    
+    def _plan_with_context(self, ctx, days, preferences, strategy):
+        if strategy == 'simple':
+            return self._simple_route_planning(ctx, days)
+        if strategy == 'partition':
+            return self._partitioned_route_planning(ctx, days, preferences)
+        if strategy == 'orienteering':
+            return self._orienteering_route_planning(ctx, days, preferences)
+        # 使用更复杂的算法进行优化规划
+        return self._optimize_route_planning(ctx, days, preferences)
+    
+    def _simple_route_planning(self, ctx, days):
+        """
+        景点数量不足以填满天数时，每天按顺序分配少量景点
+        """
+        total_spots = len(ctx.spots)
+        daily_plan_count = min(total_spots, days * self.spots_per_day_range[0])
+        spots_per_day = max(1, daily_plan_count // days)
+        
+        # 分配景点到每天
+        remaining_spots = list(range(total_spots))
+        day_orders = []
+        for day in range(days):
+            if not remaining_spots:
+                # 如果没有景点了，结束循环
+                break
             
-            # 分配景点到每天
-            remaining_spots = spots_copy
-            for day in range(days):
-                if not remaining_spots:
-                    # 如果没有景点了，结束循环
-                    break
-                
-                # 当天安排的景点数
-                day_spots_count = min(spots_per_day, len(remaining_spots))
-                # 简单分配：从剩余景点中取前N个
-                day_spots = remaining_spots[:day_spots_count]
-                remaining_spots = remaining_spots[day_spots_count:]
-                
-                # 对当天景点进行排序
-                sorted_day_spots = self._sort_spots_by_proximity(day_spots)
-                
-                # 生成当天的行程安排
-                daily_plan = self._generate_daily_plan(sorted_day_spots, day + 1)
-                daily_plans.append(daily_plan)
+            # 当天安排的景点数
+            day_spots_count = min(spots_per_day, len(remaining_spots))
+            # 简单分配：从剩余景点中取前N个
+            day_spots = remaining_spots[:day_spots_count]
+            remaining_spots = remaining_spots[day_spots_count:]
             
-            # 如果还有剩余天数，生成空的行程安排
-            for day in range(len(daily_plans), days):
-                daily_plan = {
-                    'day': day + 1,
-                    'spots': [],
-                    'schedule': [],
-                    'summary': '自由活动或休息'
-                }
-                daily_plans.append(daily_plan)
-        else:
-            # 使用更复杂的算法进行优化规划
-            daily_plans = self._optimize_route_planning(spots_copy, days, preferences)
+            # 对当天景点进行排序
+            day_orders.append(self._sort_spots_by_proximity(ctx, day_spots))
         
+        # 如果还有剩余天数，当天没有预先分配的景点
+        day_orders.extend([] for _ in range(len(day_orders), days))
+        
+        # 生成每天的行程安排，有酒店候选时每天从住宿地点出发并返回
+        daily_plans, _ = self._build_plans_from_base(ctx, day_orders)
         return daily_plans
     
-    def _optimize_route_planning(self, spots, days, preferences):
+    def _plan_with_restarts(self, ctx, days, preferences, seed, restarts, strategy):
+        """
+        多起点规划：第一次使用seed本身（与restarts=1的结果一致），其余种子由seed派生；
+        各次规划在进程池中并行执行，共享同一份距离矩阵，按目标值选出最优行程，
+        目标值相同时取序号靠前的一次，保证相同seed的结果可复现
+        """
+        seeds = list(itertools.islice(self._derived_seeds(seed), restarts))
+        
+        # 聚类规划只在缩小后的候选集上计算距离，不需要全部景点的距离矩阵
+        handle = ctx.matrix.share() if strategy != 'partition' else None
+        tasks = [(ctx.spots, ctx.hotels, days, preferences, restart_seed, strategy, handle) for restart_seed in seeds]
+        pool = get_process_pool('route_planning')
+        try:
+            results = list(pool.map(_plan_restart, tasks))
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # 工作进程异常退出后进程池不可再用，丢弃后由下一次规划重新创建
+                discard_executor('route_planning', pool)
+            print(f"并行多起点规划失败，改为依次规划: {e}")
+            results = [self._plan_with_context(self._build_context(ctx.spots, restart_seed, hotels=ctx.hotels),
+                                               days, preferences, strategy)
+                       for restart_seed in seeds]
+        finally:
+            if handle is not None:
+                ctx.matrix.release(unlink=True)
+        
+        objectives = [self._plan_objective(plans, preferences) for plans in results]
+        return results[objectives.index(max(objectives))]
+    
+    def _derived_seeds(self, seed):
+        """
+        依次产生每次规划使用的种子：第一个为seed本身，其余由seed派生；seed为None时全部随机
+        """
+        rng = random.Random(seed) if seed is not None else random
+        yield seed if seed is not None else rng.getrandbits(32)
+        while True:
+            yield rng.getrandbits(32)
+    
+    def _plan_anytime(self, ctx, days, preferences, seed, strategy, time_budget_ms, started):
+        """
+        按时间预算规划：第一次迭代使用seed得到可行行程（局部搜索和选点改进在截止时刻前结束），
+        规划含随机步骤时再用派生种子重新分配每天景点或重新聚类，保留目标值最高的行程；
+        预计下一次迭代会超出预算时停止。结果依赖运行耗时，相同seed不保证得到相同行程
+        """
+        ctx.deadline = started + time_budget_ms / 1000.0
+        seeds = self._derived_seeds(seed)
+        next(seeds)
+        
+        iteration_started = time.perf_counter()
+        best = self._plan_with_context(ctx, days, preferences, strategy)
+        initial_objective = best_objective = self._plan_objective(best, preferences)
+        iterations = best_iteration = 1
+        slowest = time.perf_counter() - iteration_started
+        
+        while strategy in RANDOMIZED_STRATEGIES and time.perf_counter() + slowest < ctx.deadline:
+            iteration_started = time.perf_counter()
+            # 重新规划复用已构建的景点表和距离矩阵，只更换随机数来源
+            attempt_ctx = _PlanContext(ctx.table, ctx.rating_scores, ctx.duration_scores, random.Random(next(seeds)))
+            attempt_ctx._matrix = ctx._matrix
+            attempt_ctx.deadline = ctx.deadline
+            attempt_ctx.hotels = ctx.hotels
+            plans = self._plan_with_context(attempt_ctx, days, preferences, strategy)
+            iterations += 1
+            objective = self._plan_objective(plans, preferences)
+            if objective > best_objective:
+                best, best_objective, best_iteration = plans, objective, iterations
+            slowest = max(slowest, time.perf_counter() - iteration_started)
+        
+        self.last_planning_report = {
+            'strategy': strategy,
+            'time_budget_ms': time_budget_ms,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+            'iterations': iterations,
+            'best_iteration': best_iteration,
+            'initial_objective': round(initial_objective, 3),
+            'best_objective': round(best_objective, 3),
+            'improvement': round(best_objective - initial_objective, 3)
+        }
+        return best
+    
+    def _plan_objective(self, daily_plans, preferences):
+        """
+        行程的目标值：已安排景点的得分（评分、季节性评分和偏好匹配）之和减去按权重折算的路线总距离
+        """
+        score = 0.0
+        distance = 0.0
+        for day_plan in daily_plans:
+            ctx = self._build_context(day_plan['spots'])
+            if not len(ctx.spots):
+                continue
+            score += float((ctx.rating_scores + ctx.table.seasonal_scores +
+                            ctx.table.preference_scores(preferences) + 1).sum())
+            day_distance = ctx.matrix.path_length(list(range(len(ctx.spots))))
+            if math.isfinite(day_distance):
+                distance += day_distance
+        return score - self.restart_distance_weight * distance
+    
+    def _build_context(self, spots, seed=None, rng=None, hotels=None):
+        """
+        将景点解析为列式表，距离矩阵在首次使用时构建
+        """
+        table = SpotTable(spots)
+        hours = table.duration_hours
+        # 避免选择游玩时间太长的景点
+        duration_scores = np.where(hours > 2, np.maximum(0, 5 - (hours - 2) * 2), 5)
+        if rng is None:
+            rng = random.Random(seed) if seed is not None else random
+        ctx = _PlanContext(table, table.ratings * 2, duration_scores, rng)
+        ctx.hotels = hotels or []
+        return ctx
+    
+    def _empty_daily_plan(self, day_number):
+        return {
+            'day': day_number,
+            'spots': [],
+            'schedule': [],
+            'summary': '自由活动或休息'
+        }
+    
+    def _optimize_route_planning(self, ctx, days, preferences):
         """
         优化路线规划算法，考虑地理邻近性、主题一致性和时间约束
         """
-        daily_plans = []
-        remaining_spots = spots
+        day_orders = []
+        # 未分配景点的位图，移除和成员判断均为O(1)
+        unassigned = np.ones(len(ctx.spots), dtype=bool)
+        unassigned_count = len(ctx.spots)
         
         # 计算每天应该安排的景点数量
         min_spots_per_day = self.spots_per_day_range[0]
-        max_spots_per_day = min(self.spots_per_day_range[1], len(spots) // days + 1)
+        max_spots_per_day = min(self.spots_per_day_range[1], len(ctx.spots) // days + 1)
         
         # 第一天的起始点设置（通常是住宿区域附近）
-        if remaining_spots:
+        if unassigned_count:
             # 选择评分最高的景点作为起始参考点
-            first_day_start_spot = max(remaining_spots, key=lambda x: float(x.get('rating', '0')))
-            self.daily_start_point = self._get_spot_location(first_day_start_spot)
-            self.daily_end_point = self.daily_start_point  # 结束点也设为住宿区域
+            first_day_start_spot = int(ctx.best_rated(np.arange(len(ctx.spots))))
+            ctx.start = first_day_start_spot
+            ctx.end = first_day_start_spot  # 结束点也设为住宿区域
         
         for day in range(days):
-            if not remaining_spots:
-                # 如果没有景点了，生成空行程
-                daily_plan = {
-                    'day': day + 1,
-                    'spots': [],
-                    'schedule': [],
-                    'summary': '自由活动或休息'
-                }
-                daily_plans.append(daily_plan)
+            if not unassigned_count:
+                # 如果没有景点了，当天为空行程
+                day_orders.append([])
                 continue
             
             # 当天安排的景点数（随机选择一个合理数量）
-            day_spots_count = random.randint(min_spots_per_day, max_spots_per_day)
-            day_spots_count = min(day_spots_count, len(remaining_spots))
+            day_spots_count = ctx.rng.randint(min_spots_per_day, max_spots_per_day)
+            day_spots_count = min(day_spots_count, unassigned_count)
             
             # 使用贪心算法选择当天的景点
-            day_spots = self._select_day_spots(remaining_spots, day_spots_count, preferences)
+            day_spots = self._select_day_spots(ctx, np.flatnonzero(unassigned), day_spots_count, preferences)
             
             # 从剩余景点中移除已选择的景点
-            remaining_spots = [spot for spot in remaining_spots if spot not in day_spots]
+            unassigned[day_spots] = False
+            unassigned_count -= len(day_spots)
             
             # 对当天景点进行排序
-            sorted_day_spots = self._sort_spots_optimally(day_spots)
-            
-            # 生成当天的行程安排
-            daily_plan = self._generate_daily_plan(sorted_day_spots, day + 1)
-            daily_plans.append(daily_plan)
+            sorted_day_spots = self._sort_spots_optimally(ctx, day_spots)
+            day_orders.append(sorted_day_spots)
             
             # 更新次日的起始点（当天最后一个景点）
             if sorted_day_spots:
-                self.daily_start_point = self._get_spot_location(sorted_day_spots[-1])
+                ctx.start = sorted_day_spots[-1]
         
         # 如果还有剩余景点，尝试添加到现有行程中
-        if remaining_spots:
-            daily_plans = self._fill_remaining_spots(daily_plans, remaining_spots)
+        if unassigned_count:
+            day_orders = self._fill_remaining_spots(ctx, day_orders, np.flatnonzero(unassigned).tolist())
+        
+        # 生成每天的行程安排：每天从住宿地点出发并返回
+        daily_plans, _ = self._build_plans_from_base(ctx, day_orders)
+        return daily_plans
+    
+    def _exceeds_trip_capacity(self, ctx, days):
+        """
+        判断景点数量或总游玩时间（含每次移动的固定耗时）是否超过行程能容纳的上限
+        """
+        if len(ctx.spots) > days * self.spots_per_day_range[1]:
+            return True
+        demand = ctx.table.duration_minutes.sum() + len(ctx.spots) * self.scheduler.transfer_overhead_minutes
+        return demand > days * (self.scheduler.day_end_minute - self.scheduler.day_start_minute)
+    
+    def _orienteering_route_planning(self, ctx, days, preferences):
+        """
+        定向越野式规划：奖励为评分、季节性评分和偏好匹配分数之和，每天的游玩和移动时间不超过当天可用时间，
+        未选中的景点作为备选，按奖励从高到低附在离其最近的一天
+        """
+        prizes = ctx.rating_scores + ctx.table.seasonal_scores + ctx.table.preference_scores(preferences) + 1
+        travel = self.scheduler.travel_minutes(ctx.matrix.matrix)
+        budget = self.scheduler.day_end_minute - self.scheduler.day_start_minute
+        day_orders, alternates = self.selector.select(
+            prizes, ctx.table.duration_minutes, travel, days, budget, self.spots_per_day_range[1], ctx.deadline
+        )
         
+        ctx.end = int(ctx.best_rated(np.arange(len(ctx.spots))))
+        daily_plans, ctx = self._build_plans_from_base(ctx, day_orders)
+        
+        # 每个备选景点附在所选景点离它最近的一天
+        visited_days = [(day, order) for day, order in enumerate(day_orders) if order]
+        for plan in daily_plans:
+            plan['alternates'] = []
+        for spot_index in alternates:
+            if not visited_days:
+                break
+            day, _ = min(visited_days, key=lambda item: ctx.matrix.matrix[spot_index, item[1]].min())
+            daily_plans[day]['alternates'].append(ctx.spots[spot_index])
         return daily_plans
     
-    def _select_day_spots(self, spots, count, preferences):
+    def _build_plans_from_base(self, ctx, day_orders, day_anchors=None):
+        """
+        生成每天的行程：有酒店候选时每天从选定的住宿地点出发并返回；否则给定day_anchors时每天从对应的景点
+        出发并返回，未给定时以评分最高的景点（ctx.end）作为住宿区域，每天从前一天最后一个景点出发，最后回到住宿区域
+        返回 (每天的行程, 生成行程使用的规划上下文)
+        """
+        day_hotels = self._select_accommodation(ctx, day_orders)
+        if day_hotels is None:
+            if day_anchors is not None:
+                return self._build_daily_plans(ctx, day_orders, day_anchors=day_anchors), ctx
+            return self._build_daily_plans(ctx, day_orders, ctx.end, ctx.end), ctx
+        
+        # 酒店追加在景点之后作为路线的固定起终点，景点下标保持不变
+        base_ctx = self._build_context(ctx.spots + ctx.hotels, rng=ctx.rng, hotels=ctx.hotels)
+        base_ctx.deadline = ctx.deadline
+        anchors = [len(ctx.spots) + hotel for hotel in day_hotels]
+        daily_plans = self._build_daily_plans(base_ctx, day_orders, day_anchors=anchors)
+        for daily_plan, hotel in zip(daily_plans, day_hotels):
+            daily_plan['accommodation'] = ctx.hotels[hotel]
+        return daily_plans, base_ctx
+    
+    def _select_accommodation(self, ctx, day_orders):
         """
-        选择当天要游览的景点
+        按每天景点的中心选择住宿地点，返回每天住宿地点在ctx.hotels中的下标，无法选择时返回None
         """
-        if len(spots) <= count:
-            return spots[:count]
+        if not ctx.hotels:
+            return None
+        table = ctx.table
+        valid = (table.lats != 0) & (table.lngs != 0)
+        centroid_lats = np.zeros(len(day_orders))
+        centroid_lngs = np.zeros(len(day_orders))
+        active = np.zeros(len(day_orders), dtype=bool)
+        for day, order in enumerate(day_orders):
+            located = [i for i in order if valid[i]]
+            if located:
+                centroid_lats[day] = table.lats[located].mean()
+                centroid_lngs[day] = table.lngs[located].mean()
+                active[day] = True
+        if not active.any():
+            return None
+        
+        locations = [parse_location(hotel) for hotel in ctx.hotels]
+        day_hotels, _ = self.accommodation.select(
+            [lat for lat, _ in locations], [lng for _, lng in locations], centroid_lats, centroid_lngs, active
+        )
+        return day_hotels
+    
+    def _search_hotel_candidates(self, city):
+        """
+        通过APIIntegration.search_hotels（带缓存）获取酒店候选，失败时返回空列表
+        """
+        try:
+            return self.api.search_hotels(city) or []
+        except Exception as e:
+            print(f"获取酒店候选失败: {e}")
+            return []
+    
+    def _usable_hotels(self, hotels):
+        """
+        保留有坐标的酒店候选，最多hotel_candidate_limit个
+        """
+        usable = []
+        for hotel in hotels:
+            if isinstance(hotel, dict) and all(parse_location(hotel)):
+                usable.append(dict(hotel))
+            if len(usable) >= self.hotel_candidate_limit:
+                break
+        return usable
+    
+    def _partitioned_route_planning(self, ctx, days, preferences):
+        """
+        先聚类再规划：用均衡k-medoids把候选景点划分为每天一个地理上紧凑的区域，
+        每天只在所属区域离中心最近的若干景点中按游玩时长容量选择景点
+        """
+        table = ctx.table
+        # 每个景点占用的时间：游玩时长加一次移动的固定耗时
+        weights = table.duration_minutes + self.scheduler.transfer_overhead_minutes
+        # 按时间预算规划时，聚类最多使用剩余时间的一半，其余留给每天的选点和排序
+        fit_deadline = None
+        if ctx.deadline is not None:
+            now = time.perf_counter()
+            fit_deadline = now + max(0.0, ctx.deadline - now) / 2
+        medoids, labels = self.partitioner.fit(table.lats, table.lngs, days, weights, ctx.rng, fit_deadline)
+        if not len(medoids):
+            # 没有可用坐标时无法聚类，景点数量超过行程容量，直接按时间预算选择景点
+            return self._orienteering_route_planning(ctx, days, preferences)
+        
+        # 每个区域保留中心景点和离中心最近的若干景点作为当天的候选
+        pool_size = self.spots_per_day_range[1] * self.partition_pool_factor
+        pools = []
+        for cluster, medoid in enumerate(medoids):
+            members = np.flatnonzero((labels == cluster) & (np.arange(len(labels)) != medoid))
+            distances = haversine_matrix([table.lats[medoid]], [table.lngs[medoid]],
+                                         table.lats[members], table.lngs[members])[0]
+            pools.append([int(medoid)] + members[np.argsort(distances, kind='stable')[:pool_size - 1]].tolist())
+        
+        # 从评分最高景点所在的区域开始，按区域中心的最近邻顺序安排每天
+        medoid_distances = haversine_matrix(table.lats[medoids], table.lngs[medoids])
+        current = int(labels[ctx.best_rated(np.flatnonzero(labels >= 0))])
+        day_clusters = [current]
+        while len(day_clusters) < len(medoids):
+            distances = medoid_distances[current].copy()
+            distances[day_clusters] = np.inf
+            current = int(np.argmin(distances))
+            day_clusters.append(current)
+        
+        # 后续规划只在各天的候选景点之间计算距离
+        sub_ctx = self._build_context(ctx.to_spots([i for c in day_clusters for i in pools[c]]), rng=ctx.rng,
+                                      hotels=ctx.hotels)
+        sub_ctx.deadline = ctx.deadline
+        day_orders = []
+        anchors = []
+        offset = 0
+        for cluster in day_clusters:
+            candidates = list(range(offset, offset + len(pools[cluster])))
+            offset += len(candidates)
+            # 以区域中心作为当天选点的出发地点
+            sub_ctx.start = sub_ctx.end = candidates[0]
+            selected = self._select_day_spots(sub_ctx, candidates, self.spots_per_day_range[1], preferences)
+            selected = self._fit_day_capacity(sub_ctx, selected)
+            day_orders.append(self._sort_spots_optimally(sub_ctx, selected))
+            anchors.append(candidates[0])
+        
+        # 有坐标的景点少于天数时，剩余的天没有安排
+        day_orders.extend([] for _ in range(len(day_orders), days))
+        anchors.extend(None for _ in range(len(anchors), days))
+        # 有酒店候选时每天从选定的住宿地点出发并返回，否则以区域中心作为出发和返回地点
+        daily_plans, _ = self._build_plans_from_base(sub_ctx, day_orders, day_anchors=anchors)
+        return daily_plans
+    
+    def _fit_day_capacity(self, ctx, spots):
+        """
+        按选择顺序保留游玩时长和移动时间之和不超过当天可用时间的景点，至少保留一个
+        """
+        capacity = self.scheduler.day_end_minute - self.scheduler.day_start_minute
+        used = 0
+        for count, spot_index in enumerate(spots):
+            used += ctx.table.duration_minutes[spot_index]
+            if count > 0:
+                used += self.scheduler.travel_minutes(ctx.matrix.distance(spots[count - 1], spot_index))
+            if used > capacity:
+                return spots[:max(count, 1)]
+        return spots
+    
+    def _build_daily_plans(self, ctx, day_orders, start=None, end=None, day_anchors=None):
+        """
+        依次生成每天的行程安排，当天因开放时间或时间不足放不下的景点顺延到之后的天；
+        给定起点时，次日从前一天最后一个景点出发；给定day_anchors时，每天从对应的景点出发并返回
+        """
+        daily_plans = []
+        deferred = []
+        for day, order in enumerate(day_orders):
+            if day_anchors is not None:
+                start = end = day_anchors[day]
+            daily_plan, order, deferred = self._build_daily_plan(ctx, order, day + 1, start, end, deferred)
+            daily_plans.append(daily_plan)
+            if order and start is not None and day_anchors is None:
+                start = order[-1]
+        
+        # 整个行程都放不下的景点记录在最后一天，供前端提示
+        if deferred and daily_plans:
+            daily_plans[-1]['unscheduled_spots'] = ctx.to_spots(deferred)
+        return daily_plans
+    
+    def _build_daily_plan(self, ctx, order, day_number, start=None, end=None, deferred=(), pinned=()):
+        """
+        用局部搜索改进当天的贪心路线，再按开放时间安排游玩时间并生成行程，
+        行程中附带相对贪心路线的距离改进报告；pinned中的景点在调度时优先安排
+        返回 (当天行程, 实际安排的景点下标顺序, 当天未能安排的景点下标)
+        """
+        report = None
+        if len(order) > 0:
+            order, report = self.local_search.improve(ctx.matrix, order, start, end, ctx.deadline)
+        improved_order = list(order)
+        
+        prizes = ctx.rating_scores + ctx.duration_scores + 1
+        if len(pinned):
+            prizes = prizes.copy()
+            prizes[list(pinned)] += PINNED_PRIZE
+        order, visits, unscheduled = self.scheduler.schedule(
+            ctx.table, ctx.matrix, order, deferred,
+            prizes=prizes,
+            max_visits=self.spots_per_day_range[1],
+            start=start, end=end
+        )
+        if not order:
+            return self._empty_daily_plan(day_number), order, unscheduled
+        
+        daily_plan = self._generate_daily_plan(ctx.to_spots(order), day_number, visits)
+        if report is not None:
+            # 调度器按开放时间重新插入景点后，报告按最终顺序重新计算
+            if order != improved_order:
+                report = self.local_search.rescore(report, ctx.matrix, order, start, end)
+            daily_plan['route_optimization'] = report
+        return daily_plan, order, unscheduled
+    
+    def _select_day_spots(self, ctx, spots, count, preferences):
+        """
+        选择当天要游览的景点，spots为候选景点下标
+        """
+        candidates = np.asarray(spots, dtype=int)
+        if len(candidates) <= count:
+            return candidates[:count].tolist()
         
         selected_spots = []
-        remaining_spots = spots.copy()
+        # 候选景点是否仍可选择的位图
+        available = np.ones(len(candidates), dtype=bool)
         
         # 首先选择离起始点最近的景点
-        if self.daily_start_point:
-            closest_spot = min(remaining_spots, key=lambda x: self._calculate_distance(
-                self.daily_start_point, self._get_spot_location(x)
-            ))
-            selected_spots.append(closest_spot)
-            remaining_spots.remove(closest_spot)
+        if ctx.start is not None:
+            position = ctx.nearest_position(ctx.start, candidates, available)
+            selected_spots.append(int(candidates[position]))
+            available[position] = False
             count -= 1
         
-        # 继续选择景点，考虑多种因素
-        while count > 0 and remaining_spots:
-            # 为每个剩余景点计算分数
-            spot_scores = []
-            for spot in remaining_spots:
-                score = 0
-                
-                # 1. 地理邻近性分数（与已选最后一个景点的距离）
-                if selected_spots:
-                    last_spot_loc = self._get_spot_location(selected_spots[-1])
-                    current_spot_loc = self._get_spot_location(spot)
-                    distance = self._calculate_distance(last_spot_loc, current_spot_loc)
-                    # 距离越近，分数越高（0-10分）
-                    proximity_score = max(0, 10 - (distance / 5) * 10)  # 5公里内满分
-                    score += proximity_score * self.geography_weight
-                
-                # 2. 主题一致性分数
-                if selected_spots and preferences:
-                    theme_score = self._calculate_theme_score(spot, selected_spots, preferences)
-                    score += theme_score * self.theme_weight
-                
-                # 3. 景点评分分数
-                rating = float(spot.get('rating', '0'))
-                score += rating * 2
-                
-                # 4. 游玩时长适宜性分数
-                visit_duration = self._parse_visit_duration(spot.get('visit_duration', '约1小时'))
-                # 避免选择游玩时太长的景点
-                duration_score = max(0, 5 - (visit_duration - 2) * 2) if visit_duration > 2 else 5
-                score += duration_score
+        # 继续选择景点，考虑多种因素，所有候选景点的分数整体向量化计算
+        while count > 0 and available.any():
+            positions = np.flatnonzero(available)
+            remaining = candidates[positions]
+            scores = np.zeros(len(remaining))
+            
+            if selected_spots:
+                # 地理邻近性分数（与已选最后一个景点的距离），距离越近分数越高（0-10分），5公里内满分
+                distances = ctx.matrix.matrix[selected_spots[-1], remaining]
+                scores += np.maximum(0, 10 - (distances / 5) * 10) * self.geography_weight
                 
-                spot_scores.append((spot, score))
+                # 主题一致性分数
+                if preferences:
+                    scores += ctx.table.theme_scores(remaining, selected_spots) * self.theme_weight
             
-            # 选择分数最高的景点
-            if spot_scores:
-                spot_scores.sort(key=lambda x: x[1], reverse=True)
-                best_spot = spot_scores[0][0]
-                selected_spots.append(best_spot)
-                remaining_spots.remove(best_spot)
-                count -= 1
-            else:
-                break
+            # 景点评分分数和游玩时长适宜性分数
+            scores += ctx.rating_scores[remaining]
+            scores += ctx.duration_scores[remaining]
+            
+            # 选择分数最高的景点（分数相同时取靠前的景点）
+            position = positions[int(np.argmax(scores))]
+            selected_spots.append(int(candidates[position]))
+            available[position] = False
+            count -= 1
         
         return selected_spots
     
-    def _sort_spots_by_proximity(self, spots):
+    def _sort_spots_by_proximity(self, ctx, spots):
         """
-        简单按地理邻近性排序景点
+        简单按地理邻近性排序景点，spots为景点下标
         """
-        if not spots:
+        if not len(spots):
             return []
         
+        candidates = np.asarray(spots, dtype=int)
+        available = np.ones(len(candidates), dtype=bool)
         sorted_spots = []
-        remaining_spots = spots.copy()
         
         # 起始点选择（如果有起始点设置）
-        if self.daily_start_point:
-            current_loc = self.daily_start_point
+        if ctx.start is not None:
+            current = ctx.start
         else:
             # 选择评分最高的景点作为起点
-            start_spot = max(remaining_spots, key=lambda x: float(x.get('rating', '0')))
-            sorted_spots.append(start_spot)
-            remaining_spots.remove(start_spot)
-            current_loc = self._get_spot_location(start_spot)
+            position = ctx.best_rated_position(candidates, available)
+            current = int(candidates[position])
+            sorted_spots.append(current)
+            available[position] = False
         
         # 贪心算法排序剩余景点
-        while remaining_spots:
+        for _ in range(len(candidates) - len(sorted_spots)):
             # 找到离当前位置最近的景点
-            closest_spot = min(remaining_spots, key=lambda x: self._calculate_distance(
-                current_loc, self._get_spot_location(x)
-            ))
-            sorted_spots.append(closest_spot)
-            remaining_spots.remove(closest_spot)
-            current_loc = self._get_spot_location(closest_spot)
+            position = ctx.nearest_position(current, candidates, available)
+            current = int(candidates[position])
+            sorted_spots.append(current)
+            available[position] = False
         
         return sorted_spots
     
-    def _sort_spots_optimally(self, spots):
+    def _sort_spots_optimally(self, ctx, spots):
         """
-        综合考虑多种因素对景点进行排序
+        综合考虑多种因素对景点进行排序，spots为景点下标
         """
         if len(spots) <= 2:
-            return self._sort_spots_by_proximity(spots)
+            return self._sort_spots_by_proximity(ctx, spots)
         
         # 使用旅行商问题的启发式算法（最近邻算法）
-        sorted_spots = []
-        remaining_spots = spots.copy()
+        candidates = np.asarray(spots, dtype=int)
+        available = np.ones(len(candidates), dtype=bool)
         
         # 起始点
-        if self.daily_start_point:
-            start_spot = min(remaining_spots, key=lambda x: self._calculate_distance(
-                self.daily_start_point, self._get_spot_location(x)
-            ))
+        if ctx.start is not None:
+            position = ctx.nearest_position(ctx.start, candidates, available)
         else:
-            start_spot = max(remaining_spots, key=lambda x: float(x.get('rating', '0')))
+            position = ctx.best_rated_position(candidates, available)
         
-        sorted_spots.append(start_spot)
-        remaining_spots.remove(start_spot)
+        sorted_spots = [int(candidates[position])]
+        available[position] = False
         
         # 构建路线
-        while remaining_spots:
-            last_spot = sorted_spots[-1]
-            next_spot = min(remaining_spots, key=lambda x: self._calculate_distance(
-                self._get_spot_location(last_spot), self._get_spot_location(x)
-            ))
-            sorted_spots.append(next_spot)
-            remaining_spots.remove(next_spot)
+        for _ in range(len(candidates) - 1):
+            position = ctx.nearest_position(sorted_spots[-1], candidates, available)
+            sorted_spots.append(int(candidates[position]))
+            available[position] = False
         
         # 检查结束点是否合理（离住宿区域不要太远）
-        if self.daily_end_point and len(sorted_spots) > 1:
+        if ctx.end is not None and len(sorted_spots) > 1:
             # 计算当前最后一个景点到结束点的距离
-            last_spot_dist = self._calculate_distance(
-                self._get_spot_location(sorted_spots[-1]), self.daily_end_point
-            )
+            last_spot_dist = ctx.matrix.distance(sorted_spots[-1], ctx.end)
             # 计算倒数第二个景点到结束点的距离
-            second_last_dist = self._calculate_distance(
-                self._get_spot_location(sorted_spots[-2]), self.daily_end_point
-            )
+            second_last_dist = ctx.matrix.distance(sorted_spots[-2], ctx.end)
             # 如果倒数第二个景点更近，交换顺序
             if second_last_dist < last_spot_dist * 0.7:
                 sorted_spots[-1], sorted_spots[-2] = sorted_spots[-2], sorted_spots[-1]
         
         return sorted_spots
     
-    def _generate_daily_plan(self, spots, day_number):
+    def _generate_daily_plan(self, spots, day_number, visits=None):
         """
-        生成当天的详细行程安排
+        生成当天的详细行程安排，visits为调度器给出的每个景点 (开始游玩分钟, 结束游玩分钟)，
+        未提供时从8:30开始按固定移动时间依次安排
         """
         schedule = []
         
         # 开始时间（默认8:30）
-        current_time = datetime.now().replace(hour=int(self.daily_time_range[0]), 
-                                             minute=int((self.daily_time_range[0] % 1) * 60), 
-                                             second=0, microsecond=0)
+        day_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        current_time = day_start + timedelta(hours=self.daily_time_range[0])
         
         # 为每个景点分配时间
         for i, spot in enumerate(spots):
             # 景点游玩时长
-            visit_duration = self._parse_visit_duration(spot.get('visit_duration', '约1小时'))
-            
-            # 到达时间
-            arrival_time = current_time
+            visit_duration = parse_duration_hours(spot.get('visit_duration', '约1小时'))
             
-            # 离开时间
-            departure_time = arrival_time + timedelta(hours=visit_duration)
+            if visits is not None:
+                # 到达和离开时间由调度器根据开放时间确定
+                arrival_time = day_start + timedelta(minutes=round(visits[i][0]))
+                departure_time = day_start + timedelta(minutes=round(visits[i][1]))
+            else:
+                # 到达时间
+                arrival_time = current_time
+                
+                # 离开时间
+                departure_time = arrival_time + timedelta(hours=visit_duration)
             
             # 添加景点到行程
             spot_schedule = {
@@ -313,7 +797,7 @@ class RoutePlanningModule:
             if i > 0:
                 prev_spot = spots[i-1]
                 spot_schedule['transportation'] = self._generate_transportation_suggestion(
-                    prev_spot, spot
+                    prev_spot, spot, visits[i - 1][1] if visits is not None else None
                 )
             else:
                 # 从住宿地到第一个景点的交通
@@ -321,11 +805,12 @@ class RoutePlanningModule:
             
             schedule.append(spot_schedule)
             
-            # 更新当前时间，加上移动时间
-            if i < len(spots) - 1:
-                current_time = departure_time + timedelta(hours=self.avg_transfer_time)
-            else:
-                current_time = departure_time
+            # 未使用调度器时更新当前时间，加上移动时间
+            if visits is None:
+                if i < len(spots) - 1:
+                    current_time = departure_time + timedelta(hours=self.avg_transfer_time)
+                else:
+                    current_time = departure_time
         
         # 生成当天行程摘要
         summary = self._generate_daily_summary(spots)
@@ -341,25 +826,34 @@ class RoutePlanningModule:
         
         return daily_plan
     
-    def _generate_transportation_suggestion(self, from_spot, to_spot):
+    def _generate_transportation_suggestion(self, from_spot, to_spot, departure_minute=None):
         """
-        生成两个景点之间的交通建议
+        生成两个景点之间的交通建议，交通时间取自交通时间缓存（按出发时刻所在时段），
+        未缓存时按校准的绕行系数估算
         """
+        from_location = self._get_spot_location(from_spot)
+        to_location = self._get_spot_location(to_spot)
         # 计算距离
-        distance = self._calculate_distance(
-            self._get_spot_location(from_spot),
-            self._get_spot_location(to_spot)
-        )
+        distance = self._calculate_distance(from_location, to_location)
+        if not math.isfinite(distance):
+            return '缺少景点位置信息，请根据实际情况选择交通方式'
         
-        # 根据距离生成交通建议
+        # 根据距离选择交通方式
         if distance < 1.0:
-            return '步行，约{}分钟'.format(int(distance * 15))  # 假设步行速度4km/h
+            mode, template = 'walking', '步行，约{}分钟'
         elif distance < 3.0:
-            return '建议骑共享单车，约{}分钟'.format(int(distance * 8))  # 假设骑行速度7.5km/h
+            mode, template = 'riding', '建议骑共享单车，约{}分钟'
         elif distance < 10.0:
-            return '建议乘坐公交车或打车，约{}分钟'.format(int(distance * 2))
+            mode, template = 'driving', '建议乘坐公交车或打车，约{}分钟'
         else:
-            return '建议打车或乘坐公共交通，约{}分钟'.format(int(distance * 1.5))
+            mode, template = 'driving', '建议打车或乘坐公共交通，约{}分钟'
+        
+        if departure_minute is None:
+            departure_minute = self.daily_time_range[0] * 60
+        minutes = self.travel_times.minutes_between(
+            from_location, to_location, mode, self.travel_times.bucket_of(departure_minute), straight_km=distance
+        )
+        return template.format(max(1, int(round(minutes))))
     
     def _generate_daily_summary(self, spots):
         """
@@ -373,13 +867,13 @@ class RoutePlanningModule:
         type_str = '、'.join(types) if types else '各类'
         
         # 计算总游玩时长
-        total_duration = sum(self._parse_visit_duration(spot.get('visit_duration', '约1小时')) for spot in spots)
+        total_duration = sum(parse_duration_hours(spot.get('visit_duration', '约1小时')) for spot in spots)
         
         # 生成摘要
         summary = f"当天安排了{len(spots)}个{type_str}景点，总游玩时长约{total_duration:.1f}小时。"
         
         # 如果有特别推荐的景点（评分高的）
-        highly_rated_spots = [spot for spot in spots if float(spot.get('rating', '0')) >= 4.5]
+        highly_rated_spots = [spot for spot in spots if parse_rating(spot.get('rating', '0')) >= 4.5]
         if highly_rated_spots:
             recommended_names = [spot['name'] for spot in highly_rated_spots]
             summary += f" 特别推荐：{'、'.join(recommended_names)}。"
@@ -422,99 +916,22 @@ class RoutePlanningModule:
     
     def _get_spot_location(self, spot):
         """
-        获取景点的位置坐标
+        获取景点的位置坐标 (纬度, 经度)，无法获取时返回 (0, 0)
         """
-        # 优先使用明确的经纬度
-        if spot.get('latitude') and spot.get('longitude'):
-            return (float(spot['latitude']), float(spot['longitude']))
-        
-        # 尝试从location字符串解析
-        location_str = spot.get('location', '')
-        if location_str and ',' in location_str:
-            try:
-                # 注意：location格式通常是lng,lat
-                lng, lat = location_str.split(',')
-                return (float(lat), float(lng))  # 返回(lat, lng)
-            except:
-                pass
-        
-        # 如果无法获取位置，返回默认值（将导致距离计算不准确）
-        return (0, 0)
+        return parse_location(spot)
     
-    def _parse_visit_duration(self, duration_str):
+    def _fill_remaining_spots(self, ctx, day_orders, remaining_spots):
         """
-        解析游玩时长字符串为小时数
+        将剩余景点填充到现有行程中，day_orders为每天的景点下标列表
         """
-        try:
-            # 尝试直接提取数字
-            import re
-            numbers = re.findall(r'\d+\.?\d*', duration_str)
-            if numbers:
-                return float(numbers[0])
-        except:
-            pass
-        
-        # 常见时长的映射
-        duration_mapping = {
-            '约30分钟': 0.5,
-            '约1小时': 1.0,
-            '约1.5小时': 1.5,
-            '约2小时': 2.0,
-            '约2.5小时': 2.5,
-            '约3小时': 3.0,
-            '约半天': 4.0,
-            '约4小时': 4.0,
-            '约5小时': 5.0
-        }
-        
-        return duration_mapping.get(duration_str, 1.0)
-    
-    def _calculate_theme_score(self, spot, selected_spots, preferences):
-        """
-        计算景点与已选景点的主题一致性分数
-        """
-        if not selected_spots or not preferences:
-            return 0
-        
-        # 获取景点类型
-        spot_type = spot.get('type', '')
-        
-        # 检查景点类型是否与任何偏好匹配
-        preference_type_mapping = {
-            '自然风光': ['湖泊', '山岳', '海滩', '瀑布', '森林'],
-            '历史文化': ['古城', '古镇', '寺庙', '博物馆', '遗址'],
-            '主题乐园': ['主题乐园', '游乐园', '海洋馆'],
-            '亲子活动': ['动物园', '科技馆', '儿童乐园']
-        }
-        
-        score = 0
-        
-        # 检查已选景点的主题一致性
-        for selected_spot in selected_spots:
-            selected_type = selected_spot.get('type', '')
-            # 如果类型相同，加分
-            if spot_type == selected_type:
-                score += 5
-            
-            # 检查是否同属一个偏好类别
-            for pref, types in preference_type_mapping.items():
-                if spot_type in types and selected_type in types:
-                    score += 3
-        
-        return score
-    
-    def _fill_remaining_spots(self, daily_plans, remaining_spots):
-        """
-        将剩余景点填充到现有行程中
-        """
-        for spot in remaining_spots:
+        for spot_index in remaining_spots:
             # 找到最合适的一天添加这个景点
             best_day_index = -1
             min_score = float('inf')
             
-            for i, day_plan in enumerate(daily_plans):
+            for i, order in enumerate(day_orders):
                 # 计算当天景点数量
-                spots_count = len(day_plan['spots'])
+                spots_count = len(order)
                 
                 # 如果当天景点数量已达上限，跳过
                 if spots_count >= self.spots_per_day_range[1]:
@@ -524,19 +941,13 @@ class RoutePlanningModule:
                 score = 0
                 
                 # 距离成本：到当天第一个和最后一个景点的平均距离
-                if day_plan['spots']:
-                    first_spot_dist = self._calculate_distance(
-                        self._get_spot_location(spot),
-                        self._get_spot_location(day_plan['spots'][0])
-                    )
-                    last_spot_dist = self._calculate_distance(
-                        self._get_spot_location(spot),
-                        self._get_spot_location(day_plan['spots'][-1])
-                    )
+                if order:
+                    first_spot_dist = ctx.matrix.distance(spot_index, order[0])
+                    last_spot_dist = ctx.matrix.distance(spot_index, order[-1])
                     score += (first_spot_dist + last_spot_dist) / 2
                 
                 # 多样性成本：如果类型相同，提高成本
-                if any(s.get('type') == spot.get('type') for s in day_plan['spots']):
+                if order and np.any(ctx.table.type_ids[order] == ctx.table.type_ids[spot_index]):
                     score += 2  # 轻微惩罚，避免同一天太多相同类型
                 
                 # 数量成本：优先选择景点数量少的天
@@ -547,19 +958,13 @@ class RoutePlanningModule:
                     min_score = score
                     best_day_index = i
             
-            # 如果找到合适的天，添加景点
+            # 如果找到合适的天，添加景点并重新排序当天景点
             if best_day_index >= 0:
-                # 添加景点到当天
-                daily_plans[best_day_index]['spots'].append(spot)
-                # 重新排序当天景点
-                sorted_spots = self._sort_spots_optimally(daily_plans[best_day_index]['spots'])
-                daily_plans[best_day_index]['spots'] = sorted_spots
-                # 重新生成当天行程
-                daily_plans[best_day_index] = self._generate_daily_plan(
-                    sorted_spots, daily_plans[best_day_index]['day']
+                day_orders[best_day_index] = self._sort_spots_optimally(
+                    ctx, day_orders[best_day_index] + [spot_index]
                 )
         
-        return daily_plans
+        return day_orders
     
     def optimize_existing_plan(self, daily_plans):
         """
@@ -571,14 +976,188 @@ class RoutePlanningModule:
         optimized_plans = []
         
         for day_plan in daily_plans:
-            # 重新排序景点
-            sorted_spots = self._sort_spots_optimally(day_plan['spots'])
-            # 重新生成行程
-            optimized_day_plan = self._generate_daily_plan(sorted_spots, day_plan['day'])
+            # 重新排序景点并生成行程
+            ctx = self._build_context(day_plan['spots'])
+            optimized_day_plan, _, unscheduled = self._build_daily_plan(
+                ctx, self._sort_spots_optimally(ctx, list(range(len(ctx.spots)))), day_plan['day']
+            )
+            if unscheduled:
+                optimized_day_plan['unscheduled_spots'] = ctx.to_spots(unscheduled)
             optimized_plans.append(optimized_day_plan)
         
         return optimized_plans
     
+    def create_plan_state(self, daily_plans):
+        """
+        由生成的行程构建可增量重新规划的状态：只为行程中出现的景点（含备选和未能安排的景点）
+        建立景点表，距离矩阵在首次重新规划时构建并缓存
+        """
+        spots = []
+        day_orders = []
+        day_alternates = []
+        for day_plan in daily_plans:
+            day_orders.append(list(range(len(spots), len(spots) + len(day_plan['spots']))))
+            spots.extend(day_plan['spots'])
+        for day_plan in daily_plans:
+            if 'alternates' in day_plan:
+                day_alternates.append(list(range(len(spots), len(spots) + len(day_plan['alternates']))))
+                spots.extend(day_plan['alternates'])
+            else:
+                day_alternates.append(None)
+        unscheduled_spots = daily_plans[-1].get('unscheduled_spots', []) if daily_plans else []
+        unscheduled = list(range(len(spots), len(spots) + len(unscheduled_spots)))
+        spots.extend(unscheduled_spots)
+        
+        # 住宿地点作为每天路线的固定起终点，多天使用同一住宿时只加入一次
+        day_bases = []
+        hotel_indices = {}
+        for day_plan in daily_plans:
+            hotel = day_plan.get('accommodation')
+            if hotel is None:
+                day_bases.append(None)
+                continue
+            if id(hotel) not in hotel_indices:
+                hotel_indices[id(hotel)] = len(spots)
+                spots.append(hotel)
+            day_bases.append(hotel_indices[id(hotel)])
+        
+        ctx = self._build_context(copy.deepcopy(spots))
+        return PlanState(ctx, day_orders, day_bases, day_alternates, unscheduled, list(daily_plans))
+    
+    def replan(self, state, edits):
+        """
+        按编辑列表增量重新规划已有行程，只重新优化受影响的天，复用缓存的距离矩阵和每天的景点划分
+
+        支持的编辑：
+        {'type': 'remove', 'spot': 景点名称}：删除景点
+        {'type': 'pin', 'spot': 景点名称, 'day': 天数}：把景点（含备选和未能安排的景点）固定到某天
+        {'type': 'swap', 'days': [天数, 天数]}：交换两天的行程
+        重新优化的天放不下的景点记入未能安排的景点，不顺延到其他天
+
+        返回 (全部天的行程, 有变化的天列表)，任一编辑不合法时抛出ValueError，状态保持编辑前不变
+        """
+        with state.lock:
+            snapshot = state.snapshot()
+            try:
+                return self._replan_locked(state, edits)
+            except Exception:
+                state.restore(snapshot)
+                raise
+    
+    def _replan_locked(self, state, edits):
+        """
+        依次执行编辑并重新优化受影响的天，调用方持有state.lock
+        """
+        affected = set()
+        for edit in edits:
+            affected.update(self._apply_edit(state, edit))
+        
+        changed_days = []
+        for day in sorted(affected):
+            before = state.daily_plans[day]
+            plan = self._replan_day(state, day)
+            state.daily_plans[day] = plan
+            if [s.get('name') for s in before['spots']] != [s.get('name') for s in plan['spots']] or \
+                    before.get('schedule') != plan.get('schedule') or before.get('day') != plan.get('day'):
+                changed_days.append({
+                    'day': day + 1,
+                    'before': [spot.get('name') for spot in before['spots']],
+                    'after': [spot.get('name') for spot in plan['spots']],
+                    'plan': plan
+                })
+        
+        # 未能安排的景点记录在最后一天
+        last_plan = state.daily_plans[-1]
+        if state.unscheduled:
+            last_plan['unscheduled_spots'] = state.ctx.to_spots(state.unscheduled)
+        else:
+            last_plan.pop('unscheduled_spots', None)
+        return list(state.daily_plans), changed_days
+    
+    def _apply_edit(self, state, edit):
+        """
+        在状态中执行一个编辑，返回受影响的天（从0开始）
+        """
+        edit_type = edit.get('type') if isinstance(edit, dict) else None
+        days = len(state.day_orders)
+        
+        if edit_type == 'swap':
+            pair = edit.get('days')
+            if not isinstance(pair, (list, tuple)) or len(pair) != 2:
+                raise ValueError("swap编辑需要两个天数")
+            first, second = (self._edit_day(day, days) for day in pair)
+            for values in (state.day_orders, state.day_bases, state.day_alternates):
+                values[first], values[second] = values[second], values[first]
+            for spot_index, day in state.pinned.items():
+                if day in (first, second):
+                    state.pinned[spot_index] = second if day == first else first
+            return {first, second}
+        
+        if edit_type not in ('remove', 'pin'):
+            raise ValueError(f"不支持的编辑类型: {edit_type}")
+        spot_index = self._find_state_spot(state, edit.get('spot'))
+        affected = self._detach_spot(state, spot_index)
+        if edit_type == 'remove':
+            state.pinned.pop(spot_index, None)
+            return affected
+        
+        day = self._edit_day(edit.get('day'), days)
+        state.day_orders[day].append(spot_index)
+        state.pinned[spot_index] = day
+        return affected | {day}
+    
+    def _edit_day(self, day, days):
+        if isinstance(day, bool) or not isinstance(day, int) or not 1 <= day <= days:
+            raise ValueError(f"天数必须是1-{days}之间的整数")
+        return day - 1
+    
+    def _find_state_spot(self, state, name):
+        """
+        按名称查找仍在行程、备选或未能安排的景点中的景点下标
+        """
+        candidates = [i for order in state.day_orders for i in order]
+        candidates += [i for alternates in state.day_alternates if alternates for i in alternates]
+        candidates += state.unscheduled
+        for spot_index in candidates:
+            if state.ctx.spots[spot_index].get('name') == name:
+                return spot_index
+        raise ValueError(f"行程中没有景点: {name}")
+    
+    def _detach_spot(self, state, spot_index):
+        """
+        把景点从所在的天、备选或未能安排的景点中移除，返回受影响的天
+        """
+        if spot_index in state.unscheduled:
+            state.unscheduled.remove(spot_index)
+        for day, order in enumerate(state.day_orders):
+            if spot_index in order:
+                order.remove(spot_index)
+                return {day}
+        for day, alternates in enumerate(state.day_alternates):
+            if alternates and spot_index in alternates:
+                alternates.remove(spot_index)
+                return {day}
+        return set()
+    
+    def _replan_day(self, state, day):
+        """
+        重新优化一天的路线和时间安排，放不下的景点记入未能安排的景点
+        """
+        ctx = state.ctx
+        base = state.day_bases[day]
+        ctx.start = ctx.end = base
+        pinned = [i for i in state.day_orders[day] if state.pinned.get(i) == day]
+        plan, order, unscheduled = self._build_daily_plan(
+            ctx, self._sort_spots_optimally(ctx, state.day_orders[day]), day + 1, base, base, pinned=pinned
+        )
+        state.day_orders[day] = list(order)
+        state.unscheduled.extend(i for i in unscheduled if i not in state.unscheduled)
+        if base is not None:
+            plan['accommodation'] = ctx.spots[base]
+        if state.day_alternates[day] is not None:
+            plan['alternates'] = ctx.to_spots(state.day_alternates[day])
+        return plan
+    
     def calculate_route_statistics(self, daily_plans):
         """
         计算路线的统计信息
@@ -588,7 +1167,13 @@ class RoutePlanningModule:
             'total_spots': 0,
             'total_distance_estimate': 0,
             'spots_by_type': {},
-            'daily_spot_count': []
+            'daily_spot_count': [],
+            # 局部搜索相对贪心路线缩短的总距离
+            'route_optimization': {
+                'greedy_distance_km': 0,
+                'optimized_distance_km': 0,
+                'reduction_km': 0
+            }
         }
         
         for day_plan in daily_plans:
@@ -597,20 +1182,23 @@ class RoutePlanningModule:
             stats['daily_spot_count'].append(len(spots))
             
             # 计算当天的估计移动距离
-            day_distance = 0
-            for i in range(1, len(spots)):
-                dist = self._calculate_distance(
-                    self._get_spot_location(spots[i-1]),
-                    self._get_spot_location(spots[i])
-                )
-                day_distance += dist
+            day_distance = self._build_context(spots).matrix.path_length(list(range(len(spots))))
             stats['total_distance_estimate'] += day_distance
             
+            # 汇总局部搜索的距离改进
+            report = day_plan.get('route_optimization') or {}
+            if report.get('greedy_distance_km') is not None:
+                for key in ('greedy_distance_km', 'optimized_distance_km', 'reduction_km'):
+                    stats['route_optimization'][key] += report[key]
+            
             # 统计景点类型
             for spot in spots:
                 spot_type = spot.get('type', '其他')
                 stats['spots_by_type'][spot_type] = stats['spots_by_type'].get(spot_type, 0) + 1
         
+        for key, value in stats['route_optimization'].items():
+            stats['route_optimization'][key] = round(value, 3)
+        
         return stats
     
     def validate_plan(self, daily_plans):
@@ -627,6 +1215,12 @@ class RoutePlanningModule:
             if len(spots) > self.spots_per_day_range[1]:
                 issues.append(f"第{day_plan['day']}天安排了{len(spots)}个景点，可能过于紧凑")
             
+            # 检查是否有因开放时间或每天时间不足而未能安排的景点
+            unscheduled = day_plan.get('unscheduled_spots', [])
+            if unscheduled:
+                names = '、'.join(spot.get('name', '未知景点') for spot in unscheduled)
+                issues.append(f"{names}因开放时间或每天游玩时间限制未能安排")
+            
             # 检查行程时间是否合理
             if schedule:
                 start_time = datetime.strptime(schedule[0]['arrival_time'], '%H:%M')
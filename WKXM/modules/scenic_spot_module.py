@@ -1,9 +1,17 @@
-import json
+import contextvars
+import copy
 import os
+import random
+import threading
+import time
+from concurrent.futures import as_completed, TimeoutError as FutureTimeoutError
 import pandas as pd
-import requests
 from datetime import datetime
 from .api_integration import APIIntegration
+from .user_input_module import normalize_city_name
+from .concurrency import get_single_flight, get_executor
+from .spot_store import SpotStore, SpotMemoryCache
+from .spatial_index import SpatialIndex
 
 class ScenicSpotModule:
     def __init__(self):
@@ -12,6 +20,38 @@ class ScenicSpotModule:
         # 缓存目录
         self.cache_dir = 'cache/scenic_spots'
         os.makedirs(self.cache_dir, exist_ok=True)
+        # 景点数据存储（SQLite），首次启动时导入旧版JSON缓存文件
+        self.store = SpotStore(os.getenv('SPOT_STORE_PATH', os.path.join(self.cache_dir, 'spots.db')))
+        self.store.migrate_from_json_dir(self.cache_dir)
+        # 存储之前的内存LRU层，按存储版本号校验
+        self.memory_cache = SpotMemoryCache()
+        # 缓存有效期（秒）及随机抖动比例，避免大量城市同时过期
+        self.cache_ttl = int(os.getenv('SPOT_CACHE_TTL', 86400))
+        self.cache_ttl_jitter = float(os.getenv('SPOT_CACHE_TTL_JITTER', 0.1))
+        # 过期后仍可直接返回旧数据的最长时间（秒），超过后同步刷新
+        self.max_staleness = int(os.getenv('SPOT_CACHE_MAX_STALENESS', 259200))
+        # 后台刷新线程池及正在刷新的城市
+        self.refresh_executor = get_executor('spot_refresh', int(os.getenv('SPOT_REFRESH_WORKERS', 2)))
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        # 刷新失败（接口出错或返回空结果）后重试的退避时间（秒），每次连续失败翻倍，不超过上限
+        self.refresh_retry_base = float(os.getenv('SPOT_REFRESH_RETRY_BASE', 60))
+        self.refresh_retry_max = float(os.getenv('SPOT_REFRESH_RETRY_MAX', 3600))
+        # 城市 -> (连续失败次数, 下次允许重试的时间)
+        self._refresh_backoff = {}
+        # 已存储景点的空间索引，按城市版本号增量同步；本地结果少于该数量时才调用周边搜索API
+        self.spatial_index = SpatialIndex()
+        self._spatial_versions = {}
+        self._spatial_lock = threading.Lock()
+        self.nearby_min_results = int(os.getenv('NEARBY_MIN_LOCAL_RESULTS', 5))
+        self.refresh_stats = {'refreshes': 0, 'failures': 0, 'stale_served': 0,
+                              'background_refreshes': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': 0.0}
+        # 进程级共享的城市景点获取合并分组
+        self.spots_flight = get_single_flight('city_spots')
+        # 景点详细信息分块查询配置：每块景点数、并发上限、整体等待时间（秒）
+        self.enrich_chunk_size = int(os.getenv('SPOT_ENRICH_CHUNK_SIZE', 10))
+        self.enrich_max_workers = int(os.getenv('SPOT_ENRICH_MAX_WORKERS', 4))
+        self.enrich_timeout = float(os.getenv('SPOT_ENRICH_TIMEOUT', 30))
         # 景点类型映射
         self.spot_type_mapping = {
             '110100': '旅游景点',
@@ -49,61 +89,176 @@ class ScenicSpotModule:
         """
         获取指定城市的景点列表
         """
-        # 检查缓存
-        cache_file = os.path.join(self.cache_dir, f'{city_name}_spots.json')
-        if os.path.exists(cache_file):
-            # 检查缓存是否过期（24小时）
-            if self._is_cache_valid(cache_file):
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+        meta = self.store.get_city_meta(city_name)
+        # 未过期直接返回；过期但未超过最长容忍时间时返回旧数据，并在后台刷新
+        if meta and (self._is_cache_valid(meta) or self._is_servable_stale(meta)):
+            spots = self._load_city_spots(city_name, meta['version'])
+            if spots is not None:
+                if not self._is_cache_valid(meta):
+                    self._schedule_refresh(city_name)
+                return spots
+        
+        # 同一城市的并发请求只执行一次获取和丰富流程，其余请求共享结果；每个调用方得到各自的深拷贝
+        return copy.deepcopy(self.spots_flight.do(city_name, lambda: self._refresh_city_spots(city_name)))
+    
+    def _load_city_spots(self, city_name, version):
+        """
+        先查内存缓存，未命中时从存储读取
+        """
+        spots = self.memory_cache.get(city_name, version)
+        if spots is not None:
+            return spots
+        spots = self.store.get_city_spots(city_name)
+        if spots is not None:
+            self.memory_cache.put(city_name, version, spots)
+        return spots
+    
+    def _schedule_refresh(self, city_name):
+        """
+        提交后台刷新任务，同一城市同一时间只有一个刷新任务，刷新失败退避期内不提交
+        """
+        with self._refresh_lock:
+            self.refresh_stats['stale_served'] += 1
+        if self._in_refresh_backoff(city_name):
+            return
+        with self._refresh_lock:
+            if city_name in self._refreshing:
+                return
+            self._refreshing.add(city_name)
         
-        # 从API获取景点数据
-        spots = self._fetch_spots_from_api(city_name)
+        def refresh():
+            try:
+                self.spots_flight.do(city_name, lambda: self._refresh_city_spots(city_name))
+            except Exception as e:
+                print(f"后台刷新{city_name}景点数据失败: {e}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(city_name)
         
-        # 丰富景点信息
-        enriched_spots = self._enrich_spot_info(spots, city_name)
+        with self._refresh_lock:
+            self.refresh_stats['background_refreshes'] += 1
+        self.refresh_executor.submit(refresh)
+    
+    def _refresh_city_spots(self, city_name):
+        """
+        从API获取并丰富景点数据，然后写入存储
+
+        获取失败或返回空结果时保留已存储的旧数据（不更新版本和有效期）并记录失败，
+        退避时间过后的请求再重新获取；没有旧数据时返回模拟数据但不写入存储
+        """
+        existing = None
+        meta = self.store.get_city_meta(city_name)
+        if meta:
+            existing = self._load_city_spots(city_name, meta['version'])
+        if self._in_refresh_backoff(city_name):
+            return existing if existing is not None else self._fallback_spots(city_name)
         
-        # 保存到缓存
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(enriched_spots, f, ensure_ascii=False, indent=2)
+        start = time.perf_counter()
+        try:
+            # 从API获取景点数据
+            try:
+                spots = self._fetch_spots_from_api(city_name)
+            except Exception as e:
+                print(f"获取景点数据失败: {e}")
+                spots = []
+            if not spots:
+                self._record_refresh_failure(city_name)
+                return existing if existing is not None else self._fallback_spots(city_name)
+            
+            # 丰富景点信息
+            enriched_spots = self._enrich_spot_info(spots, city_name)
+            
+            # 在一个事务内整体替换该城市的数据，读取方不会看到写了一半的结果
+            now = time.time()
+            version = self.store.replace_city_spots(city_name, enriched_spots, refreshed_at=now,
+                                                    expires_at=now + self._jittered_ttl())
+            self.memory_cache.put(city_name, version, enriched_spots)
+            with self._refresh_lock:
+                self._refresh_backoff.pop(city_name, None)
+        except Exception:
+            with self._refresh_lock:
+                self.refresh_stats['failures'] += 1
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._refresh_lock:
+                self.refresh_stats['refreshes'] += 1
+                self.refresh_stats['total_ms'] += elapsed_ms
+                self.refresh_stats['last_ms'] = elapsed_ms
+                self.refresh_stats['max_ms'] = max(self.refresh_stats['max_ms'], elapsed_ms)
         
         return enriched_spots
     
+    def _fallback_spots(self, city_name):
+        """
+        没有可用数据时返回的模拟景点数据
+        """
+        return self._enrich_spot_info(self._get_mock_spots(city_name), city_name)
+    
+    def _in_refresh_backoff(self, city_name):
+        with self._refresh_lock:
+            backoff = self._refresh_backoff.get(city_name)
+        return backoff is not None and time.time() < backoff[1]
+    
+    def _record_refresh_failure(self, city_name):
+        """
+        记录一次刷新失败，并按连续失败次数指数退避
+        """
+        with self._refresh_lock:
+            self.refresh_stats['failures'] += 1
+            attempts = self._refresh_backoff.get(city_name, (0, 0))[0] + 1
+            delay = min(self.refresh_retry_base * 2 ** (attempts - 1), self.refresh_retry_max)
+            self._refresh_backoff[city_name] = (attempts, time.time() + delay)
+    
+    def _jittered_ttl(self):
+        """
+        在默认有效期上叠加随机抖动
+        """
+        return self.cache_ttl * (1 + random.uniform(-self.cache_ttl_jitter, self.cache_ttl_jitter))
+    
+    def get_refresh_stats(self):
+        """
+        获取刷新次数、失败次数、返回旧数据次数、刷新耗时和处于失败退避中的城市
+        """
+        with self._refresh_lock:
+            stats = dict(self.refresh_stats)
+            stats['in_progress'] = sorted(self._refreshing)
+            stats['backoff'] = sorted(self._refresh_backoff)
+        stats['avg_ms'] = round(stats['total_ms'] / stats['refreshes'], 2) if stats['refreshes'] else 0.0
+        for key in ('total_ms', 'max_ms', 'last_ms'):
+            stats[key] = round(stats[key], 2)
+        return stats
+    
     def _fetch_spots_from_api(self, city_name):
         """
-        从API获取景点基础数据
+        从API获取景点基础数据，接口出错时抛出异常，由调用方决定保留旧数据还是使用模拟数据
         """
-        try:
-            # 使用API集成模块获取景点
-            spots = self.api.get_scenic_spots(city_name)
-            
-            # 标准化景点数据结构
-            standardized_spots = []
-            for spot in spots:
-                standardized_spot = {
-                    'name': spot.get('name', ''),
-                    'city': city_name,
-                    'address': spot.get('address', ''),
-                    'location': spot.get('location', ''),  # lng,lat格式
-                    'type_code': spot.get('type', '').split(';')[0] if spot.get('type') else '110100',
-                    'type': self._get_spot_type(spot.get('type', '')),
-                    'rating': spot.get('biz_ext', {}).get('rating', '0'),
-                    'pname': spot.get('pname', ''),  # 省份
-                    'adname': spot.get('adname', ''),  # 行政区域
-                    'description': spot.get('description', ''),
-                    'distance': spot.get('distance', 0),
-                    'fetch_time': datetime.now().isoformat()
-                }
-                standardized_spots.append(standardized_spot)
-            
-            # 按评分排序
-            standardized_spots.sort(key=lambda x: float(x['rating']) if x['rating'] else 0, reverse=True)
-            
-            return standardized_spots
-        except Exception as e:
-            print(f"获取景点数据失败: {e}")
-            # 返回空列表或模拟数据
-            return self._get_mock_spots(city_name)
+        # 使用API集成模块获取景点
+        spots = self.api.get_scenic_spots(city_name)
+        
+        # 标准化景点数据结构
+        standardized_spots = []
+        for spot in spots:
+            standardized_spot = {
+                'name': spot.get('name', ''),
+                'city': city_name,
+                'address': spot.get('address', ''),
+                'location': spot.get('location', ''),  # lng,lat格式
+                'type_code': spot.get('type', '').split(';')[0] if spot.get('type') else '110100',
+                'type': self._get_spot_type(spot.get('type', '')),
+                'rating': spot.get('biz_ext', {}).get('rating', '0'),
+                'pname': spot.get('pname', ''),  # 省份
+                'adname': spot.get('adname', ''),  # 行政区域
+                'description': spot.get('description', ''),
+                'distance': spot.get('distance', 0),
+                'fetch_time': datetime.now().isoformat()
+            }
+            standardized_spots.append(standardized_spot)
+        
+        # 按评分排序
+        standardized_spots.sort(key=lambda x: float(x['rating']) if x['rating'] else 0, reverse=True)
+        
+        return standardized_spots
     
     def _get_spot_type(self, type_str):
         """
@@ -159,17 +314,17 @@ class ScenicSpotModule:
         """
         enriched_spots = []
         
-        # 准备批量查询的景点名称列表
+        # 按固定大小分块，所有分块在有界线程池中并发查询
         spot_names = [spot['name'] for spot in spots]
-        
-        # 使用LLM批量获取景点详细信息
-        detailed_info = self._get_spots_detail_from_llm(city_name, spot_names[:20])  # 限制一次性查询数量
+        chunks = [spot_names[i:i + self.enrich_chunk_size]
+                  for i in range(0, len(spot_names), self.enrich_chunk_size)]
+        detail_index = self._get_spots_detail_concurrently(city_name, chunks)
         
         # 合并详细信息
         for spot in spots:
             spot_name = spot['name']
-            # 查找对应的详细信息
-            spot_detail = next((info for info in detailed_info if info.get('name') == spot_name), {})
+            # 通过名称索引查找详细信息，未返回的景点使用默认值
+            spot_detail = detail_index.get(spot_name, {})
             
             # 合并基础信息和详细信息
             enriched_spot = {
@@ -188,6 +343,34 @@ class ScenicSpotModule:
         
         return enriched_spots
     
+    def _get_spots_detail_concurrently(self, city_name, chunks):
+        """
+        并发查询各分块的景点详细信息，返回 景点名称 -> 详细信息 的索引
+        慢分块不会阻塞其他分块；失败或超时的分块中的景点由调用方使用默认值
+        """
+        detail_index = {}
+        if not chunks:
+            return detail_index
+        
+        executor = get_executor('spot_enrichment', self.enrich_max_workers)
+        # 在调用方上下文的副本中执行，上游调用计入发起请求的连接统计
+        futures = [executor.submit(contextvars.copy_context().run, self._get_spots_detail_from_llm, city_name, chunk)
+                   for chunk in chunks]
+        
+        try:
+            for future in as_completed(futures, timeout=self.enrich_timeout):
+                try:
+                    for info in future.result():
+                        if isinstance(info, dict) and info.get('name'):
+                            detail_index.setdefault(info['name'], info)
+                except Exception as e:
+                    print(f"景点详细信息分块查询失败: {e}")
+        except FutureTimeoutError:
+            unfinished = sum(1 for future in futures if not future.done())
+            print(f"{city_name}有{unfinished}个景点详细信息分块超时，使用默认信息")
+        
+        return detail_index
+    
     def _get_spots_detail_from_llm(self, city_name, spot_names):
         """
         使用LLM获取景点详细信息
@@ -196,18 +379,16 @@ class ScenicSpotModule:
             return []
         
         spots_str = '、'.join(spot_names)
-        prompt = f"请提供{city_name}以下景点的详细信息：{spots_str}。" \
+        prompt = f"请提供{normalize_city_name(city_name)}以下景点的详细信息：{spots_str}。" \
                 f"每个景点需要包含：名称(name)、开放时间(opening_hours)、门票价格(ticket_price)、建议游玩时长(visit_duration)、最佳游玩季节(best_season)、景点介绍(description)、游玩贴士(tips)。" \
                 f"请以JSON数组格式返回，确保每个景点都有完整的信息。如果某个景点信息未知，请提供合理的默认值。"
         
         try:
-            result = self.api.call_deepseek_api(prompt, max_tokens=2000)
-            if 'choices' in result and result['choices']:
-                content = result['choices'][0]['message']['content']
-                # 提取JSON部分
-                if '[' in content and ']' in content:
-                    json_str = content[content.find('['):content.rfind(']')+1]
-                    return json.loads(json_str)
+            # 只提取响应中的JSON数组部分，无法解析的响应不写入缓存
+            parse = lambda result: self.api.parse_llm_json(result, array=True)
+            result = self.api.call_deepseek_api(prompt, max_tokens=2000,
+                                                cache_ttl=self.api.llm_cache_ttls['spot_details'], parse=parse)
+            return parse(result)
         except Exception as e:
             print(f"获取景点详细信息失败: {e}")
         
@@ -237,15 +418,29 @@ class ScenicSpotModule:
         except:
             return None
     
-    def _is_cache_valid(self, cache_file):
+    def _cache_expires_at(self, meta):
+        """
+        获取缓存过期时间，旧数据没有记录过期时间时按刷新时间加默认有效期计算
+        """
+        if meta.get('expires_at'):
+            return meta['expires_at']
+        return meta['refreshed_at'] + self.cache_ttl
+    
+    def _is_cache_valid(self, meta):
+        """
+        检查缓存是否有效（默认24小时内）
+        """
+        try:
+            return datetime.now().timestamp() < self._cache_expires_at(meta)
+        except:
+            return False
+    
+    def _is_servable_stale(self, meta):
         """
-        检查缓存是否有效（24小时内）
+        检查已过期的缓存是否仍在最长容忍时间内
         """
         try:
-            mtime = os.path.getmtime(cache_file)
-            current_time = datetime.now().timestamp()
-            # 缓存有效期24小时
-            return (current_time - mtime) < 86400
+            return datetime.now().timestamp() < self._cache_expires_at(meta) + self.max_staleness
         except:
             return False
     
@@ -362,47 +557,86 @@ class ScenicSpotModule:
     
     def search_spots(self, keyword, city=None, limit=20):
         """
-        搜索景点
+        搜索景点，按相关度排序返回前limit个
         """
-        # 如果指定了城市，先获取该城市的景点
+        # 如果指定了城市，先确保该城市的景点已在存储中，再在该城市范围内检索
         if city:
-            spots = self.get_city_spots(city)
-        else:
-            # 如果没有指定城市，需要从缓存或数据库中搜索
-            spots = self._search_all_cities(keyword)
+            self.get_city_spots(city)
+            try:
+                return self.store.search(keyword, limit, city=city)
+            except Exception as e:
+                print(f"景点检索失败: {e}")
+                return []
         
-        # 根据关键词过滤
-        filtered_spots = [
-            spot for spot in spots 
-            if keyword.lower() in spot.get('name', '').lower() or 
-               keyword.lower() in spot.get('description', '').lower() or
-               keyword.lower() in spot.get('address', '').lower()
-        ]
-        
-        return filtered_spots[:limit]
+        # 如果没有指定城市，直接通过倒排索引跨城市检索
+        return self._search_all_cities(keyword, limit)
     
-    def _search_all_cities(self, keyword):
+    def _search_all_cities(self, keyword, limit=None):
         """
-        搜索所有城市的景点（从缓存中）
+        搜索所有城市的景点（从存储的倒排索引中）
         """
-        all_spots = []
-        
-        # 遍历缓存文件
-        for filename in os.listdir(self.cache_dir):
-            if filename.endswith('_spots.json'):
-                try:
-                    with open(os.path.join(self.cache_dir, filename), 'r', encoding='utf-8') as f:
-                        spots = json.load(f)
-                        all_spots.extend(spots)
-                except Exception as e:
-                    print(f"读取缓存文件失败: {e}")
-        
-        return all_spots
+        try:
+            return self.store.search(keyword, limit)
+        except Exception as e:
+            print(f"景点检索失败: {e}")
+            return []
+    
+    def _spot_points(self, spots):
+        """
+        将景点列表转换为 (纬度, 经度, 景点) 序列，跳过没有坐标的景点
+        """
+        points = []
+        for spot in spots:
+            lat = spot.get('latitude') or self._get_latitude(spot.get('location', ''))
+            lng = spot.get('longitude') or self._get_longitude(spot.get('location', ''))
+            if lat is not None and lng is not None:
+                points.append((float(lat), float(lng), spot))
+        return points
+    
+    def _sync_spatial_index(self):
+        """
+        按存储中的城市版本号同步空间索引，只重新载入有变化的城市
+        """
+        versions = self.store.get_city_versions()
+        with self._spatial_lock:
+            for city, version in versions.items():
+                if self._spatial_versions.get(city) == version:
+                    continue
+                spots = self._load_city_spots(city, version) or []
+                self.spatial_index.replace_group(city, self._spot_points(spots))
+                self._spatial_versions[city] = version
+            for city in set(self._spatial_versions) - set(versions):
+                self.spatial_index.remove_group(city)
+                del self._spatial_versions[city]
+    
+    def find_nearby_local(self, lat, lng, radius=5000, limit=10):
+        """
+        在本地空间索引中查询半径内的景点，结果带distance字段（米）
+        """
+        self._sync_spatial_index()
+        return [{**spot, 'distance': int(distance)}
+                for distance, _, spot in self.spatial_index.radius_query(lat, lng, radius, limit)]
+    
+    def get_nearest_spots(self, lat, lng, k=10, max_radius=None):
+        """
+        在本地空间索引中查询最近的k个景点，结果带distance字段（米）
+        """
+        self._sync_spatial_index()
+        return [{**spot, 'distance': int(distance)}
+                for distance, _, spot in self.spatial_index.nearest(lat, lng, k, max_radius)]
     
     def get_nearby_spots(self, lat, lng, radius=5000, limit=10):
         """
-        获取指定坐标附近的景点
+        获取指定坐标附近的景点，优先使用本地空间索引，本地结果过少时调用高德周边搜索
         """
+        local_spots = []
+        try:
+            local_spots = self.find_nearby_local(lat, lng, radius, limit)
+            if len(local_spots) >= min(limit, self.nearby_min_results):
+                return local_spots
+        except Exception as e:
+            print(f"本地空间索引查询失败: {e}")
+        
         try:
             # 使用高德地图POI周边搜索
             url = 'https://restapi.amap.com/v3/place/around'
@@ -417,7 +651,7 @@ class ScenicSpotModule:
                 'extensions': 'all'
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = self.api.http.get(url, params=params, timeout=self.api.timeout)
             data = response.json()
             
             if data.get('status') == '1' and data.get('pois'):
@@ -428,10 +662,10 @@ class ScenicSpotModule:
                     spots.append(spot)
                 return spots
             
-            return []
+            return local_spots
         except Exception as e:
             print(f"获取附近景点失败: {e}")
-            return []
+            return local_spots
     
     def _convert_poi_to_spot(self, poi):
         """
@@ -511,15 +745,13 @@ class ScenicSpotModule:
         try:
             if city_name:
                 # 清除指定城市的缓存
-                cache_file = os.path.join(self.cache_dir, f'{city_name}_spots.json')
-                if os.path.exists(cache_file):
-                    os.remove(cache_file)
+                self.memory_cache.invalidate(city_name)
+                if self.store.delete_city(city_name):
                     print(f"已清除{city_name}的缓存")
             else:
                 # 清除所有缓存
-                for filename in os.listdir(self.cache_dir):
-                    if filename.endswith('_spots.json'):
-                        os.remove(os.path.join(self.cache_dir, filename))
+                self.memory_cache.invalidate()
+                self.store.clear()
                 print("已清除所有缓存")
             return True
         except Exception as e:
@@ -0,0 +1,175 @@
+import math
+import os
+import threading
+
+EARTH_RADIUS_M = 6371000.0
+# 每纬度对应的米数
+METERS_PER_DEGREE = 111320.0
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """
+    计算两点之间的球面距离（米）
+    """
+    lat1_rad, lat2_rad = math.radians(lat1), math.radians(lat2)
+    dlat = lat2_rad - lat1_rad
+    dlng = math.radians(lng2 - lng1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class SpatialIndex:
+    """
+    基于经纬度网格的内存空间索引，支持半径查询和K近邻查询
+
+    每个点归入边长为cell_size度的网格单元；点可以按分组（例如城市）整体替换或删除，
+    也可以按键单独删除，便于路线规划中逐个取出最近的景点
+    """
+    def __init__(self, cell_size=None):
+        self.cell_size = cell_size or float(os.getenv('SPATIAL_INDEX_CELL_DEG', 0.05))
+        self._lock = threading.RLock()
+        # 网格单元 -> {键: (纬度, 经度, 数据)}
+        self._cells = {}
+        # 键 -> (网格单元, 分组)
+        self._entries = {}
+        # 分组 -> 键集合
+        self._groups = {}
+        self._next_key = 0
+
+    @classmethod
+    def from_points(cls, points, cell_size=None):
+        """
+        由 (纬度, 经度, 数据) 序列构建索引，键为序列中的下标
+        """
+        index = cls(cell_size)
+        for key, (lat, lng, item) in enumerate(points):
+            index.insert(lat, lng, item, key=key)
+        return index
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def insert(self, lat, lng, item, key=None, group=None):
+        """
+        插入一个点，返回其键
+        """
+        with self._lock:
+            if key is None:
+                key = ('auto', self._next_key)
+                self._next_key += 1
+            self.remove(key)
+            cell = self._cell(lat, lng)
+            self._cells.setdefault(cell, {})[key] = (lat, lng, item)
+            self._entries[key] = (cell, group)
+            if group is not None:
+                self._groups.setdefault(group, set()).add(key)
+            return key
+
+    def remove(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False
+            cell, group = entry
+            bucket = self._cells.get(cell)
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del self._cells[cell]
+            if group is not None and group in self._groups:
+                self._groups[group].discard(key)
+                if not self._groups[group]:
+                    del self._groups[group]
+            return True
+
+    def remove_group(self, group):
+        with self._lock:
+            for key in list(self._groups.get(group, ())):
+                self.remove(key)
+
+    def replace_group(self, group, points):
+        """
+        用 (纬度, 经度, 数据) 序列整体替换一个分组的点
+        """
+        with self._lock:
+            self.remove_group(group)
+            for seq, (lat, lng, item) in enumerate(points):
+                self.insert(lat, lng, item, key=(group, seq), group=group)
+
+    def _scan(self, cells, lat, lng, max_distance=None):
+        results = []
+        for cell in cells:
+            for key, (point_lat, point_lng, item) in self._cells.get(cell, {}).items():
+                distance = haversine_m(lat, lng, point_lat, point_lng)
+                if max_distance is None or distance <= max_distance:
+                    results.append((distance, key, item))
+        return results
+
+    def radius_query(self, lat, lng, radius_m, limit=None):
+        """
+        查询半径radius_m米内的点，按距离从近到远返回 (距离, 键, 数据) 列表
+        """
+        dlat = radius_m / METERS_PER_DEGREE
+        dlng = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(min(89.0, abs(lat) + dlat))), 1e-6))
+        min_cell = self._cell(lat - dlat, lng - dlng)
+        max_cell = self._cell(lat + dlat, lng + dlng)
+
+        with self._lock:
+            span = (max_cell[0] - min_cell[0] + 1) * (max_cell[1] - min_cell[1] + 1)
+            if span > len(self._cells):
+                # 查询范围内的网格数多于已有网格时直接遍历已有网格
+                cells = [cell for cell in self._cells
+                         if min_cell[0] <= cell[0] <= max_cell[0] and min_cell[1] <= cell[1] <= max_cell[1]]
+            else:
+                cells = [(i, j) for i in range(min_cell[0], max_cell[0] + 1)
+                         for j in range(min_cell[1], max_cell[1] + 1)]
+            results = self._scan(cells, lat, lng, radius_m)
+
+        results.sort(key=lambda result: result[0])
+        return results[:limit] if limit else results
+
+    def nearest(self, lat, lng, k=1, max_radius_m=None):
+        """
+        查询最近的k个点，按距离从近到远返回 (距离, 键, 数据) 列表
+
+        从查询点所在网格逐圈向外扩展，直到第k近的点比未搜索区域更近为止
+        """
+        center = self._cell(lat, lng)
+        candidates = []
+        with self._lock:
+            if not self._entries:
+                return []
+            ring = 0
+            while True:
+                if (2 * ring + 1) ** 2 > len(self._cells):
+                    # 搜索范围已超过已有网格数，剩余网格直接全部遍历
+                    searched = {(center[0] + i, center[1] + j)
+                                for i in range(-ring + 1, ring) for j in range(-ring + 1, ring)} if ring else set()
+                    candidates.extend(self._scan([cell for cell in self._cells if cell not in searched],
+                                                 lat, lng, max_radius_m))
+                    break
+
+                if ring == 0:
+                    cells = [center]
+                else:
+                    cells = [(center[0] + i, center[1] + j)
+                             for i in range(-ring, ring + 1) for j in range(-ring, ring + 1)
+                             if max(abs(i), abs(j)) == ring]
+                candidates.extend(self._scan(cells, lat, lng, max_radius_m))
+
+                # 第ring+1圈及以外的点到查询点的距离下界
+                bound_lat = min(89.0, abs(lat) + (ring + 1) * self.cell_size)
+                lower_bound = ring * self.cell_size * METERS_PER_DEGREE * math.cos(math.radians(bound_lat))
+                if max_radius_m is not None and lower_bound > max_radius_m:
+                    break
+                if len(candidates) >= k:
+                    candidates.sort(key=lambda result: result[0])
+                    if candidates[k - 1][0] <= lower_bound:
+                        break
+                ring += 1
+
+        candidates.sort(key=lambda result: result[0])
+        return candidates[:k]
@@ -0,0 +1,368 @@
+import heapq
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .spot_tokenizer import tokenize, pinyin_tokens, query_terms
+
+# 各字段词项的权重，景点名称命中的排序最靠前
+FIELD_WEIGHTS = {'name': 3.0, 'address': 1.0, 'description': 1.0}
+PINYIN_WEIGHT = 2.0
+
+
+def _text(value):
+    # 高德接口对空字段可能返回[]，非字符串一律按空文本处理
+    return value if isinstance(value, str) else ''
+
+
+class SpotStore:
+    """
+    基于SQLite（WAL模式）的景点本地存储
+
+    每个景点一行，记录以紧凑JSON保存；城市刷新在单个事务内整体替换，
+    读取方（包括其他进程）始终看到完整的旧数据或完整的新数据。
+    景点文本的倒排索引（汉字单字/二字组、英文词、拼音）与景点数据在同一事务内更新
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS cities (
+                city TEXT PRIMARY KEY,
+                refreshed_at REAL NOT NULL,
+                expires_at REAL,
+                version INTEGER NOT NULL,
+                spot_count INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS spots (
+                city TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                address TEXT NOT NULL DEFAULT '',
+                description TEXT NOT NULL DEFAULT '',
+                data TEXT NOT NULL,
+                PRIMARY KEY (city, seq)
+            );
+            CREATE INDEX IF NOT EXISTS idx_spots_name ON spots(name);
+            CREATE TABLE IF NOT EXISTS spot_terms (
+                term TEXT NOT NULL,
+                city TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                weight REAL NOT NULL,
+                PRIMARY KEY (term, city, seq)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_spot_terms_city ON spot_terms(city);
+        ''')
+        # 早期版本的数据库没有expires_at列
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(cities)')]
+        if 'expires_at' not in columns:
+            conn.execute('ALTER TABLE cities ADD COLUMN expires_at REAL')
+        # 早期版本的数据库没有倒排索引，首次打开时补建
+        if conn.execute('SELECT 1 FROM spot_terms LIMIT 1').fetchone() is None and \
+                conn.execute('SELECT 1 FROM spots LIMIT 1').fetchone() is not None:
+            self.rebuild_index()
+
+    @staticmethod
+    def _dumps(spot):
+        return json.dumps(spot, ensure_ascii=False, separators=(',', ':'))
+
+    @staticmethod
+    def _index_rows(city, seq, spot):
+        """
+        生成单个景点的倒排索引行 (词项, 城市, 序号, 权重)
+        """
+        weights = {}
+        for field, field_weight in FIELD_WEIGHTS.items():
+            for term in tokenize(_text(spot.get(field))):
+                weights[term] = weights.get(term, 0.0) + field_weight
+        for term in pinyin_tokens(_text(spot.get('name'))):
+            weights[term] = weights.get(term, 0.0) + PINYIN_WEIGHT
+        return [(term, city, seq, weight) for term, weight in weights.items()]
+
+    def _write_index(self, conn, city, spots):
+        conn.execute('DELETE FROM spot_terms WHERE city = ?', (city,))
+        rows = []
+        for seq, spot in enumerate(spots):
+            rows.extend(self._index_rows(city, seq, spot))
+        conn.executemany('INSERT INTO spot_terms (term, city, seq, weight) VALUES (?, ?, ?, ?)', rows)
+
+    def rebuild_index(self):
+        """
+        根据已存储的景点重建全部倒排索引
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM spot_terms')
+            for (city,) in conn.execute('SELECT city FROM cities').fetchall():
+                rows = conn.execute('SELECT data FROM spots WHERE city = ? ORDER BY seq', (city,)).fetchall()
+                self._write_index(conn, city, [json.loads(row[0]) for row in rows])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def get_city_meta(self, city):
+        """
+        获取城市的刷新时间、过期时间和版本号，城市不存在时返回None
+        """
+        row = self._connect().execute(
+            'SELECT refreshed_at, expires_at, version, spot_count FROM cities WHERE city = ?', (city,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'refreshed_at': row[0], 'expires_at': row[1], 'version': row[2], 'spot_count': row[3]}
+
+    def get_city_spots(self, city):
+        """
+        按原始顺序读取城市的全部景点，城市不存在时返回None
+        """
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            if conn.execute('SELECT 1 FROM cities WHERE city = ?', (city,)).fetchone() is None:
+                return None
+            rows = conn.execute('SELECT data FROM spots WHERE city = ? ORDER BY seq', (city,)).fetchall()
+        finally:
+            conn.execute('COMMIT')
+        return [json.loads(row[0]) for row in rows]
+
+    def replace_city_spots(self, city, spots, refreshed_at=None, expires_at=None):
+        """
+        在一个事务内整体替换城市的景点数据，返回新的版本号
+
+        expires_at为空时由读取方按刷新时间和默认有效期判断是否过期
+        """
+        refreshed_at = refreshed_at if refreshed_at is not None else time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT version FROM cities WHERE city = ?', (city,)).fetchone()
+            version = (row[0] if row else 0) + 1
+            conn.execute('DELETE FROM spots WHERE city = ?', (city,))
+            conn.executemany(
+                'INSERT INTO spots (city, seq, name, address, description, data) VALUES (?, ?, ?, ?, ?, ?)',
+                [(city, seq, _text(spot.get('name')), _text(spot.get('address')),
+                  _text(spot.get('description')), self._dumps(spot))
+                 for seq, spot in enumerate(spots)]
+            )
+            self._write_index(conn, city, spots)
+            conn.execute(
+                'INSERT OR REPLACE INTO cities (city, refreshed_at, expires_at, version, spot_count) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (city, refreshed_at, expires_at, version, len(spots))
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return version
+
+    def search(self, keyword, limit=20, city=None):
+        """
+        通过倒排索引检索景点，按命中词项数和加权IDF得分排序返回前limit个
+
+        city为空时跨所有城市检索；命中全部查询词项的景点总是排在部分命中的景点之前
+        """
+        terms = query_terms(keyword)
+        if not terms:
+            return []
+
+        conn = self._connect()
+        placeholders = ','.join('?' * len(terms))
+        sql = f'SELECT term, city, seq, weight FROM spot_terms WHERE term IN ({placeholders})'
+        params = list(terms)
+        if city:
+            sql += ' AND city = ?'
+            params.append(city)
+        rows = conn.execute(sql, params).fetchall()
+        if not rows:
+            return []
+
+        total = conn.execute('SELECT COUNT(*) FROM spots').fetchone()[0] or 1
+        doc_freq = {}
+        for term, _, _, _ in rows:
+            doc_freq[term] = doc_freq.get(term, 0) + 1
+
+        scores = {}
+        for term, spot_city, seq, weight in rows:
+            entry = scores.setdefault((spot_city, seq), [0, 0.0])
+            entry[0] += 1
+            entry[1] += weight * math.log(1 + total / doc_freq[term])
+
+        ranked = heapq.nlargest(limit or len(scores), scores.items(), key=lambda item: (item[1][0], item[1][1]))
+        results = []
+        for (spot_city, seq), _ in ranked:
+            row = conn.execute('SELECT data FROM spots WHERE city = ? AND seq = ?', (spot_city, seq)).fetchone()
+            if row is not None:
+                results.append(json.loads(row[0]))
+        return results
+
+    def iter_all_spots(self):
+        """
+        遍历所有城市的景点
+        """
+        for row in self._connect().execute('SELECT data FROM spots ORDER BY city, seq'):
+            yield json.loads(row[0])
+
+    def get_city_versions(self):
+        """
+        获取所有城市的当前版本号，用于同步内存中的派生索引
+        """
+        return dict(self._connect().execute('SELECT city, version FROM cities').fetchall())
+
+    def list_cities(self):
+        return [row[0] for row in self._connect().execute('SELECT city FROM cities ORDER BY city')]
+
+    def delete_city(self, city):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM spots WHERE city = ?', (city,))
+            conn.execute('DELETE FROM spot_terms WHERE city = ?', (city,))
+            deleted = conn.execute('DELETE FROM cities WHERE city = ?', (city,)).rowcount
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return deleted > 0
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM spots')
+            conn.execute('DELETE FROM spot_terms')
+            conn.execute('DELETE FROM cities')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def migrate_from_json_dir(self, cache_dir):
+        """
+        将旧版按城市保存的 {city}_spots.json 缓存文件导入数据库
+
+        文件的修改时间作为刷新时间导入；导入后文件重命名为 .migrated，避免重复导入，
+        也避免清除缓存后旧文件被再次导入。返回导入的城市数量
+        """
+        if not os.path.isdir(cache_dir):
+            return 0
+
+        migrated = 0
+        for filename in os.listdir(cache_dir):
+            if not filename.endswith('_spots.json'):
+                continue
+            path = os.path.join(cache_dir, filename)
+            city = filename[:-len('_spots.json')]
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    spots = json.load(f)
+                # 数据库中已有更新的数据时不覆盖
+                meta = self.get_city_meta(city)
+                mtime = os.path.getmtime(path)
+                if meta is None or meta['refreshed_at'] < mtime:
+                    self.replace_city_spots(city, spots, refreshed_at=mtime)
+                    migrated += 1
+                os.replace(path, f'{path}.migrated')
+            except Exception as e:
+                print(f"迁移缓存文件{filename}失败: {e}")
+        return migrated
+
+
+class SpotMemoryCache:
+    """
+    进程内的城市景点列表LRU缓存，位于SpotStore之前
+
+    条目记录写入时的存储版本号，读取时版本不一致即视为失效，
+    其他进程刷新了城市数据后也能及时感知；按条目数和估算字节数双重限制
+    """
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries or int(os.getenv('SPOT_MEMORY_CACHE_MAX_ENTRIES', 64))
+        self.max_bytes = max_bytes or int(os.getenv('SPOT_MEMORY_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+        self._lock = threading.Lock()
+        # 城市 -> (版本号, 景点列表, 估算字节数)
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._city_stats = {}
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def _record(self, city, outcome):
+        self.stats[outcome] += 1
+        city_stats = self._city_stats.setdefault(city, {'hits': 0, 'misses': 0})
+        city_stats[outcome] += 1
+
+    def get(self, city, version):
+        """
+        读取与指定版本一致的景点列表，返回每个景点的浅拷贝，未命中时返回None
+        """
+        with self._lock:
+            entry = self._entries.get(city)
+            if entry is None or entry[0] != version:
+                self._record(city, 'misses')
+                return None
+            self._entries.move_to_end(city)
+            self._record(city, 'hits')
+            spots = entry[1]
+        # 调用方可能修改景点字典，复制后再返回，避免污染缓存
+        return [dict(spot) for spot in spots]
+
+    def put(self, city, version, spots):
+        size = len(json.dumps(spots, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        spots = [dict(spot) for spot in spots]
+        with self._lock:
+            self._remove(city)
+            self._entries[city] = (version, spots, size)
+            self._total_bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats['evictions'] += 1
+
+    def _remove(self, city):
+        entry = self._entries.pop(city, None)
+        if entry:
+            self._total_bytes -= entry[2]
+
+    def invalidate(self, city=None):
+        with self._lock:
+            if city is None:
+                self._entries.clear()
+                self._total_bytes = 0
+            else:
+                self._remove(city)
+
+    def get_stats(self):
+        with self._lock:
+            total = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hit_rate': round(self.stats['hits'] / total, 4) if total else 0.0,
+                'cities': {city: dict(stats) for city, stats in self._city_stats.items()}
+            }
@@ -0,0 +1,174 @@
+import re
+
+import numpy as np
+
+# 偏好类别包含的景点类型，用于计算主题一致性
+PREFERENCE_TYPE_MAPPING = {
+    '自然风光': ['湖泊', '山岳', '海滩', '瀑布', '森林'],
+    '历史文化': ['古城', '古镇', '寺庙', '博物馆', '遗址'],
+    '主题乐园': ['主题乐园', '游乐园', '海洋馆'],
+    '亲子活动': ['动物园', '科技馆', '儿童乐园']
+}
+
+# 常见时长描述的映射（小时）
+DURATION_MAPPING = {
+    '约30分钟': 0.5,
+    '约1小时': 1.0,
+    '约1.5小时': 1.5,
+    '约2小时': 2.0,
+    '约2.5小时': 2.5,
+    '约3小时': 3.0,
+    '约半天': 4.0,
+    '约4小时': 4.0,
+    '约5小时': 5.0
+}
+
+_NUMBER_PATTERN = re.compile(r'\d+\.?\d*')
+# 开放时间段，如"07:30-18:30"、"8：00至17：00"
+_OPENING_RANGE_PATTERN = re.compile(r'(\d{1,2})[:：](\d{2})\s*(?:-|－|—|~|～|至|到)\s*(?:次日)?(\d{1,2})[:：](\d{2})')
+# 一天的分钟数
+MINUTES_PER_DAY = 24 * 60
+
+
+def parse_location(spot):
+    """
+    解析景点坐标，返回 (纬度, 经度)，无法解析时返回 (0, 0)
+    """
+    # 优先使用明确的经纬度
+    if spot.get('latitude') and spot.get('longitude'):
+        return (float(spot['latitude']), float(spot['longitude']))
+
+    # 尝试从location字符串解析，格式为lng,lat
+    location_str = spot.get('location', '')
+    if isinstance(location_str, str) and ',' in location_str:
+        try:
+            lng, lat = location_str.split(',')
+            return (float(lat), float(lng))
+        except ValueError:
+            pass
+
+    return (0, 0)
+
+
+def parse_duration_hours(duration_str):
+    """
+    解析游玩时长字符串为小时数，"约30分钟"这类以分钟计的描述换算为小时
+    """
+    if isinstance(duration_str, str):
+        numbers = _NUMBER_PATTERN.findall(duration_str)
+        if numbers:
+            value = float(numbers[0])
+            if '分钟' in duration_str and '小时' not in duration_str:
+                return value / 60
+            return value
+        return DURATION_MAPPING.get(duration_str, 1.0)
+
+    return 1.0
+
+
+def parse_opening_hours(opening_hours):
+    """
+    解析开放时间字符串为按开始时间排序的 (开门分钟, 关门分钟) 区间列表，分钟数从当天0点起算
+
+    "全天开放"、"24小时"解析为整天；关门时间早于开门时间时视为次日关门；
+    无法识别的描述（如"暂无信息"）返回None，由调用方按不限制开放时间处理
+    """
+    if isinstance(opening_hours, list):
+        # 高德API中缺失的字段为空列表
+        opening_hours = ''.join(str(item) for item in opening_hours)
+    if not isinstance(opening_hours, str) or not opening_hours.strip():
+        return None
+
+    if '全天' in opening_hours or '24小时' in opening_hours:
+        return [(0, MINUTES_PER_DAY)]
+
+    windows = []
+    for open_hour, open_minute, close_hour, close_minute in _OPENING_RANGE_PATTERN.findall(opening_hours):
+        open_time = int(open_hour) * 60 + int(open_minute)
+        close_time = int(close_hour) * 60 + int(close_minute)
+        if close_time <= open_time:
+            close_time += MINUTES_PER_DAY
+        windows.append((open_time, close_time))
+
+    return sorted(windows) or None
+
+
+def parse_rating(rating):
+    try:
+        return float(rating or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class SpotTable:
+    """
+    规划热路径使用的景点列式表示：景点在进入规划时解析一次，
+    各字段保存为按景点下标对齐的数组，原始字典只在输出行程时使用
+    """
+    __slots__ = ('spots', 'lats', 'lngs', 'duration_minutes', 'ratings', 'type_ids', 'type_names',
+                 'seasonal_scores', 'theme_pair_scores', 'opening_windows')
+
+    def __init__(self, spots):
+        self.spots = spots
+        locations = [parse_location(spot) for spot in spots]
+        self.lats = np.array([lat for lat, _ in locations], dtype=float)
+        self.lngs = np.array([lng for _, lng in locations], dtype=float)
+        self.duration_minutes = np.array(
+            [round(parse_duration_hours(spot.get('visit_duration', '约1小时')) * 60) for spot in spots], dtype=int
+        )
+        self.ratings = np.array([parse_rating(spot.get('rating', '0')) for spot in spots], dtype=float)
+        self.seasonal_scores = np.array([parse_rating(spot.get('seasonal_score', 0)) for spot in spots],
+                                        dtype=float)
+        # 开放时间区间列表，未知开放时间的景点为None
+        self.opening_windows = [parse_opening_hours(spot.get('opening_hours')) for spot in spots]
+
+        # 景点类型编码为整数，缺少类型的景点统一视为空字符串
+        type_index = {}
+        self.type_ids = np.array(
+            [type_index.setdefault(spot.get('type') or '', len(type_index)) for spot in spots], dtype=int
+        )
+        self.type_names = list(type_index)
+
+        # 两种类型之间的主题一致性分数：类型相同加5分，每同属一个偏好类别加3分
+        categories = [sum(1 << bit for bit, types in enumerate(PREFERENCE_TYPE_MAPPING.values()) if name in types)
+                      for name in self.type_names]
+        self.theme_pair_scores = np.array(
+            [[(5 if a == b else 0) + 3 * bin(categories[a] & categories[b]).count('1')
+              for b in range(len(self.type_names))] for a in range(len(self.type_names))],
+            dtype=float
+        ).reshape(len(self.type_names), len(self.type_names))
+
+    def __len__(self):
+        return len(self.spots)
+
+    @property
+    def duration_hours(self):
+        return self.duration_minutes / 60.0
+
+    def theme_scores(self, candidates, selected):
+        """
+        批量计算候选景点与已选景点的主题一致性分数
+        """
+        if not len(selected):
+            return np.zeros(len(candidates))
+        return self.theme_pair_scores[np.ix_(self.type_ids[candidates], self.type_ids[selected])].sum(axis=1)
+
+    def preference_scores(self, preferences, match_score=5.0):
+        """
+        景点与用户偏好的匹配分数：景点类型属于某个偏好类别或包含偏好关键词时得match_score分
+        """
+        if not preferences:
+            return np.zeros(len(self))
+        matched = []
+        for name in self.type_names:
+            matched.append(any(
+                name in PREFERENCE_TYPE_MAPPING.get(preference, ()) or (name and str(preference) in name)
+                for preference in preferences
+            ))
+        return np.where(np.array(matched, dtype=bool)[self.type_ids], match_score, 0.0)
+
+    def to_spots(self, order):
+        """
+        输出边界：按下标顺序取回原始景点字典
+        """
+        return [self.spots[i] for i in order]
@@ -0,0 +1,53 @@
+import re
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    # 未安装pypinyin时只建立汉字和英文词项，拼音检索不可用
+    lazy_pinyin = None
+
+_TOKEN_PATTERN = re.compile(r'[一-鿿]+|[a-z0-9]+')
+
+
+def tokenize(text):
+    """
+    将文本切分为检索词项：连续汉字切为单字和相邻二字组，英文和数字按词切分（小写）
+    """
+    tokens = []
+    for run in _TOKEN_PATTERN.findall((text or '').lower()):
+        if run.isascii():
+            tokens.append(run)
+            continue
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def pinyin_tokens(text):
+    """
+    生成文本的拼音词项：每段连续汉字的全拼、首字母缩写和相邻两字的拼音，
+    例如"西湖公园"生成xihugongyuan、xhgy、xihu、hugong、gongyuan
+    """
+    if lazy_pinyin is None:
+        return []
+    tokens = []
+    for run in re.findall(r'[一-鿿]+', text or ''):
+        syllables = lazy_pinyin(run)
+        tokens.append(''.join(syllables))
+        if len(syllables) > 1:
+            tokens.append(''.join(syllable[0] for syllable in syllables if syllable))
+            tokens.extend(syllables[i] + syllables[i + 1] for i in range(len(syllables) - 1))
+    return list(dict.fromkeys(tokens))
+
+
+def query_terms(keyword):
+    """
+    将查询关键词切分为检索词项；多个汉字时只用二字组，避免单字匹配过宽
+    """
+    terms = []
+    for run in _TOKEN_PATTERN.findall((keyword or '').lower()):
+        if run.isascii() or len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return list(dict.fromkeys(terms))
@@ -0,0 +1,182 @@
+import os
+from bisect import bisect_right
+
+import numpy as np
+
+from .spot_table import MINUTES_PER_DAY
+
+
+class TimeWindowScheduler:
+    """
+    考虑开放时间的单日行程调度器
+
+    把当天的景点排序和到达/离开时间作为一个带时间窗的奖励收集TSP一起求解：
+    每个景点必须在某个开放时间段内完整游玩，全部游玩须在当天时间范围内结束；
+    放不下的景点不安排，返回给调用方顺延到其他天。求解采用插入启发式：
+    先检查局部搜索得到的顺序是否可行，不可行时按"奖励/新增耗时"从高到低逐个插入到
+    耗时增加最少的可行位置，直到没有景点能再插入
+    """
+    def __init__(self, day_start_minute=510, day_end_minute=1020, speed_kmh=None, transfer_overhead_minutes=None,
+                 fallback_transfer_minutes=30, travel_times=None, travel_mode=None):
+        self.day_start_minute = day_start_minute
+        self.day_end_minute = day_end_minute
+        # 景点间移动的平均速度（公里/小时）和每次移动的固定耗时（候车、停车等，分钟）
+        self.speed_kmh = speed_kmh or float(os.getenv('SCHEDULER_TRAVEL_SPEED_KMH', 30))
+        if transfer_overhead_minutes is None:
+            transfer_overhead_minutes = float(os.getenv('SCHEDULER_TRANSFER_OVERHEAD_MINUTES', 10))
+        self.transfer_overhead_minutes = transfer_overhead_minutes
+        # 缺少坐标无法估算距离时使用的移动时间（分钟）
+        self.fallback_transfer_minutes = fallback_transfer_minutes
+        # 实际交通时间缓存（TravelTimeCache），为None时按直线距离和平均速度估算
+        self.travel_times = travel_times
+        self.travel_mode = travel_mode or os.getenv('TRAVEL_TIME_MODE', 'driving')
+
+    def travel_minutes(self, distances):
+        """
+        把距离矩阵（公里）换算为移动时间矩阵（分钟），同一地点之间为0
+        """
+        distances = np.asarray(distances, dtype=float)
+        if self.travel_times is not None:
+            # 使用交通时间缓存校准的绕行系数和速度
+            road_minutes = self.travel_times.estimate_minutes(distances, self.travel_mode, self.speed_kmh)
+        else:
+            road_minutes = distances / self.speed_kmh * 60
+        return self._with_overhead(road_minutes, distances == 0)
+
+    def _with_overhead(self, road_minutes, same_place):
+        minutes = self.transfer_overhead_minutes + road_minutes
+        minutes = np.where(np.isfinite(minutes), minutes, self.fallback_transfer_minutes)
+        return np.where(same_place, 0.0, minutes)
+
+    def _day_buckets(self):
+        """
+        当天可用时间覆盖的交通时间缓存时段
+        """
+        first = self.travel_times.bucket_of(self.day_start_minute)
+        last = self.travel_times.bucket_of(max(self.day_start_minute, self.day_end_minute - 1))
+        return list(range(first, last + 1))
+
+    def _bucket_bounds(self, travel):
+        """
+        交通时间矩阵第一维中第2个及之后各时段的开始分钟，出发时刻用bisect即可找到对应时段
+        """
+        if len(travel) == 1:
+            return []
+        first = self.travel_times.bucket_of(self.day_start_minute)
+        return [(first + i) * self.travel_times.bucket_minutes for i in range(1, len(travel))]
+
+    def _travel_matrix(self, matrix, nodes):
+        """
+        当天景点之间的移动时间（分钟），形状为 (时段数, 景点数, 景点数)：有交通时间缓存时
+        每个时段一个矩阵，按出发时刻所在时段取用；否则只有一个按直线距离估算的矩阵
+        """
+        if self.travel_times is None:
+            return self.travel_minutes(matrix.matrix[np.ix_(nodes, nodes)])[None, :, :]
+        road_minutes = self.travel_times.travel_matrix(
+            matrix.lats[nodes], matrix.lngs[nodes], self.travel_mode, self._day_buckets(), self.speed_kmh,
+            straight=matrix.matrix[np.ix_(nodes, nodes)]
+        )
+        return self._with_overhead(road_minutes, road_minutes == 0)
+
+    def schedule(self, table, matrix, order, extra=(), prizes=None, max_visits=None, start=None, end=None):
+        """
+        为当天安排景点：order为当天优先安排的景点顺序，extra为前几天未能安排、可顺延到当天的景点；
+        start和end为当天出发和返回地点（如酒店）的下标，给定时从出发地点到第一个景点、
+        从最后一个景点返回的移动时间也计入当天时间
+
+        返回 (安排的景点下标顺序, 每个景点的 (开始游玩分钟, 结束游玩分钟), 未能安排的景点下标)
+        """
+        nodes = [int(i) for i in order] + [int(i) for i in extra]
+        if not nodes:
+            return [], [], []
+
+        durations = [int(table.duration_minutes[i]) for i in nodes]
+        windows = [table.opening_windows[i] or [(0, MINUTES_PER_DAY)] for i in nodes]
+        # 出发和返回地点追加在景点之后，只参与移动时间计算
+        anchors = [int(i) for i in (start, end) if i is not None]
+        travel = self._travel_matrix(matrix, nodes + anchors)
+        # 排程中逐段查表，转成列表后按下标取值比numpy标量索引快；同时带上出发和返回地点在矩阵中的位置
+        travel = (travel.tolist(), self._bucket_bounds(travel),
+                  len(nodes) if start is not None else None,
+                  len(nodes) + len(anchors) - 1 if end is not None else None)
+        if prizes is None:
+            prizes = table.ratings + 1
+        node_prizes = [float(prizes[i]) for i in nodes]
+        # 当天原有的景点不受数量上限限制，上限只约束顺延景点的插入
+        max_visits = max(max_visits or len(nodes), len(order))
+
+        # 局部搜索得到的顺序可行时直接采用，只为顺延的景点寻找插入位置
+        route = list(range(len(order)))
+        visits = self._simulate(route, durations, windows, travel)
+        if visits is None:
+            route, visits = [], []
+        remaining = [local for local in range(len(nodes)) if local not in route]
+        # 插入景点只会推迟之后的到达时间，当前无法插入的景点之后也无法插入，不再重复尝试
+        candidates = list(remaining)
+
+        while candidates and len(route) < max_visits:
+            best = None
+            finish = visits[-1][1] if visits else self.day_start_minute
+            for local in list(candidates):
+                insertion = self._best_insertion(route, local, durations, windows, travel, finish)
+                if insertion is None:
+                    candidates.remove(local)
+                    continue
+                position, new_visits, added = insertion
+                ratio = node_prizes[local] / (added + 1)
+                if best is None or ratio > best[0]:
+                    best = (ratio, local, position, new_visits)
+            if best is None:
+                break
+            _, local, position, visits = best
+            route.insert(position, local)
+            remaining.remove(local)
+            candidates.remove(local)
+
+        return [nodes[local] for local in route], visits, [nodes[local] for local in remaining]
+
+    def _best_insertion(self, route, local, durations, windows, travel, finish):
+        """
+        返回把景点插入路线后当天结束时间推迟最少的可行位置 (位置, 新的时间安排, 新增耗时)
+        """
+        best = None
+        for position in range(len(route) + 1):
+            candidate = route[:position] + [local] + route[position:]
+            visits = self._simulate(candidate, durations, windows, travel)
+            if visits is None:
+                continue
+            added = visits[-1][1] - finish
+            if best is None or added < best[2]:
+                best = (position, visits, added)
+        return best
+
+    def _simulate(self, route, durations, windows, travel):
+        """
+        按顺序推算每个景点的开始和结束游玩时间，未开门时等待，任一景点无法在开放时间内
+        游玩完毕、或游玩加返回途中超出当天结束时间时返回None
+        """
+        matrices, bounds, start_local, end_local = travel
+        visits = []
+        current = self.day_start_minute
+        previous = start_local
+        for local in route:
+            if previous is not None:
+                current += matrices[bisect_right(bounds, current)][previous][local]
+            start = self._earliest_start(current, durations[local], windows[local])
+            if start is None:
+                return None
+            current = start + durations[local]
+            visits.append((start, current))
+            previous = local
+        # 给定返回地点时，返回途中的时间也须在当天结束前
+        if visits and end_local is not None:
+            if current + matrices[bisect_right(bounds, current)][previous][end_local] > self.day_end_minute:
+                return None
+        return visits
+
+    def _earliest_start(self, arrival, duration, windows):
+        for open_time, close_time in windows:
+            start = max(arrival, open_time)
+            if start + duration <= min(close_time, self.day_end_minute):
+                return start
+        return None
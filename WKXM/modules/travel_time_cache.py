@@ -0,0 +1,360 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from .concurrency import TokenBucket, get_executor
+from .distance_matrix import haversine_matrix
+
+# 各出行方式在没有校准数据时的平均速度（公里/小时）
+DEFAULT_MODE_SPEEDS_KMH = {'driving': 30.0, 'walking': 4.5, 'riding': 12.0, 'transit': 20.0}
+# 实际路线距离与直线距离之比的默认值
+DEFAULT_DETOUR_FACTOR = 1.3
+# 直线距离小于该值（公里）的路线不参与绕行系数校准，避免短距离的比值失真
+CALIBRATION_MIN_STRAIGHT_KM = 0.2
+
+
+def point_key(lat, lng):
+    """
+    坐标键，格式与高德接口一致为"经度,纬度"，保留5位小数（约1米）
+    """
+    return f'{float(lng):.5f},{float(lat):.5f}'
+
+
+class TravelTimeCache:
+    """
+    基于SQLite的景点间实际交通时间缓存
+
+    按 (起点, 终点, 出行方式, 时段) 保存高德路线规划返回的耗时和路线距离，时段为一天中
+    bucket_minutes分钟的区间；同时累计每种出行方式的实际距离/直线距离之比和平均速度，
+    缓存未命中时按"直线距离 × 校准后的绕行系数 ÷ 校准后的速度"估算。
+    开启fill_on_miss时未命中的点对排入后台批量补全，补全请求经共享HTTP客户端发出并按fill_rate限速，
+    补全后的请求直接使用缓存；默认关闭，交通时间主要由离线预热补全
+    """
+    def __init__(self, db_path=None, api=None, bucket_minutes=None, fill_on_miss=None, max_pending=None,
+                 batch_size=None, min_calibration_samples=None, fill_rate=None):
+        self.db_path = db_path or os.getenv('TRAVEL_TIME_DB_PATH', os.path.join('cache', 'travel_times.db'))
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.api = api
+        self.bucket_minutes = bucket_minutes or int(os.getenv('TRAVEL_TIME_BUCKET_MINUTES', 180))
+        if fill_on_miss is None:
+            fill_on_miss = os.getenv('TRAVEL_TIME_FILL_ON_MISS', '0') == '1'
+        self.fill_on_miss = fill_on_miss
+        # 后台补全每秒最多发出的路线规划请求数
+        self.fill_limiter = TokenBucket(fill_rate or float(os.getenv('TRAVEL_TIME_FILL_RATE', 2)))
+        self.max_pending = max_pending or int(os.getenv('TRAVEL_TIME_MAX_PENDING', 1000))
+        self.batch_size = batch_size or int(os.getenv('TRAVEL_TIME_BATCH_SIZE', 50))
+        # 累计样本数达到该值后才使用校准的绕行系数和速度
+        self.min_calibration_samples = min_calibration_samples or int(
+            os.getenv('TRAVEL_TIME_MIN_CALIBRATION_SAMPLES', 5))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # 等待后台补全的 (起点键, 终点键, 出行方式)
+        self._pending = {}
+        self._draining = False
+        self._calibration = {}
+        self.stats = {'hits': 0, 'misses': 0, 'fetched': 0, 'fetch_failures': 0}
+        self._init_schema()
+        self._load_calibration()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        self._connect().executescript('''
+            CREATE TABLE IF NOT EXISTS travel_times (
+                mode TEXT NOT NULL,
+                origin TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                minutes REAL NOT NULL,
+                distance_km REAL NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (mode, origin, destination, bucket)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS detour_calibration (
+                mode TEXT PRIMARY KEY,
+                straight_km REAL NOT NULL,
+                road_km REAL NOT NULL,
+                minutes REAL NOT NULL,
+                samples INTEGER NOT NULL
+            );
+        ''')
+
+    def _load_calibration(self):
+        rows = self._connect().execute('SELECT mode, straight_km, road_km, minutes, samples FROM detour_calibration')
+        with self._lock:
+            self._calibration = {row[0]: row[1:] for row in rows}
+
+    def bucket_of(self, minute):
+        """
+        一天中第minute分钟所属的时段
+        """
+        return int(minute % 1440) // self.bucket_minutes
+
+    def detour_factor(self, mode):
+        with self._lock:
+            calibration = self._calibration.get(mode)
+        if calibration is None or calibration[3] < self.min_calibration_samples or calibration[0] <= 0:
+            return DEFAULT_DETOUR_FACTOR
+        return calibration[1] / calibration[0]
+
+    def speed_kmh(self, mode, default=None):
+        with self._lock:
+            calibration = self._calibration.get(mode)
+        if calibration is None or calibration[3] < self.min_calibration_samples or calibration[2] <= 0:
+            return default or DEFAULT_MODE_SPEEDS_KMH.get(mode, DEFAULT_MODE_SPEEDS_KMH['driving'])
+        return calibration[1] / (calibration[2] / 60)
+
+    def estimate_minutes(self, straight_km, mode, speed_kmh=None):
+        """
+        按校准后的绕行系数和速度由直线距离估算交通时间（分钟），缺少坐标时为无穷大
+        """
+        straight_km = np.asarray(straight_km, dtype=float)
+        return straight_km * self.detour_factor(mode) / self.speed_kmh(mode, speed_kmh) * 60
+
+    def travel_matrix(self, lats, lngs, mode, buckets, speed_kmh=None, straight=None):
+        """
+        一组坐标两两之间在各时段的交通时间矩阵（分钟），形状为 (时段数, 点数, 点数)；
+        straight为已经算好的直线距离矩阵（公里），不传时按坐标计算
+
+        优先使用同一时段的缓存，其次使用其他时段缓存的平均值，都没有时按直线距离估算，
+        并把未缓存的点对排入后台补全；缺少坐标（纬度或经度为0）的点与其他点之间为无穷大
+        """
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        size = len(lats)
+        valid = (lats != 0) & (lngs != 0)
+        if straight is None:
+            straight = haversine_matrix(lats, lngs)
+        estimate = self.estimate_minutes(straight, mode, speed_kmh)
+        estimate[~valid, :] = np.inf
+        estimate[:, ~valid] = np.inf
+        result = np.repeat(estimate[None, :, :], len(buckets), axis=0)
+        if size < 2:
+            return result
+
+        keys = [point_key(lat, lng) for lat, lng in zip(lats, lngs)]
+        key_index = {}
+        positions = {}
+        for index, key in enumerate(keys):
+            if valid[index]:
+                positions.setdefault(key, []).append(index)
+        bucket_positions = {bucket: position for position, bucket in enumerate(buckets)}
+
+        # cached[i, j]：其他时段的耗时之和与次数，用于同一时段没有缓存时取平均
+        cached_sum = np.zeros((size, size))
+        cached_count = np.zeros((size, size))
+        exact = np.zeros((len(buckets), size, size), dtype=bool)
+        placeholders = ','.join('?' * len(positions))
+        rows = self._connect().execute(
+            f'SELECT origin, destination, bucket, minutes FROM travel_times '
+            f'WHERE mode = ? AND origin IN ({placeholders}) AND destination IN ({placeholders})',
+            [mode] + list(positions) + list(positions)
+        ).fetchall() if positions else []
+        for origin, destination, bucket, minutes in rows:
+            for i in positions[origin]:
+                for j in positions[destination]:
+                    cached_sum[i, j] += minutes
+                    cached_count[i, j] += 1
+                    if bucket in bucket_positions:
+                        result[bucket_positions[bucket], i, j] = minutes
+                        exact[bucket_positions[bucket], i, j] = True
+
+        averaged = np.divide(cached_sum, cached_count, out=np.zeros_like(cached_sum), where=cached_count > 0)
+        for position in range(len(buckets)):
+            use_average = ~exact[position] & (cached_count > 0)
+            result[position][use_average] = averaged[use_average]
+
+        # 同一坐标之间为0，其余未缓存的有效点对计入未命中
+        key_ids = np.array([key_index.setdefault(key, len(key_index)) for key in keys])
+        same = (key_ids[:, None] == key_ids[None, :]) & valid[:, None] & valid[None, :]
+        result[:, same] = 0.0
+        missing = (cached_count == 0) & ~same & valid[:, None] & valid[None, :]
+        hits = int((~missing & ~same & valid[:, None] & valid[None, :]).sum())
+        misses = int(missing.sum())
+        with self._lock:
+            self.stats['hits'] += hits
+            self.stats['misses'] += misses
+        if misses and self._fills_misses():
+            self.enqueue([(keys[i], keys[j]) for i, j in zip(*np.nonzero(missing))], mode)
+        return result
+
+    def minutes_between(self, origin, destination, mode, bucket, speed_kmh=None, straight_km=None):
+        """
+        两个 (纬度, 经度) 坐标之间的交通时间（分钟），查找顺序与travel_matrix相同；
+        straight_km为已经算好的直线距离（公里）
+        """
+        if not (origin[0] and origin[1] and destination[0] and destination[1]):
+            return float('inf')
+        origin_key = point_key(*origin)
+        destination_key = point_key(*destination)
+        if origin_key == destination_key:
+            return 0.0
+        rows = self._connect().execute(
+            'SELECT bucket, minutes FROM travel_times WHERE mode = ? AND origin = ? AND destination = ?',
+            (mode, origin_key, destination_key)
+        ).fetchall()
+        with self._lock:
+            self.stats['hits' if rows else 'misses'] += 1
+        if not rows:
+            if self._fills_misses():
+                self.enqueue([(origin_key, destination_key)], mode)
+            if straight_km is None:
+                straight_km = haversine_matrix([origin[0]], [origin[1]], [destination[0]], [destination[1]])[0, 0]
+            return float(self.estimate_minutes(straight_km, mode, speed_kmh))
+        for row_bucket, minutes in rows:
+            if row_bucket == bucket:
+                return float(minutes)
+        return float(sum(minutes for _, minutes in rows) / len(rows))
+
+    def _fills_misses(self):
+        return self.fill_on_miss and self.api is not None and bool(getattr(self.api, 'amap_api_key', None))
+
+    def enqueue(self, pairs, mode):
+        """
+        把未缓存的点对排入后台批量补全，未配置高德接口或排队数量已满时忽略
+        """
+        if self.api is None or not getattr(self.api, 'amap_api_key', None):
+            return
+        with self._lock:
+            for origin, destination in pairs:
+                if len(self._pending) >= self.max_pending:
+                    break
+                self._pending[(origin, destination, mode)] = True
+            if not self._pending or self._draining:
+                return
+            self._draining = True
+        get_executor('travel_time_fill', 1).submit(self._drain)
+
+    def _drain(self):
+        """
+        后台逐批补全排队的点对，直到队列为空
+        """
+        while True:
+            with self._lock:
+                batch = list(self._pending)[:self.batch_size]
+                for key in batch:
+                    del self._pending[key]
+                if not batch:
+                    self._draining = False
+                    return
+            for origin, destination, mode in batch:
+                self.fill_limiter.acquire()
+                self.fetch(origin, destination, mode)
+
+    def fill(self, pairs, mode):
+        """
+        同步补全一批点对（用于离线预热），已有当前时段缓存的点对跳过，返回当前时段已缓存的点对数量
+        """
+        bucket = self.bucket_of(self._current_minute())
+        cached = 0
+        for origin, destination in pairs:
+            row = self._connect().execute(
+                'SELECT 1 FROM travel_times WHERE mode = ? AND origin = ? AND destination = ? AND bucket = ?',
+                (mode, origin, destination, bucket)
+            ).fetchone()
+            if row is not None or self.fetch(origin, destination, mode):
+                cached += 1
+        return cached
+
+    def fetch(self, origin, destination, mode):
+        """
+        调用高德路线规划获取一个点对当前时段的交通时间并写入缓存，同时更新绕行系数校准，返回是否成功
+        """
+        try:
+            result = self.api.get_amap_route(origin, destination, mode)
+            minutes, road_km = self._parse_route(result, mode)
+        except Exception as e:
+            print(f"获取交通时间失败: {e}")
+            minutes = None
+        if minutes is None:
+            with self._lock:
+                self.stats['fetch_failures'] += 1
+            return False
+
+        bucket = self.bucket_of(self._current_minute())
+        origin_lng, origin_lat = (float(value) for value in origin.split(','))
+        dest_lng, dest_lat = (float(value) for value in destination.split(','))
+        straight_km = float(haversine_matrix([origin_lat], [origin_lng], [dest_lat], [dest_lng])[0, 0])
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO travel_times (mode, origin, destination, bucket, minutes, distance_km, '
+                'fetched_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (mode, origin, destination, bucket, minutes, road_km, time.time())
+            )
+            if straight_km >= CALIBRATION_MIN_STRAIGHT_KM and road_km > 0:
+                conn.execute(
+                    'INSERT INTO detour_calibration (mode, straight_km, road_km, minutes, samples) '
+                    'VALUES (?, ?, ?, ?, 1) ON CONFLICT(mode) DO UPDATE SET '
+                    'straight_km = straight_km + excluded.straight_km, road_km = road_km + excluded.road_km, '
+                    'minutes = minutes + excluded.minutes, samples = samples + 1',
+                    (mode, straight_km, road_km, minutes)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._load_calibration()
+        with self._lock:
+            self.stats['fetched'] += 1
+        return True
+
+    @staticmethod
+    def _parse_route(result, mode):
+        """
+        从高德路线规划结果中取出第一条路线的耗时（分钟）和距离（公里），失败时返回 (None, None)
+        """
+        if not isinstance(result, dict):
+            return None, None
+        route = result.get('route') or result.get('data') or {}
+        candidates = route.get('transits') if mode == 'transit' else route.get('paths')
+        if not candidates:
+            return None, None
+        first = candidates[0]
+        try:
+            return float(first['duration']) / 60, float(first['distance']) / 1000
+        except (KeyError, TypeError, ValueError):
+            return None, None
+
+    @staticmethod
+    def _current_minute():
+        now = datetime.now()
+        return now.hour * 60 + now.minute
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['pending'] = len(self._pending)
+        stats['detour_factor'] = round(self.detour_factor('driving'), 3)
+        return stats
+
+
+_travel_time_cache = None
+_travel_time_cache_lock = threading.Lock()
+
+
+def get_travel_time_cache(api=None):
+    """
+    获取进程级共享的交通时间缓存，api用于后台补全
+    """
+    global _travel_time_cache
+    with _travel_time_cache_lock:
+        if _travel_time_cache is None:
+            _travel_time_cache = TravelTimeCache(api=api)
+        elif _travel_time_cache.api is None:
+            _travel_time_cache.api = api
+        return _travel_time_cache
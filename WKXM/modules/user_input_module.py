@@ -1,32 +1,58 @@
 import re
-import requests
 import os
 from geopy.geocoders import Nominatim
 from datetime import datetime
+from .http_client import get_http_client
+
+# 常见城市别名映射
+CITY_ALIASES = {
+    "大理": "大理市",
+    "北京": "北京市",
+    "上海": "上海市",
+    "广州": "广州市",
+    "深圳": "深圳市",
+    "杭州": "杭州市",
+    "成都": "成都市",
+    "重庆": "重庆市",
+    "西安": "西安市",
+    "南京": "南京市",
+    "武汉": "武汉市",
+    "苏州": "苏州市",
+    "厦门": "厦门市",
+    "青岛": "青岛市",
+    "大连": "大连市",
+    "天津": "天津市"
+}
+
+
+def normalize_city_name(city):
+    """
+    标准化城市名称：转换常见别名，缺少行政后缀时补全"市"
+    例如"大理"和"大理市"都会得到"大理市"，可用于缓存键等需要统一城市名的场景
+    """
+    if not city:
+        return ""
+    
+    # 去除空白字符
+    city = city.strip()
+    
+    # 转换常见别名
+    if city in CITY_ALIASES:
+        return CITY_ALIASES[city]
+    
+    # 如果没有城市后缀，添加"市"
+    if not any(suffix in city for suffix in ["市", "区", "县", "州", "盟"]):
+        return f"{city}市"
+    
+    return city
+
 
 class UserInputModule:
     def __init__(self):
         # 初始化地理编码器
         self.geolocator = Nominatim(user_agent="zhiyou_travel_app")
         # 常见城市别名映射
-        self.city_aliases = {
-            "大理": "大理市",
-            "北京": "北京市",
-            "上海": "上海市",
-            "广州": "广州市",
-            "深圳": "深圳市",
-            "杭州": "杭州市",
-            "成都": "成都市",
-            "重庆": "重庆市",
-            "西安": "西安市",
-            "南京": "南京市",
-            "武汉": "武汉市",
-            "苏州": "苏州市",
-            "厦门": "厦门市",
-            "青岛": "青岛市",
-            "大连": "大连市",
-            "天津": "天津市"
-        }
+        self.city_aliases = CITY_ALIASES
     
     def process_input(self, province, city, days, preferences):
         """
@@ -65,22 +91,7 @@ class UserInputModule:
         """
         处理城市名称，转换别名，添加城市后缀
         """
-        if not city:
-            return ""
-        
-        # 去除空白字符
-        city = city.strip()
-        
-        # 转换常见别名
-        if city in self.city_aliases:
-            return self.city_aliases[city]
-        
-        # 如果没有城市后缀，添加"市"
-        if not any(suffix in city for suffix in ["市", "区", "县", "州", "盟"]):
-            # 对于特殊情况，如"北京"直接返回"北京市"
-            return f"{city}市"
-        
-        return city
+        return normalize_city_name(city)
     
     def _validate_city(self, city):
         """
@@ -117,7 +128,7 @@ class UserInputModule:
                 'address': city
             }
             
-            response = requests.get(url, params=params)
+            response = get_http_client().get(url, params=params, timeout=10)
             data = response.json()
             
             return data.get('status') == '1' and len(data.get('geocodes', [])) > 0
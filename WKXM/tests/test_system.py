@@ -3,6 +3,7 @@ import sys
 import os
 import json
 import datetime
+import numpy as np
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -15,6 +16,21 @@ from modules.route_planning_module import RoutePlanningModule
 from modules.seasonal_optimization_module import SeasonalOptimizationModule
 from modules.itinerary_output_module import ItineraryOutputModule
 from modules.visualization_module import VisualizationModule
+from modules.http_client import get_http_client, ConnectionStats, request_connection_stats
+from modules.concurrency import get_executor, discard_executor, run_stages, SingleFlight, TokenBucket
+from modules.async_api_integration import AsyncAPIIntegration
+from modules.response_cache import ResponseCache
+from modules.city_adcode_table import lookup_adcode
+from modules.spot_store import SpotStore, SpotMemoryCache
+from modules.cache_warmer import CacheWarmer
+from modules import spot_tokenizer
+from modules.spatial_index import SpatialIndex, haversine_m
+from modules.distance_matrix import DistanceMatrix
+from modules.spot_table import SpotTable, parse_opening_hours
+from modules.local_search import LocalSearch
+from modules.time_window_scheduler import TimeWindowScheduler
+from modules.day_partitioner import BalancedKMedoids
+from modules.orienteering import OrienteeringSelector
 
 class TestUserInputModule(unittest.TestCase):
     """测试用户输入与识别模块"""
@@ -104,6 +120,84 @@ class TestScenicSpotModule(unittest.TestCase):
             # 验证筛选后的景点包含自然风光类型
             self.assertTrue(any(spot.get('type') in ["自然景观", "湖泊", "山岳"] for spot in nature_spots))
 
+    def test_enrich_spot_info_in_chunks(self):
+        """测试分块并发丰富景点信息，失败分块回退为默认值"""
+        spots = [{'name': f'景点{i}', 'location': '100.2,25.6'} for i in range(25)]
+        requested_chunks = []
+        
+        def fake_detail(city_name, spot_names):
+            requested_chunks.append(list(spot_names))
+            if '景点20' in spot_names:
+                raise RuntimeError('LLM unavailable')
+            return [{'name': name, 'visit_duration': '约2小时'} for name in spot_names]
+        
+        self.spot_module.enrich_chunk_size = 10
+        self.spot_module._get_spots_detail_from_llm = fake_detail
+        enriched = self.spot_module._enrich_spot_info(spots, '大理市')
+        
+        self.assertEqual(len(requested_chunks), 3)
+        self.assertEqual(len(enriched), 25)
+        self.assertEqual(enriched[0]['visit_duration'], '约2小时')
+        self.assertEqual(enriched[19]['visit_duration'], '约2小时')
+        self.assertEqual(enriched[24]['visit_duration'], '约1小时')
+    
+    def test_stale_while_revalidate(self):
+        """测试过期数据先返回旧值并在后台刷新"""
+        import tempfile
+        import time
+        with tempfile.TemporaryDirectory() as temp_dir:
+            module = self.spot_module
+            module.store = SpotStore(os.path.join(temp_dir, 'spots.db'))
+            module.memory_cache = SpotMemoryCache()
+            module._enrich_spot_info = lambda spots, city_name: spots
+            
+            def wait_for_refresh():
+                for _ in range(100):
+                    if not module.get_refresh_stats()['in_progress']:
+                        return
+                    time.sleep(0.01)
+            
+            now = time.time()
+            module.store.replace_city_spots('测试市', [{'name': '旧景点'}], refreshed_at=now - 100, expires_at=now - 10)
+            
+            # 后台刷新失败时保留旧数据并记录失败
+            def failing_fetch(city_name):
+                raise RuntimeError('API unavailable')
+            module._fetch_spots_from_api = failing_fetch
+            self.assertEqual(module.get_city_spots('测试市'), [{'name': '旧景点'}])
+            wait_for_refresh()
+            self.assertEqual(module.get_refresh_stats()['failures'], 1)
+            self.assertEqual(module.store.get_city_meta('测试市')['expires_at'], now - 10)
+            
+            # 退避期内不重新获取；返回空结果同样保留旧数据并记为失败
+            fetched = []
+            module._fetch_spots_from_api = lambda city_name: fetched.append(city_name) or []
+            self.assertEqual(module.get_city_spots('测试市'), [{'name': '旧景点'}])
+            wait_for_refresh()
+            self.assertEqual(fetched, [])
+            module._refresh_backoff['测试市'] = (1, 0)
+            self.assertEqual(module.get_city_spots('测试市'), [{'name': '旧景点'}])
+            wait_for_refresh()
+            self.assertEqual(fetched, ['测试市'])
+            self.assertEqual(module.get_refresh_stats()['failures'], 2)
+            self.assertEqual(module._refresh_backoff['测试市'][0], 2)
+            self.assertEqual(module.get_city_spots('测试市'), [{'name': '旧景点'}])
+            
+            module._refresh_backoff['测试市'] = (2, 0)
+            module._fetch_spots_from_api = lambda city_name: [{'name': '新景点'}]
+            self.assertEqual(module.get_city_spots('测试市'), [{'name': '旧景点'}])
+            wait_for_refresh()
+            self.assertEqual(module.get_city_spots('测试市'), [{'name': '新景点'}])
+            meta = module.store.get_city_meta('测试市')
+            self.assertLessEqual(meta['expires_at'] - meta['refreshed_at'], module.cache_ttl * (1 + module.cache_ttl_jitter))
+            
+            # 超过最长容忍时间后同步刷新
+            module.store.replace_city_spots('测试市', [{'name': '旧景点'}], refreshed_at=now - 100,
+                                            expires_at=now - module.max_staleness - 1)
+            self.assertEqual(module.get_city_spots('测试市'), [{'name': '新景点'}])
+            self.assertEqual(module.get_refresh_stats()['stale_served'], 5)
+            self.assertEqual(module.get_refresh_stats()['backoff'], [])
+
 class TestRoutePlanningModule(unittest.TestCase):
     """测试智能路线规划引擎"""
     
@@ -153,6 +247,348 @@ class TestRoutePlanningModule(unittest.TestCase):
         self.assertEqual(optimized[0]['id'], '1')
         self.assertEqual(optimized[1]['id'], '2')
         self.assertEqual(optimized[2]['id'], '3')
+    
+    def test_distance_matrix(self):
+        """测试距离矩阵与逐对计算一致，缺少坐标时距离为无穷大"""
+        locations = [(25.6, 100.2), (25.7, 100.3), (0, 0)]
+        matrix = DistanceMatrix.from_locations(locations)
+        
+        self.assertAlmostEqual(matrix.distance(0, 1),
+                               self.route_module._haversine_distance(locations[0], locations[1]), places=6)
+        self.assertEqual(matrix.distance(1, 1), 0)
+        self.assertEqual(matrix.distance(0, 2), float('inf'))
+        self.assertEqual(matrix.nearest(0, [2, 1]), 1)
+        self.assertAlmostEqual(matrix.path_length([0, 1, 0]), 2 * matrix.distance(0, 1))
+    
+    def test_spot_table(self):
+        """测试景点解析为列式表"""
+        table = SpotTable([
+            {'name': '洱海', 'location': '100.2,25.6', 'rating': '4.5', 'visit_duration': '约2小时', 'type': '湖泊'},
+            {'name': '苍山', 'latitude': 25.7, 'longitude': 100.1, 'rating': [], 'visit_duration': '约30分钟',
+             'type': '山岳', 'seasonal_score': 8.0},
+            {'name': '古城', 'visit_duration': '约半天', 'type': '古城'}
+        ])
+        
+        self.assertEqual(table.lats.tolist(), [25.6, 25.7, 0])
+        self.assertEqual(table.duration_minutes.tolist(), [120, 30, 240])
+        self.assertEqual(table.ratings.tolist(), [4.5, 0.0, 0.0])
+        self.assertEqual(table.seasonal_scores.tolist(), [0.0, 8.0, 0.0])
+        # 湖泊和山岳同属自然风光：3分；与自身类型相同：5+3分
+        self.assertEqual(table.theme_scores([1, 2], [0, 1]).tolist(), [11.0, 0.0])
+        self.assertEqual(table.to_spots([2])[0]['name'], '古城')
+    
+    def test_plan_route_assigns_each_spot_once(self):
+        """测试优化规划中每个景点恰好安排一次"""
+        import random
+        rng = random.Random(3)
+        spots = [{'name': f'景点{i}', 'location': f'{100 + rng.random():.4f},{25 + rng.random():.4f}',
+                  'rating': f'{rng.uniform(3, 5):.1f}', 'visit_duration': '约2小时', 'type': '湖泊'}
+                 for i in range(12)]
+        
+        random.seed(0)
+        plan = self.route_module.plan_route(spots, 4)
+        
+        self.assertEqual(len(plan), 4)
+        names = [spot['name'] for day in plan for spot in day['spots']]
+        # 当天时间内放不下的景点记录在最后一天的unscheduled_spots中
+        unscheduled = [spot['name'] for spot in plan[-1].get('unscheduled_spots', [])]
+        self.assertEqual(sorted(names + unscheduled), sorted(spot['name'] for spot in spots))
+        stats = self.route_module.calculate_route_statistics(plan)
+        self.assertEqual(stats['total_spots'], len(names))
+        self.assertGreater(stats['total_distance_estimate'], 0)
+    
+    def test_local_search(self):
+        """测试2-opt/Or-opt局部搜索改进固定起终点的路线"""
+        # 起点0，终点5，中间景点沿经度排成一线，贪心顺序来回折返
+        matrix = DistanceMatrix([25.0] * 6, [100.0, 100.1, 100.2, 100.3, 100.4, 100.5])
+        order, report = LocalSearch(time_budget_ms=1000).improve(matrix, [3, 1, 4, 2], start=0, end=5)
+        
+        self.assertEqual(order, [1, 2, 3, 4])
+        self.assertAlmostEqual(report['optimized_distance_km'], matrix.distance(0, 5), places=2)
+        self.assertGreater(report['reduction_km'], 0)
+        
+        # 缺少坐标时保持原顺序
+        matrix = DistanceMatrix([25.0, 0, 25.2], [100.0, 0, 100.2])
+        order, report = LocalSearch().improve(matrix, [2, 0, 1])
+        self.assertEqual(order, [2, 0, 1])
+        self.assertIsNone(report['greedy_distance_km'])
+    
+    def test_plan_route_reports_route_optimization(self):
+        """测试每天的行程附带相对贪心路线的距离改进"""
+        import random
+        rng = random.Random(11)
+        spots = [{'name': f'景点{i}', 'location': f'{100 + rng.random():.4f},{25 + rng.random():.4f}',
+                  'rating': f'{rng.uniform(3, 5):.1f}', 'visit_duration': '约1小时', 'type': '山岳'}
+                 for i in range(15)]
+        
+        plan = self.route_module.plan_route(spots, 3, seed=2)
+        for day in plan:
+            report = day['route_optimization']
+            self.assertGreaterEqual(report['reduction_km'], 0)
+            self.assertLessEqual(report['optimized_distance_km'], report['greedy_distance_km'])
+        
+        stats = self.route_module.calculate_route_statistics(plan)
+        self.assertAlmostEqual(stats['route_optimization']['reduction_km'],
+                               sum(day['route_optimization']['reduction_km'] for day in plan), places=3)
+    
+    def test_parse_opening_hours(self):
+        """测试开放时间解析"""
+        self.assertEqual(parse_opening_hours('07:30-18:30'), [(450, 1110)])
+        self.assertEqual(parse_opening_hours('全天开放'), [(0, 1440)])
+        self.assertEqual(parse_opening_hours('09:00-17:00（周一闭馆）'), [(540, 1020)])
+        self.assertEqual(parse_opening_hours('14:00-18:00, 08:00-12:00'), [(480, 720), (840, 1080)])
+        self.assertEqual(parse_opening_hours('18:00-次日02:00'), [(1080, 1560)])
+        self.assertIsNone(parse_opening_hours('暂无信息'))
+        self.assertIsNone(parse_opening_hours([]))
+    
+    def test_time_window_scheduler(self):
+        """测试按开放时间安排游玩顺序和时间，放不下的景点顺延"""
+        spots = [
+            {'name': '夜市', 'location': '100.20,25.60', 'visit_duration': '约2小时', 'opening_hours': '15:00-22:00'},
+            {'name': '博物馆', 'location': '100.21,25.60', 'visit_duration': '约2小时', 'opening_hours': '09:00-12:00'},
+            {'name': '古城', 'location': '100.22,25.60', 'visit_duration': '约3小时', 'opening_hours': '全天开放'},
+            {'name': '寺庙', 'location': '100.23,25.60', 'visit_duration': '约3小时', 'opening_hours': '08:00-17:00'}
+        ]
+        table = SpotTable(spots)
+        matrix = DistanceMatrix(table.lats, table.lngs)
+        scheduler = TimeWindowScheduler(day_start_minute=510, day_end_minute=1020)
+        
+        # 按原顺序夜市排在最前，未开门；调度器把博物馆安排在上午、夜市安排在下午
+        order, visits, unscheduled = scheduler.schedule(table, matrix, [0, 1, 2, 3])
+        
+        self.assertEqual(order[0], 1)
+        self.assertIn(0, order)
+        self.assertEqual(sorted(order + unscheduled), [0, 1, 2, 3])
+        self.assertTrue(unscheduled)
+        for spot_index, (start, end) in zip(order, visits):
+            windows = table.opening_windows[spot_index]
+            self.assertTrue(any(open_time <= start and end <= close_time for open_time, close_time in windows))
+            self.assertLessEqual(end, 1020)
+        self.assertTrue(all(visits[i][1] <= visits[i + 1][0] for i in range(len(visits) - 1)))
+    
+    def test_time_window_scheduler_anchor_legs(self):
+        """测试往返酒店的移动时间计入当天时间，路线报告按调度后的顺序计算"""
+        spots = [
+            {'name': '古城', 'location': '100.20,25.60', 'visit_duration': '约3小时', 'opening_hours': '全天开放'},
+            {'name': '寺庙', 'location': '100.21,25.60', 'visit_duration': '约3小时', 'opening_hours': '全天开放'},
+            {'name': '酒店', 'location': '100.80,25.60', 'visit_duration': '约1小时'}
+        ]
+        table = SpotTable(spots)
+        matrix = DistanceMatrix(table.lats, table.lngs)
+        scheduler = TimeWindowScheduler(day_start_minute=510, day_end_minute=1020)
+        
+        order, visits, unscheduled = scheduler.schedule(table, matrix, [0, 1])
+        self.assertEqual((len(order), unscheduled), (2, []))
+        
+        # 酒店单程约两小时，往返后当天只能安排一个景点
+        order, visits, unscheduled = scheduler.schedule(table, matrix, [0, 1], start=2, end=2)
+        leg = scheduler.travel_minutes(matrix.distance(2, order[0]))
+        self.assertEqual(len(order), 1)
+        self.assertEqual(len(unscheduled), 1)
+        self.assertAlmostEqual(visits[0][0], 510 + leg)
+        self.assertLessEqual(visits[0][1] + leg, 1020)
+        
+        # 调度器调整了局部搜索的顺序时，报告中的优化后距离对应最终顺序
+        spots = [
+            {'name': '夜市', 'location': '100.20,25.60', 'visit_duration': '约2小时', 'opening_hours': '15:00-22:00'},
+            {'name': '博物馆', 'location': '100.30,25.60', 'visit_duration': '约2小时', 'opening_hours': '09:00-12:00'},
+            {'name': '古城', 'location': '100.10,25.60', 'visit_duration': '约2小时', 'opening_hours': '全天开放'}
+        ]
+        ctx = self.route_module._build_context(spots)
+        daily_plan, order, _ = self.route_module._build_daily_plan(ctx, [2, 0, 1], 1)
+        expected = sum(ctx.matrix.distance(a, b) for a, b in zip(order, order[1:]))
+        self.assertEqual(order[0], 1)
+        self.assertAlmostEqual(daily_plan['route_optimization']['optimized_distance_km'], expected, places=2)
+    
+    def test_balanced_k_medoids(self):
+        """测试均衡k-medoids按地理位置划分且各簇工作量均衡"""
+        import random
+        rng = random.Random(4)
+        # 三个相距较远的景点群，各20个景点
+        centers = [(25.0, 100.0), (26.0, 101.0), (24.0, 102.0)]
+        lats = [lat + rng.gauss(0, 0.02) for lat, _ in centers for _ in range(20)]
+        lngs = [lng + rng.gauss(0, 0.02) for _, lng in centers for _ in range(20)]
+        
+        medoids, labels = BalancedKMedoids().fit(lats + [0], lngs + [0], 3, rng=random.Random(0))
+        
+        self.assertEqual(len(medoids), 3)
+        self.assertEqual(labels[-1], -1)
+        for group in range(3):
+            self.assertEqual(len(set(labels[group * 20:(group + 1) * 20])), 1)
+        self.assertEqual(sorted(labels[:60].tolist()), sorted([0] * 20 + [1] * 20 + [2] * 20))
+    
+    def test_plan_route_partitions_large_inputs(self):
+        """测试候选景点很多时每天的景点来自同一区域"""
+        import random
+        rng = random.Random(8)
+        centers = [(100.0, 25.0), (101.0, 26.0), (102.0, 24.0)]
+        spots = [{'name': f'{group}-{i}', 'location': f'{lng + rng.gauss(0, 0.03):.5f},{lat + rng.gauss(0, 0.03):.5f}',
+                  'rating': f'{rng.uniform(3, 5):.1f}', 'visit_duration': '约1小时', 'type': '古城'}
+                 for group, (lng, lat) in enumerate(centers) for i in range(40)]
+        
+        plan = self.route_module.plan_route(spots, 3, seed=1)
+        
+        self.assertEqual(len(plan), 3)
+        groups = [{spot['name'].split('-')[0] for spot in day['spots']} for day in plan]
+        self.assertTrue(all(len(day_groups) == 1 for day_groups in groups))
+        self.assertEqual(set.union(*groups), {'0', '1', '2'})
+    
+    def test_orienteering_selector(self):
+        """测试按时间预算选择奖励最高的景点并返回排序后的备选"""
+        prizes = [9, 3, 8, 7, 1]
+        durations = [120, 60, 120, 60, 60]
+        travel = [[0 if i == j else 30 for j in range(5)] for i in range(5)]
+        
+        routes, alternates = OrienteeringSelector().select(prizes, durations, travel, 1, 300)
+        
+        # 预算300分钟：景点0、1、3加两次移动恰好300分钟，奖励19，高于景点0、2的17
+        self.assertEqual(sorted(routes[0]), [0, 1, 3])
+        self.assertEqual(alternates, [2, 4])
+        self.assertLessEqual(OrienteeringSelector.route_minutes(routes[0], np.array(durations), np.array(travel)), 300)
+    
+    def test_plan_route_returns_alternates(self):
+        """测试景点多于行程容量时未选景点作为备选返回"""
+        import random
+        rng = random.Random(6)
+        spots = [{'name': f'景点{i}', 'location': f'{100.2 + rng.random() * 0.1:.4f},{25.6 + rng.random() * 0.1:.4f}',
+                  'rating': f'{rng.uniform(3, 5):.1f}', 'visit_duration': '约2小时', 'type': '古城',
+                  'seasonal_score': rng.uniform(0, 10)}
+                 for i in range(20)]
+        
+        plan = self.route_module.plan_route(spots, 2, seed=3)
+        
+        names = [spot['name'] for day in plan for spot in day['spots']]
+        alternates = [spot['name'] for day in plan for spot in day['alternates']]
+        unscheduled = [spot['name'] for spot in plan[-1].get('unscheduled_spots', [])]
+        self.assertTrue(alternates)
+        self.assertEqual(sorted(names + alternates + unscheduled), sorted(spot['name'] for spot in spots))
+        for day in plan:
+            self.assertLessEqual(day['schedule'][-1]['departure_time'], '17:00')
+    
+    def test_plan_route_with_seed(self):
+        """测试指定种子时规划结果可复现"""
+        import random
+        rng = random.Random(5)
+        spots = [{'name': f'景点{i}', 'location': f'{100 + rng.random():.4f},{25 + rng.random():.4f}',
+                  'rating': f'{rng.uniform(3, 5):.1f}', 'visit_duration': '约1小时', 'type': '古城'}
+                 for i in range(20)]
+        
+        def names(plan):
+            return [[spot['name'] for spot in day['spots']] for day in plan]
+        
+        first = self.route_module.plan_route(spots, 5, seed=7)
+        random.seed(1)
+        second = self.route_module.plan_route(spots, 5, seed=7)
+        self.assertEqual(names(first), names(second))
+
+    def test_plan_route_with_restarts(self):
+        """测试多起点规划结果可复现且不差于单次规划"""
+        import random
+        rng = random.Random(3)
+        spots = [{'name': f'景点{i}', 'location': f'{100 + rng.random():.4f},{25 + rng.random():.4f}',
+                  'rating': f'{rng.uniform(3, 5):.1f}', 'visit_duration': '约1小时', 'type': '古城'}
+                 for i in range(14)]
+
+        def names(plan):
+            return [[spot['name'] for spot in day['spots']] for day in plan]
+
+        single = self.route_module.plan_route(spots, 4, seed=7)
+        first = self.route_module.plan_route(spots, 4, seed=7, restarts=3)
+        second = self.route_module.plan_route(spots, 4, seed=7, restarts=3)
+        self.assertEqual(names(first), names(second))
+        self.assertGreaterEqual(self.route_module._plan_objective(first, None),
+                                self.route_module._plan_objective(single, None))
+
+    def test_plan_route_with_time_budget(self):
+        """测试按时间预算规划在预算内返回并报告迭代和改进"""
+        import random
+        import time
+        rng = random.Random(3)
+        spots = [{'name': f'景点{i}', 'location': f'{100 + rng.random():.4f},{25 + rng.random():.4f}',
+                  'rating': f'{rng.uniform(3, 5):.1f}', 'visit_duration': '约1小时', 'type': '古城'}
+                 for i in range(14)]
+
+        start = time.perf_counter()
+        plans = self.route_module.plan_route(spots, 4, seed=7, time_budget_ms=100)
+        self.assertLess(time.perf_counter() - start, 0.3)
+        self.assertEqual(len(plans), 4)
+        report = self.route_module.last_planning_report
+        self.assertGreaterEqual(report['iterations'], 1)
+        self.assertGreaterEqual(report['improvement'], 0)
+        self.assertAlmostEqual(report['best_objective'], self.route_module._plan_objective(plans, None), places=2)
+
+    def test_accommodation_selector(self):
+        """测试按每天景点中心选择住宿地点，长行程中途更换住宿"""
+        from modules.accommodation import AccommodationSelector
+        selector = AccommodationSelector(split_min_days=4, switch_penalty_km=5)
+        hotel_lats, hotel_lngs = [25.0, 26.0, 25.5], [100.0, 101.0, 100.5]
+        day_hotels, _ = selector.select(hotel_lats, hotel_lngs, [25.0, 25.0, 26.0, 26.0],
+                                        [100.0, 100.0, 101.0, 101.0], [True] * 4)
+        self.assertEqual(day_hotels, [0, 0, 1, 1])
+        day_hotels, _ = selector.select(hotel_lats, hotel_lngs, [25.0, 25.0, 25.1],
+                                        [100.0, 100.0, 100.1], [True] * 3)
+        self.assertEqual(day_hotels, [0, 0, 0])
+
+    def test_plan_route_with_hotels(self):
+        """测试有酒店候选时每天从住宿地点出发"""
+        spots = [{'name': f'景点{i}', 'location': f'{100 + i * 0.01:.4f},25.0000', 'rating': '4.5',
+                  'visit_duration': '约1小时', 'type': '古城'} for i in range(8)]
+        hotels = [{'name': '远处酒店', 'location': '102.0000,27.0000'},
+                  {'name': '附近酒店', 'location': '100.0400,25.0000'},
+                  {'name': '无坐标酒店', 'location': ''}]
+        plans = self.route_module.plan_route(spots, 2, seed=1, hotels=hotels)
+        self.assertEqual([plan['accommodation']['name'] for plan in plans], ['附近酒店', '附近酒店'])
+        
+        # 候选景点很多、先聚类划分每天区域时，同样每天从选定的酒店出发并返回
+        spots = [{'name': f'景点{i}', 'location': f'{100 + i * 0.002:.4f},25.0000', 'rating': '4.5',
+                  'visit_duration': '约1小时', 'type': '古城'} for i in range(80)]
+        self.assertEqual(self.route_module._planning_strategy(self.route_module._build_context(spots), 2),
+                         'partition')
+        plans = self.route_module.plan_route(spots, 2, seed=1, hotels=hotels)
+        self.assertEqual([plan['accommodation']['name'] for plan in plans], ['附近酒店', '附近酒店'])
+        self.assertTrue(all(plan['spots'] for plan in plans))
+
+    def test_replan_only_affected_days(self):
+        """测试增量重新规划只重新优化受影响的天"""
+        import random
+        rng = random.Random(3)
+        spots = [{'name': f'景点{i}', 'location': f'{100 + rng.random():.4f},{25 + rng.random():.4f}',
+                  'rating': f'{rng.uniform(3, 5):.1f}', 'visit_duration': '约1小时', 'type': '古城'}
+                 for i in range(12)]
+        plans = self.route_module.plan_route(spots, 3, seed=7)
+        state = self.route_module.create_plan_state(plans)
+        removed = plans[0]['spots'][0]['name']
+        moved = plans[2]['spots'][0]['name']
+
+        daily_plans, changed = self.route_module.replan(state, [
+            {'type': 'remove', 'spot': removed},
+            {'type': 'pin', 'spot': moved, 'day': 2}
+        ])
+        self.assertEqual(sorted(day['day'] for day in changed), [1, 2, 3])
+        names = [[spot['name'] for spot in day['spots']] for day in daily_plans]
+        self.assertNotIn(removed, sum(names, []))
+        self.assertIn(moved, names[1])
+
+        _, changed = self.route_module.replan(state, [{'type': 'swap', 'days': [1, 3]}])
+        self.assertEqual([day['after'] for day in changed], [names[2], names[0]])
+        with self.assertRaises(ValueError):
+            self.route_module.replan(state, [{'type': 'pin', 'spot': '不存在', 'day': 1}])
+
+        # 编辑列表中有不合法的编辑时，之前的合法编辑也不生效
+        day_orders = [list(order) for order in state.day_orders]
+        unscheduled = list(state.unscheduled)
+        pinned = dict(state.pinned)
+        kept = names[2][0]
+        with self.assertRaises(ValueError):
+            self.route_module.replan(state, [
+                {'type': 'remove', 'spot': kept},
+                {'type': 'swap', 'days': [1, 2]},
+                {'type': 'pin', 'spot': moved, 'day': 9}
+            ])
+        self.assertEqual(state.day_orders, day_orders)
+        self.assertEqual(state.unscheduled, unscheduled)
+        self.assertEqual(state.pinned, pinned)
+        self.assertIn(kept, [spot['name'] for spot in state.daily_plans[0]['spots']])
 
 class TestSeasonalOptimizationModule(unittest.TestCase):
     """测试周期性优化模块"""
@@ -384,6 +820,731 @@ class TestAPIIntegration(unittest.TestCase):
             self.assertIn('name', food)
             self.assertIn('description', food)
 
+class TestHTTPClient(unittest.TestCase):
+    """测试进程级共享HTTP客户端"""
+    
+    def test_shared_client(self):
+        """测试多个APIIntegration实例共享同一客户端"""
+        self.assertIs(APIIntegration().http, APIIntegration().http)
+        self.assertIs(APIIntegration().http, get_http_client())
+    
+    def test_connection_reuse(self):
+        """测试长连接复用，只建立一次连接"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        import threading
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def do_GET(self):
+                body = b'{}'
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            client = get_http_client()
+            url = f'http://127.0.0.1:{server.server_port}/ping'
+            baseline = client.stats.snapshot()
+            for _ in range(3):
+                client.get(url, timeout=5)
+            summary = ConnectionStats.summarize(client.stats.snapshot(), baseline)
+            host_stats = summary['hosts']['127.0.0.1']
+            self.assertEqual(host_stats['requests'], 3)
+            self.assertEqual(host_stats['new_connections'], 1)
+            self.assertEqual(host_stats['reused_connections'], 2)
+        finally:
+            server.shutdown()
+            server.server_close()
+    
+    def test_request_scoped_stats(self):
+        """测试按请求设置的连接统计只包含本请求（及其并发阶段）发出的调用"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        import threading
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def do_GET(self):
+                body = b'{}'
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            client = get_http_client()
+            url = f'http://127.0.0.1:{server.server_port}/ping'
+            scoped = ConnectionStats()
+            token = request_connection_stats.set(scoped)
+            try:
+                # 其他请求在另一个线程中的调用不计入本请求
+                other = threading.Thread(target=lambda: [client.get(url, timeout=5) for _ in range(3)])
+                other.start()
+                client.get(url, timeout=5)
+                # 本请求并发阶段中的调用计入本请求
+                run_stages(get_executor('test_stages', 4), {'stage': (lambda: client.get(url, timeout=5), 5, None)})
+                other.join()
+            finally:
+                request_connection_stats.reset(token)
+            summary = ConnectionStats.summarize(scoped.snapshot())
+            self.assertEqual(summary['hosts']['127.0.0.1']['requests'], 2)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+class TestConcurrency(unittest.TestCase):
+    """测试并发执行工具"""
+    
+    def test_run_stages_concurrently(self):
+        """测试独立阶段并发执行，总耗时接近最慢阶段"""
+        import time
+        executor = get_executor('test_stages', 4)
+        start = time.perf_counter()
+        results, timings = run_stages(executor, {
+            'a': (lambda: time.sleep(0.2) or 'a', 2, None),
+            'b': (lambda: time.sleep(0.2) or 'b', 2, None),
+            'c': (lambda: time.sleep(0.2) or 'c', 2, None)
+        })
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(results, {'a': 'a', 'b': 'b', 'c': 'c'})
+        self.assertEqual(timings['a']['status'], 'ok')
+    
+    def test_run_stages_deadline_and_error(self):
+        """测试阶段超时和异常时返回默认值"""
+        import time
+        executor = get_executor('test_stages', 4)
+        
+        def failing():
+            raise RuntimeError('boom')
+        
+        results, timings = run_stages(executor, {
+            'slow': (lambda: time.sleep(1) or 'late', 0.1, 'default'),
+            'bad': (failing, 1, [])
+        })
+        self.assertEqual(results['slow'], 'default')
+        self.assertEqual(timings['slow']['status'], 'timeout')
+        self.assertEqual(results['bad'], [])
+        self.assertEqual(timings['bad']['status'], 'error')
+
+    def test_discard_executor(self):
+        """测试丢弃损坏的执行器后重新创建"""
+        executor = get_executor('test_discard', 1)
+        discard_executor('test_discard', executor)
+        replacement = get_executor('test_discard', 1)
+        self.assertIsNot(replacement, executor)
+        self.assertEqual(replacement.submit(lambda: 'ok').result(), 'ok')
+
+    def test_single_flight_coalesces_calls(self):
+        """测试相同键的并发调用只执行一次"""
+        import threading
+        group = SingleFlight('test')
+        release = threading.Event()
+        executions = []
+        results = []
+        
+        def upstream():
+            executions.append(1)
+            release.wait(5)
+            return ['spot']
+        
+        threads = [threading.Thread(target=lambda: results.append(group.do('大理市', upstream)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while group.get_stats()['calls'] < 5:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(len(executions), 1)
+        self.assertEqual(results, [['spot']] * 5)
+        self.assertEqual(group.get_stats()['coalesced'], 4)
+
+    def test_single_flight_waiter_timeout(self):
+        """测试等待方超时后抛出TimeoutError，执行方不受影响"""
+        import threading
+        group = SingleFlight('test_timeout', timeout=0.05)
+        release = threading.Event()
+        results = []
+
+        def upstream():
+            release.wait(5)
+            return ['spot']
+
+        leader = threading.Thread(target=lambda: results.append(group.do('大理市', upstream)))
+        leader.start()
+        while group.get_stats()['in_flight'] < 1:
+            pass
+        with self.assertRaises(TimeoutError):
+            group.do('大理市', upstream)
+        release.set()
+        leader.join()
+
+        self.assertEqual(results, [['spot']])
+        self.assertEqual(group.get_stats()['timeouts'], 1)
+
+    def test_shared_spots_are_deep_copies(self):
+        """测试合并调用共享的景点列表以深拷贝返回，修改一个调用方的结果不影响其他调用方"""
+        from modules.api_integration import APIIntegration
+        api = APIIntegration()
+        shared = [{'name': '崇圣寺三塔', 'tags': ['古迹']}]
+        api._fetch_scenic_spots = lambda city_name: shared
+
+        first = api.get_scenic_spots('测试城市')
+        first[0]['tags'].append('已修改')
+        second = api.get_scenic_spots('测试城市')
+
+        self.assertEqual(second[0]['tags'], ['古迹'])
+        self.assertEqual(shared[0]['tags'], ['古迹'])
+
+class TestAsyncAPIIntegration(unittest.TestCase):
+    """测试异步API集成模块"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        import asyncio
+        self.api_module = AsyncAPIIntegration()
+        self.api_module.aliyun_appcode = 'test_appcode'
+        self.api_module.amap_api_key = 'test_key'
+        self.asyncio = asyncio
+    
+    def test_weather_fallback_to_amap(self):
+        """测试阿里云天气失败时回退到高德天气"""
+        requested_urls = []
+        
+        async def fake_request_json(method, url, **kwargs):
+            requested_urls.append(url)
+            if url == self.api_module.aliyun_weather_url:
+                raise RuntimeError('aliyun unavailable')
+            if url.endswith('/geocode/geo'):
+                return {'geocodes': [{'adcode': '532901'}]}
+            return {'status': '1', 'city': kwargs['params']['city']}
+        
+        self.api_module._request_json = fake_request_json
+        weather = self.asyncio.run(self.api_module.get_weather('大理市'))
+        
+        self.assertEqual(weather.get('city'), '532901')
+        self.assertEqual(requested_urls[0], self.api_module.aliyun_weather_url)
+        # 已知城市的城市代码来自内置代码表，不发起地理编码请求
+        self.assertFalse(any(url.endswith('/geocode/geo') for url in requested_urls))
+    
+    def test_cancellation_propagates(self):
+        """测试任务取消不会被备选逻辑吞掉"""
+        async def slow_request_json(method, url, **kwargs):
+            await self.asyncio.sleep(10)
+        
+        self.api_module._request_json = slow_request_json
+        
+        async def run():
+            task = self.asyncio.ensure_future(self.api_module.get_weather('大理市'))
+            await self.asyncio.sleep(0.01)
+            task.cancel()
+            await task
+        
+        with self.assertRaises(self.asyncio.CancelledError):
+            self.asyncio.run(run())
+    
+    def test_sessions_not_leaked_across_loops(self):
+        """测试事件循环关闭后共享会话被移除，async with持有的会话在退出时关闭"""
+        from modules import async_api_integration
+        
+        async def shared_session():
+            return async_api_integration._get_session()
+        
+        for _ in range(3):
+            self.asyncio.run(shared_session())
+        self.assertEqual(len(async_api_integration._sessions), 1)
+        
+        async def owned_session():
+            async with AsyncAPIIntegration() as api:
+                session = api._session
+                self.assertIsNotNone(session)
+            # 上一个事件循环的共享会话在获取当前循环的会话时被移除
+            async_api_integration._get_session()
+            shared_count = len(async_api_integration._sessions)
+            await async_api_integration.close_sessions()
+            return session, shared_count
+        
+        session, shared_count = self.asyncio.run(owned_session())
+        self.assertTrue(session.closed)
+        self.assertEqual(shared_count, 1)
+
+    def test_public_methods_are_coroutines(self):
+        """测试同步版本的每个公开方法在异步版本中都有协程实现，酒店搜索不再调用同步逻辑"""
+        import inspect
+        import tempfile
+        from modules.api_integration import APIIntegration
+        from modules.response_cache import ResponseCache
+
+        for name, member in inspect.getmembers(APIIntegration, inspect.isfunction):
+            if not name.startswith('_') and name != 'parse_llm_json':
+                self.assertTrue(inspect.iscoroutinefunction(getattr(AsyncAPIIntegration, name)), name)
+
+        async def fake_request_json(method, url, **kwargs):
+            return {'pois': [{'name': '测试酒店', 'address': '古城', 'location': '100.1,25.6'}]}
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.api_module.hotel_cache = ResponseCache(cache_dir)
+            self.api_module._request_json = fake_request_json
+            hotels = self.asyncio.run(self.api_module.search_hotels('大理市'))
+            self.assertEqual(hotels[0]['name'], '测试酒店')
+            # 第二次调用命中缓存
+            self.api_module._request_json = None
+            self.assertEqual(self.asyncio.run(self.api_module.search_hotels('大理市')), hotels)
+
+class TestResponseCache(unittest.TestCase):
+    """测试持久化响应缓存"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        import tempfile
+        self.temp_dir = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def test_ttl_and_counters(self):
+        """测试过期时间和命中计数"""
+        cache = ResponseCache(self.temp_dir.name)
+        cache.set('a', {'value': 1}, ttl=60)
+        cache.set('b', {'value': 2}, ttl=-1)
+        
+        self.assertEqual(cache.get('a'), {'value': 1})
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNone(cache.get('c'))
+        
+        stats = cache.get_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['expired'], 1)
+    
+    def test_lru_eviction_under_byte_budget(self):
+        """测试超过字节预算时淘汰最久未访问的条目"""
+        import time
+        cache = ResponseCache(self.temp_dir.name, max_bytes=250)
+        cache.set('first', 'x' * 60, ttl=60)
+        time.sleep(0.01)
+        cache.set('second', 'y' * 60, ttl=60)
+        time.sleep(0.01)
+        cache.get('first')
+        time.sleep(0.01)
+        cache.set('third', 'z' * 60, ttl=60)
+        
+        self.assertIsNotNone(cache.get('first'))
+        self.assertIsNone(cache.get('second'))
+        self.assertIsNotNone(cache.get('third'))
+        self.assertLessEqual(cache.get_stats()['bytes'], 250)
+    
+    def test_llm_cache_shared_by_city_alias(self):
+        """测试"大理"和"大理市"共用同一条LLM缓存"""
+        calls = []
+        
+        class FakeResponse:
+            def raise_for_status(self):
+                pass
+            
+            def json(self):
+                return {'choices': [{'message': {'content': '{"climate": "温和"}'}}]}
+        
+        class FakeHTTP:
+            def post(self, url, **kwargs):
+                calls.append(url)
+                return FakeResponse()
+        
+        api = APIIntegration()
+        api.deepseek_api_key = 'test_key'
+        api.http = FakeHTTP()
+        api.llm_cache = ResponseCache(self.temp_dir.name)
+        
+        self.assertEqual(api.get_city_info('大理'), {'climate': '温和'})
+        self.assertEqual(api.get_city_info('大理市'), {'climate': '温和'})
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(api.llm_cache.get_stats()['hits'], 1)
+    
+    def test_llm_cache_skips_unparseable_content(self):
+        """测试无法解析为JSON的LLM响应不写入缓存"""
+        contents = ['抱歉，我无法提供该信息', '{"climate": "温和"}']
+        calls = []
+        
+        class FakeResponse:
+            def raise_for_status(self):
+                pass
+            
+            def json(self):
+                return {'choices': [{'message': {'content': contents[len(calls) - 1]}}]}
+        
+        class FakeHTTP:
+            def post(self, url, **kwargs):
+                calls.append(url)
+                return FakeResponse()
+        
+        api = APIIntegration()
+        api.deepseek_api_key = 'test_key'
+        api.http = FakeHTTP()
+        api.llm_cache = ResponseCache(self.temp_dir.name)
+        
+        self.assertEqual(api.get_city_info('大理'), {})
+        self.assertEqual(api.get_city_info('大理'), {'climate': '温和'})
+        self.assertEqual(api.get_city_info('大理'), {'climate': '温和'})
+        self.assertEqual(len(calls), 2)
+
+class TestGeocodeCache(unittest.TestCase):
+    """测试地理编码缓存和内置城市代码表"""
+    
+    def test_lookup_adcode(self):
+        """测试城市代码表查找"""
+        self.assertEqual(lookup_adcode('大理'), '532901')
+        self.assertEqual(lookup_adcode('杭州市'), '330100')
+        self.assertEqual(lookup_adcode('阿坝州'), '513200')
+        self.assertEqual(lookup_adcode('西双版纳'), '532800')
+        # 以"州"结尾的城市简称
+        short_names = {'福州': '350100', '郑州': '410100', '兰州': '620100', '徐州': '320300',
+                       '温州': '330300', '泉州': '350500', '常州': '320400', '扬州': '321000',
+                       '台州': '331000', '柳州': '450200', '赣州': '360700', '锦州': '210700',
+                       '湖州': '330500', '荆州': '421000'}
+        for name, adcode in short_names.items():
+            self.assertEqual(lookup_adcode(name), adcode, name)
+        self.assertIsNone(lookup_adcode('不存在的城市'))
+    
+    def test_geocode_cached_by_normalized_address(self):
+        """测试地理编码结果按规范化地址缓存"""
+        import tempfile
+        calls = []
+        
+        class FakeResponse:
+            def raise_for_status(self):
+                pass
+            
+            def json(self):
+                return {'status': '1', 'geocodes': [{'location': '100.2,25.6', 'adcode': '532901'}]}
+        
+        class FakeHTTP:
+            def get(self, url, **kwargs):
+                calls.append(url)
+                return FakeResponse()
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            api = APIIntegration()
+            api.amap_api_key = 'test_key'
+            api.http = FakeHTTP()
+            api.geocode_cache = ResponseCache(temp_dir)
+            
+            first = api.get_amap_geocode('大理市 大理古城')
+            second = api.get_amap_geocode('大理市大理古城')
+            
+            self.assertEqual(first, second)
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(api._get_city_code('大理市'), '532901')
+            self.assertEqual(len(calls), 1)
+
+class TestSpotStore(unittest.TestCase):
+    """测试SQLite景点存储"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        import tempfile
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = SpotStore(os.path.join(self.temp_dir.name, 'spots.db'))
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def test_replace_and_query(self):
+        """测试按城市读取、整体替换和跨城市查询"""
+        self.assertIsNone(self.store.get_city_spots('大理市'))
+        
+        self.store.replace_city_spots('大理市', [{'name': '崇圣寺三塔'}, {'name': '洱海', 'description': '高原湖泊'}])
+        self.store.replace_city_spots('杭州市', [{'name': '西湖', 'description': '湖泊'}])
+        self.assertEqual([s['name'] for s in self.store.get_city_spots('大理市')], ['崇圣寺三塔', '洱海'])
+        
+        self.store.replace_city_spots('大理市', [{'name': '苍山'}])
+        self.assertEqual(self.store.get_city_spots('大理市'), [{'name': '苍山'}])
+        self.assertEqual(self.store.get_city_meta('大理市')['version'], 2)
+        
+        self.assertEqual([s['name'] for s in self.store.search('湖')], ['西湖'])
+        self.assertTrue(self.store.delete_city('杭州市'))
+        self.assertEqual(self.store.search('湖'), [])
+    
+    def test_inverted_index_ranking(self):
+        """测试倒排索引排序和增量更新"""
+        self.store.replace_city_spots('杭州市', [
+            {'name': '西湖', 'description': '湖泊', 'address': []},
+            {'name': '西溪湿地', 'description': '靠近西湖的湿地公园'},
+            {'name': '灵隐寺', 'address': '西湖区法云弄'}
+        ])
+        self.store.replace_city_spots('北京市', [{'name': '北海公园', 'description': '皇家园林'}])
+        
+        self.assertEqual([s['name'] for s in self.store.search('西湖', limit=2)], ['西湖', '西溪湿地'])
+        self.assertEqual([s['name'] for s in self.store.search('公园', city='北京市')], ['北海公园'])
+        self.assertEqual(self.store.search('公园', city='上海市'), [])
+        
+        # 城市刷新后旧词项随之替换
+        self.store.replace_city_spots('杭州市', [{'name': '千岛湖'}])
+        self.assertEqual([s['name'] for s in self.store.search('西湖')], [])
+        self.assertEqual([s['name'] for s in self.store.search('湖')], ['千岛湖'])
+    
+    @unittest.skipIf(spot_tokenizer.lazy_pinyin is None, '未安装pypinyin')
+    def test_pinyin_search(self):
+        """测试拼音检索"""
+        self.store.replace_city_spots('杭州市', [{'name': '西湖风景区'}, {'name': '灵隐寺'}])
+        self.assertEqual([s['name'] for s in self.store.search('xihu')], ['西湖风景区'])
+        self.assertEqual([s['name'] for s in self.store.search('LYS')], ['灵隐寺'])
+    
+    def test_migrate_from_json_dir(self):
+        """测试导入旧版JSON缓存文件"""
+        legacy_dir = os.path.join(self.temp_dir.name, 'scenic_spots')
+        os.makedirs(legacy_dir)
+        with open(os.path.join(legacy_dir, '大理市_spots.json'), 'w', encoding='utf-8') as f:
+            json.dump([{'name': '洱海'}], f, ensure_ascii=False, indent=2)
+        
+        self.assertEqual(self.store.migrate_from_json_dir(legacy_dir), 1)
+        self.assertEqual(self.store.get_city_spots('大理市'), [{'name': '洱海'}])
+        self.assertFalse(os.path.exists(os.path.join(legacy_dir, '大理市_spots.json')))
+        self.assertEqual(self.store.migrate_from_json_dir(legacy_dir), 0)
+    
+    def test_memory_cache_validated_by_version(self):
+        """测试内存LRU层按版本号校验并按条目数淘汰"""
+        cache = SpotMemoryCache(max_entries=2)
+        cache.put('大理市', 1, [{'name': '洱海'}])
+        cache.put('杭州市', 1, [{'name': '西湖'}])
+        
+        spots = cache.get('大理市', 1)
+        spots[0]['name'] = '已修改'
+        self.assertEqual(cache.get('大理市', 1), [{'name': '洱海'}])
+        self.assertIsNone(cache.get('大理市', 2))
+        
+        cache.put('北京市', 1, [{'name': '故宫'}])
+        self.assertIsNone(cache.get('杭州市', 1))
+        
+        stats = cache.get_stats()
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['cities']['大理市'], {'hits': 2, 'misses': 1})
+
+class TestCacheWarmer(unittest.TestCase):
+    """测试缓存预热"""
+    
+    def test_token_bucket_rate(self):
+        """测试令牌桶限速"""
+        import time
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        self.assertFalse(bucket.acquire(tokens=1, timeout=0))
+    
+    def test_resume_after_failure(self):
+        """测试进度文件记录已完成城市，重新运行时只重试失败的城市"""
+        import tempfile
+        warmed = []
+        
+        class FakeSpots:
+            def get_city_spots(self, city_name):
+                warmed.append(city_name)
+                return [] if city_name == '失败市' else [{'name': '景点'}]
+        
+        class FakeAPI:
+            def get_city_info(self, city_name):
+                return {'climate': '温和'}
+            
+            def get_amap_geocode(self, address):
+                return {'geocodes': [{'location': '100.2,25.6'}]}
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            progress_file = os.path.join(temp_dir, 'progress.json')
+            warmer = CacheWarmer(FakeSpots(), FakeAPI(), progress_file=progress_file, max_workers=2, rate=1000)
+            
+            report = warmer.run(['大理市', '失败市', '大理市'])
+            self.assertEqual((report['total'], report['completed'], report['failed']), (2, 1, 1))
+            self.assertIn('spots', report['cities']['失败市']['errors'])
+            self.assertIn('geocode', report['cities']['大理市']['timings_ms'])
+            
+            warmed.clear()
+            report = warmer.run(['大理市', '失败市'])
+            self.assertEqual(report['skipped'], 1)
+            self.assertEqual(warmed, ['失败市'])
+            self.assertIsNone(get_http_client().rate_limiter)
+            # 仍有失败城市时保留进度文件
+            self.assertTrue(os.path.exists(progress_file))
+    
+    def test_stale_progress_ignored(self):
+        """测试超过有效期的进度记录不会跳过城市，全部城市成功后删除进度文件"""
+        import json
+        import tempfile
+        import time
+        warmed = []
+        
+        class FakeSpots:
+            def get_city_spots(self, city_name):
+                warmed.append(city_name)
+                return [{'name': '景点'}]
+        
+        class FakeAPI:
+            def get_city_info(self, city_name):
+                return {'climate': '温和'}
+            
+            def get_amap_geocode(self, address):
+                return {'geocodes': [{'location': '100.2,25.6'}]}
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            progress_file = os.path.join(temp_dir, 'progress.json')
+            with open(progress_file, 'w', encoding='utf-8') as f:
+                json.dump({'大理市': {'status': 'done', 'finished_at': time.time() - 7200},
+                           '丽江市': {'status': 'done', 'finished_at': time.time()}}, f)
+            warmer = CacheWarmer(FakeSpots(), FakeAPI(), progress_file=progress_file, rate=1000,
+                                 progress_ttl=3600)
+            
+            report = warmer.run(['大理市', '丽江市'])
+            self.assertEqual(report['skipped'], 1)
+            self.assertEqual(warmed, ['大理市'])
+            self.assertFalse(os.path.exists(progress_file))
+
+class TestTravelTimeCache(unittest.TestCase):
+    """测试交通时间缓存"""
+    
+    def test_cache_fill_and_calibrated_fallback(self):
+        """测试补全后读取缓存，未命中时按校准的绕行系数估算"""
+        import tempfile
+        from modules.travel_time_cache import TravelTimeCache, point_key
+        
+        class FakeAPI:
+            amap_api_key = 'test'
+            
+            def get_amap_route(self, origin, destination, mode='driving'):
+                # 实际路线为直线距离的1.5倍，耗时10分钟
+                o_lng, o_lat = map(float, origin.split(','))
+                d_lng, d_lat = map(float, destination.split(','))
+                straight = haversine_m(o_lat, o_lng, d_lat, d_lng)
+                return {'route': {'paths': [{'duration': '600', 'distance': str(straight * 1.5)}]}}
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = TravelTimeCache(os.path.join(temp_dir, 'travel.db'), api=FakeAPI(), fill_on_miss=False,
+                                    min_calibration_samples=2)
+            lats, lngs = [25.60, 25.61, 25.62], [100.20, 100.21, 100.22]
+            keys = [point_key(lat, lng) for lat, lng in zip(lats, lngs)]
+            bucket = cache.bucket_of(cache._current_minute())
+            self.assertEqual(cache.fill([(keys[0], keys[1]), (keys[1], keys[2])], 'driving'), 2)
+            
+            minutes = cache.travel_matrix(lats, lngs, 'driving', [bucket])[0]
+            self.assertAlmostEqual(minutes[0, 1], 10.0)
+            self.assertAlmostEqual(minutes[1, 2], 10.0)
+            self.assertAlmostEqual(cache.detour_factor('driving'), 1.5, places=3)
+            # 未缓存的点对按直线距离 × 1.5 ÷ 校准速度估算
+            self.assertGreater(minutes[0, 2], 10.0)
+            self.assertEqual(minutes[0, 0], 0.0)
+            
+            # 调度器从缓存读取移动时间
+            scheduler = TimeWindowScheduler(transfer_overhead_minutes=0, travel_times=cache)
+            scheduler.day_start_minute = scheduler.day_end_minute = cache._current_minute()
+            scheduler.day_end_minute += 1
+            travel = scheduler._travel_matrix(DistanceMatrix(lats, lngs), [0, 1])
+            self.assertAlmostEqual(travel[0][0, 1], 10.0)
+    
+    def test_fill_on_miss_off_by_default_and_rate_limited(self):
+        """测试未命中后台补全默认关闭，开启后补全请求按令牌桶限速"""
+        import tempfile
+        import time
+        from unittest import mock
+        from modules.travel_time_cache import TravelTimeCache
+        
+        class FakeAPI:
+            amap_api_key = 'test'
+            
+            def get_amap_route(self, origin, destination, mode='driving'):
+                return {'route': {'paths': [{'duration': '600', 'distance': '3000'}]}}
+        
+        lats, lngs = [25.60, 25.61, 25.62], [100.20, 100.21, 100.22]
+        with tempfile.TemporaryDirectory() as temp_dir, mock.patch.dict(os.environ):
+            os.environ.pop('TRAVEL_TIME_FILL_ON_MISS', None)
+            cache = TravelTimeCache(os.path.join(temp_dir, 'default.db'), api=FakeAPI())
+            self.assertFalse(cache.fill_on_miss)
+            cache.travel_matrix(lats, lngs, 'driving', [0])
+            self.assertEqual(cache._pending, {})
+            
+            cache = TravelTimeCache(os.path.join(temp_dir, 'fill.db'), api=FakeAPI(), fill_on_miss=True,
+                                    fill_rate=1000)
+            cache.travel_matrix(lats, lngs, 'driving', [0])
+            deadline = time.time() + 5
+            while cache.stats['fetched'] < 6 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(cache.stats['fetched'], 6)
+            self.assertEqual(cache.fill_limiter.get_stats()['acquired'], 6)
+
+class TestSpatialIndex(unittest.TestCase):
+    """测试空间索引"""
+    
+    def setUp(self):
+        """设置测试环境"""
+        import random
+        rng = random.Random(7)
+        self.points = [(25.0 + rng.random(), 100.0 + rng.random(), {'name': f'景点{i}'}) for i in range(300)]
+        self.index = SpatialIndex.from_points(self.points, cell_size=0.05)
+    
+    def test_radius_and_nearest_match_brute_force(self):
+        """测试半径查询和K近邻查询与逐点计算结果一致"""
+        lat, lng = 25.5, 100.5
+        distances = sorted((haversine_m(lat, lng, p_lat, p_lng), key) for key, (p_lat, p_lng, _) in enumerate(self.points))
+        
+        within = [key for distance, key in distances if distance <= 10000]
+        self.assertEqual([key for _, key, _ in self.index.radius_query(lat, lng, 10000)], within)
+        self.assertEqual([key for _, key, _ in self.index.nearest(lat, lng, k=5)], [key for _, key in distances[:5]])
+        
+        # 查询点远离所有数据时仍能找到最近点
+        self.assertEqual(self.index.nearest(40.0, 116.0, k=1)[0][1], min(
+            range(len(self.points)), key=lambda key: haversine_m(40.0, 116.0, *self.points[key][:2])))
+    
+    def test_group_replace_and_remove(self):
+        """测试按分组替换和按键删除"""
+        index = SpatialIndex()
+        index.replace_group('大理市', [(25.6, 100.2, {'name': '洱海'}), (25.7, 100.1, {'name': '苍山'})])
+        index.replace_group('大理市', [(25.6, 100.2, {'name': '崇圣寺'})])
+        self.assertEqual(len(index), 1)
+        
+        _, key, spot = index.nearest(25.6, 100.2)[0]
+        self.assertEqual(spot['name'], '崇圣寺')
+        self.assertTrue(index.remove(key))
+        self.assertEqual(index.nearest(25.6, 100.2), [])
+    
+    def test_nearby_spots_prefer_local_index(self):
+        """测试本地覆盖充足时不调用周边搜索API"""
+        import tempfile
+        
+        class FailingHTTP:
+            def get(self, url, **kwargs):
+                raise AssertionError('不应调用周边搜索API')
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            module = ScenicSpotModule()
+            module.store = SpotStore(os.path.join(temp_dir, 'spots.db'))
+            module.memory_cache = SpotMemoryCache()
+            module.api.http = FailingHTTP()
+            module.store.replace_city_spots('大理市', [
+                {'name': f'景点{i}', 'location': f'{100.2 + i * 0.001},25.6'} for i in range(6)
+            ])
+            
+            spots = module.get_nearby_spots(25.6, 100.2, radius=2000, limit=5)
+            self.assertEqual([spot['name'] for spot in spots], [f'景点{i}' for i in range(5)])
+            self.assertEqual(spots[0]['distance'], 0)
+            
+            module.store.delete_city('大理市')
+            self.assertEqual(module.find_nearby_local(25.6, 100.2), [])
+
 class TestIntegration(unittest.TestCase):
     """测试系统集成功能"""
     